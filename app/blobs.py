@@ -0,0 +1,88 @@
+import hashlib
+from .database import get_db_connection, fetch_one
+
+# Content hashes are a SHA-256 tree: the SHA-256 of the concatenated SHA-256
+# digests of each CONTENT_HASH_CHUNK_SIZE chunk. Resumable uploads whose parts
+# are this size hash each part as it arrives and combine the digests at
+# completion, and get the same value as a one-shot upload. The size is part of
+# every stored hash, so it is fixed rather than configurable: changing it
+# would stop new uploads matching any blob already stored.
+CONTENT_HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def combine_digests(digests: list) -> str:
+    return hashlib.sha256(b"".join(digests)).hexdigest()
+
+
+def hash_stream(file_obj) -> str:
+    """Hashes a file object chunk by chunk, then rewinds it for storage."""
+    digests = []
+    while True:
+        chunk = file_obj.read(CONTENT_HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digests.append(hashlib.sha256(chunk).digest())
+    file_obj.seek(0)
+    return combine_digests(digests or [hashlib.sha256(b"").digest()])
+
+
+def claim_blob(content_hash: str) -> str:
+    """
+    Takes a reference on an already-stored blob. Returns its stored filename,
+    or None if this content hasn't been stored yet. The reference is held
+    before the caller relies on the file, so a concurrent delete can't remove it.
+    """
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "UPDATE blobs SET ref_count = ref_count + 1 WHERE content_hash = ? RETURNING filename",
+            (content_hash,)
+        ).fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    return row["filename"] if row else None
+
+
+def add_blob_reference(conn, content_hash: str, filename: str, file_size: int, mime_type: str) -> str:
+    """
+    Records a newly stored upload as a blob, in the caller's transaction. If
+    another upload of the same content won the race, its reference count is
+    bumped instead and its filename returned; the caller's copy is then redundant.
+    """
+    return conn.execute(
+        """INSERT INTO blobs (content_hash, filename, file_size, mime_type, ref_count)
+           VALUES (?, ?, ?, ?, 1)
+           ON CONFLICT(content_hash) DO UPDATE SET ref_count = ref_count + 1
+           RETURNING filename""",
+        (content_hash, filename, file_size, mime_type)
+    ).fetchone()["filename"]
+
+
+def release_blob(conn, content_hash: str) -> bool:
+    """Drops one reference in the caller's transaction. Returns True if it was the last one."""
+    row = conn.execute(
+        "UPDATE blobs SET ref_count = ref_count - 1 WHERE content_hash = ? RETURNING ref_count",
+        (content_hash,)
+    ).fetchone()
+    if row and row["ref_count"] <= 0:
+        conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+        return True
+    return False
+
+
+def cached_transcript(video_id: int) -> str:
+    """The machine transcript of another upload with the same content, if there is one."""
+    row = fetch_one(
+        """SELECT b.transcript FROM videos v JOIN blobs b ON b.content_hash = v.content_hash
+           WHERE v.id = ? AND b.transcript IS NOT NULL""",
+        (video_id,)
+    )
+    return row["transcript"] if row else None
+
+
+def cache_transcript(conn, video_id: int, transcript: str):
+    conn.execute(
+        "UPDATE blobs SET transcript = ? WHERE content_hash = (SELECT content_hash FROM videos WHERE id = ?)",
+        (transcript, video_id)
+    )
@@ -1,19 +1,149 @@
 #!/usr/bin/env python
+import asyncio
+import queue
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from decouple import config
 
 DATABASE_URL = config("DATABASE_URL", default="sqlite:///./app.db")
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=8, cast=int)
+DB_MMAP_SIZE = config("DB_MMAP_SIZE", default=256 * 1024 * 1024, cast=int)
+DB_CACHE_SIZE_KB = config("DB_CACHE_SIZE_KB", default=16 * 1024, cast=int)
+# Job workers run in separate processes, so wait on locks instead of failing fast
+DB_BUSY_TIMEOUT = 30
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_URL.replace("sqlite:///", ""))
-    conn.execute("PRAGMA foreign_keys = ON")
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+# Async routes run their queries here rather than on the event loop. One
+# thread per pooled connection, so a query never waits for a connection.
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+class PooledConnection(sqlite3.Connection):
+    """A connection whose close() hands it back to the pool instead of closing it."""
+
+    in_pool = False
+
+    def close(self):
+        if self.in_pool:
+            return
+        if self.in_transaction:
+            self.rollback()
+        self.in_pool = True
+        try:
+            _pool.put_nowait(self)
+        except queue.Full:
+            self.in_pool = False
+            super().close()
+
+    def discard(self):
+        sqlite3.Connection.close(self)
+
+def _connect() -> PooledConnection:
+    conn = sqlite3.connect(
+        DATABASE_URL.replace("sqlite:///", ""),
+        timeout=DB_BUSY_TIMEOUT,
+        factory=PooledConnection,
+        # Pooled connections are handed from thread to thread, never shared at once
+        check_same_thread=False,
+    )
     conn.row_factory = sqlite3.Row
+    # WAL lets readers proceed while a note or job update is being written
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
     return conn
 
-def create_tables():
+def get_db_connection():
+    """Takes a connection from the pool, opening a new one if it is empty. close() returns it."""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+    conn.in_pool = False
+    return conn
+
+def init_db_pool():
+    """Opens the pool's connections up front so requests don't pay the connect cost."""
+    while not _pool.full():
+        _connect().close()
+
+def close_db_pool():
+    while True:
+        try:
+            _pool.get_nowait().discard()
+        except queue.Empty:
+            break
+
+async def run_db(func, *args, **kwargs):
+    """Runs a blocking database function on the database executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+def fetch_one(sql: str, params: tuple = ()):
     conn = get_db_connection()
+    try:
+        return conn.execute(sql, params).fetchone()
+    finally:
+        conn.close()
+
+def fetch_all(sql: str, params: tuple = ()) -> list:
+    conn = get_db_connection()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+def execute(sql: str, params: tuple = ()) -> int:
+    """Runs one write statement in its own transaction. Returns the affected row count."""
+    conn = get_db_connection()
+    try:
+        rowcount = conn.execute(sql, params).rowcount
+        conn.commit()
+        return rowcount
+    finally:
+        conn.close()
+
+def create_tables():
+    """
+    Brings the schema up to date. Migrations newer than the database's
+    PRAGMA user_version are applied in order, each in its own transaction,
+    so running this on every startup is cheap and safe.
+    """
+    conn = _connect()
+    # Transactions are managed explicitly so DDL and the version bump commit together
+    conn.isolation_level = None
     cursor = conn.cursor()
+    try:
+        for version, migration in MIGRATIONS:
+            # IMMEDIATE takes the write lock before the version is read, so two
+            # processes starting at once can't apply the same migration twice
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                if cursor.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    cursor.execute("COMMIT")
+                    continue
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            summary = " ".join(migration.__doc__.split()).split(". ")[0]
+            print(f"Applied migration {version}: {summary}")
+    finally:
+        conn.discard()
 
+def schema_version() -> int:
+    return fetch_one("PRAGMA user_version")[0]
+
+def _migration_baseline(cursor):
+    """
+    Baseline schema. Databases created before versioned migrations may be
+    missing some of it, so every statement here is idempotent.
+    """
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS videos (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,6 +159,16 @@ def create_tables():
     );
     """)
 
+    # Columns added after the initial schema, applied to existing databases too
+    _add_missing_columns(cursor, "videos", [
+        ("processing_path", "TEXT"),
+        ("processing_reason", "TEXT"),
+        ("duration_seconds", "REAL"),
+        ("processing_status", "TEXT"),
+        ("audio_filename", "TEXT"),
+        ("audio_url", "TEXT"),
+    ])
+
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS prompts (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -53,8 +193,320 @@ def create_tables():
     );
     """)
 
-    conn.commit()
-    conn.close()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        queue TEXT NOT NULL,
+        task TEXT NOT NULL,
+        args TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        last_error TEXT,
+        run_after REAL NOT NULL DEFAULT 0,
+        worker_pid INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue_status ON jobs (queue, status, run_after)")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS upload_sessions (
+        id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        original_filename TEXT NOT NULL,
+        mime_type TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        part_size INTEGER NOT NULL,
+        r2_upload_id TEXT,
+        status TEXT NOT NULL DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS upload_parts (
+        session_id TEXT NOT NULL,
+        part_number INTEGER NOT NULL,
+        etag TEXT,
+        size INTEGER NOT NULL,
+        PRIMARY KEY (session_id, part_number),
+        FOREIGN KEY (session_id) REFERENCES upload_sessions (id) ON DELETE CASCADE
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS prosody (
+        video_id INTEGER PRIMARY KEY,
+        frame_ms INTEGER NOT NULL,
+        frame_count INTEGER NOT NULL,
+        peaks BLOB NOT NULL,
+        loudness BLOB NOT NULL,
+        pitch BLOB NOT NULL,
+        pauses TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
+    );
+    """)
+
+    # Inverted index over transcripts: one row per word occurrence, keyed by
+    # term first so lookups and cross-video counts are index range scans.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS transcript_terms (
+        term TEXT NOT NULL,
+        video_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        PRIMARY KEY (term, video_id, position),
+        FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    """)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transcript_terms_video ON transcript_terms (video_id)")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS transcript_stats (
+        video_id INTEGER PRIMARY KEY,
+        word_count INTEGER NOT NULL,
+        words_per_minute REAL,
+        filler_count INTEGER NOT NULL,
+        filler_counts TEXT NOT NULL,
+        repeated_phrases TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
+    );
+    """)
+
+    _create_search_index(cursor)
+
+def _migration_hot_query_indexes(cursor):
+    """
+    Indexes for the index page sort and the analysis pages' prompt lookup.
+    notes(video_id) is already covered by the UNIQUE(video_id, prompt_id) index.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_created_at ON videos (created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_prompts_view_type_order ON prompts (view_type, order_index)")
+
+def _migration_cache_versions(cursor):
+    """
+    Version counters for in-process caches. Writers bump a counter in the
+    same transaction as their edit so every process can tell its cache is stale.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+    """)
+    cursor.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('prompts', 1)")
+
+def _migration_content_addressed_blobs(cursor):
+    """
+    Content-addressed storage. Uploads with the same content hash share one
+    stored object, its processed artifacts and its machine transcript.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS blobs (
+        content_hash TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        mime_type TEXT NOT NULL,
+        ref_count INTEGER NOT NULL DEFAULT 0,
+        transcript TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    cursor.execute("ALTER TABLE videos ADD COLUMN content_hash TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_content_hash ON videos (content_hash)")
+    cursor.execute("ALTER TABLE upload_parts ADD COLUMN sha256 BLOB")
+
+def _migration_transcription_webhooks(cursor):
+    """
+    Submitted transcriptions. The backend's transcript id lets the webhook
+    and the reconciliation sweep match a result to its video.
+    """
+    cursor.execute("ALTER TABLE videos ADD COLUMN transcript_id TEXT")
+    cursor.execute("ALTER TABLE videos ADD COLUMN transcription_submitted_at TIMESTAMP")
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_videos_transcription_in_progress
+    ON videos (transcription_submitted_at) WHERE transcription_status = 'in_progress'
+    """)
+
+def _migration_video_events(cursor):
+    """
+    Status and progress events published by workers for the events stream.
+    AUTOINCREMENT keeps ids increasing after old events are pruned, since
+    readers resume from the last id they saw.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS video_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        video_id INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    """)
+
+def _migration_transcript_words(cursor):
+    """
+    Word-level timings of machine transcripts, one row per video. starts and
+    ends are int32 LE milliseconds; token_ids are uint32 LE indexes into the
+    JSON list of the video's distinct tokens.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS transcript_words (
+        video_id INTEGER PRIMARY KEY,
+        word_count INTEGER NOT NULL,
+        starts BLOB NOT NULL,
+        ends BLOB NOT NULL,
+        token_ids BLOB NOT NULL,
+        tokens TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
+    );
+    """)
+
+def _migration_deletion_tombstones(cursor):
+    """
+    Deletion tombstones and pending storage deletions. A deleted video keeps
+    its row, hidden by deleted_at, until the sweeper has queued its files in
+    storage_deletions. Files stay queued there until they are actually gone.
+    """
+    cursor.execute("ALTER TABLE videos ADD COLUMN deleted_at TIMESTAMP")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_deleted_at ON videos (deleted_at) WHERE deleted_at IS NOT NULL")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS storage_deletions (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        path TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (kind, path)
+    );
+    """)
+
+def _migration_reports(cursor):
+    """
+    Stored coaching reports, one row per video: its notes grouped by section
+    in prompt order (JSON), ready to render. revision and prompts_version
+    form the report's ETag.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS reports (
+        video_id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        sections TEXT NOT NULL,
+        revision INTEGER NOT NULL,
+        prompts_version INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
+    );
+    """)
+
+def _migration_note_versions(cursor):
+    """
+    Note versions for conflict detection. Every write increments
+    notes.version, so a batch save can reject an edit made against an older
+    version, such as one from another tab.
+    """
+    cursor.execute("ALTER TABLE notes ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+def _migration_upload_session_activity(cursor):
+    """
+    Time of each upload session's last part, so sessions abandoned mid-upload
+    can be expired and their stored parts discarded.
+    """
+    cursor.execute("ALTER TABLE upload_sessions ADD COLUMN last_part_at TIMESTAMP")
+
+def _add_missing_columns(cursor, table: str, columns: list):
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def _create_search_index(cursor):
+    """
+    FTS5 indexes over videos and notes. They are external-content tables, so
+    the text is stored once in the base tables and triggers keep the index in
+    sync. Indexes created on an existing database are built from its rows.
+    """
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+        original_filename, transcript,
+        content='videos', content_rowid='id', tokenize='porter unicode61'
+    );
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS videos_fts_insert AFTER INSERT ON videos BEGIN
+        INSERT INTO videos_fts (rowid, original_filename, transcript)
+        VALUES (new.id, new.original_filename, new.transcript);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS videos_fts_delete AFTER DELETE ON videos BEGIN
+        INSERT INTO videos_fts (videos_fts, rowid, original_filename, transcript)
+        VALUES ('delete', old.id, old.original_filename, old.transcript);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS videos_fts_update AFTER UPDATE OF original_filename, transcript ON videos BEGIN
+        INSERT INTO videos_fts (videos_fts, rowid, original_filename, transcript)
+        VALUES ('delete', old.id, old.original_filename, old.transcript);
+        INSERT INTO videos_fts (rowid, original_filename, transcript)
+        VALUES (new.id, new.original_filename, new.transcript);
+    END;
+    """)
+
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        content,
+        content='notes', content_rowid='id', tokenize='porter unicode61'
+    );
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts (notes_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF content ON notes BEGIN
+        INSERT INTO notes_fts (notes_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO notes_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+    """)
+
+    if "videos_fts" not in existing:
+        # A file-name hit ranks above a transcript hit
+        cursor.execute("INSERT INTO videos_fts (videos_fts, rank) VALUES ('rank', 'bm25(5.0, 1.0)')")
+        cursor.execute("INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')")
+    if "notes_fts" not in existing:
+        cursor.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+
+# (version, migration) in order. Append new migrations; never edit or
+# reorder ones that have shipped.
+MIGRATIONS = [
+    (1, _migration_baseline),
+    (2, _migration_hot_query_indexes),
+    (3, _migration_cache_versions),
+    (4, _migration_content_addressed_blobs),
+    (5, _migration_transcription_webhooks),
+    (6, _migration_video_events),
+    (7, _migration_transcript_words),
+    (8, _migration_deletion_tombstones),
+    (9, _migration_reports),
+    (10, _migration_note_versions),
+    (11, _migration_upload_session_activity),
+]
 
 if __name__ == "__main__":
     create_tables()
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Benchmarks every encoding profile against generated test clips.
+
+Usage:
+    python -m app.encoding_benchmark [--duration 20] [--profiles balanced archive] [--json]
+
+Each clip is encoded exactly as uploads are: one _transcode_ladder run that
+splits and scales the source into the HLS_LADDER renditions with their
+maxrate/bufsize caps. Reports encode fps, wall time and cost per minute of
+input for the run, and each rendition's size, bitrate and, when ffmpeg
+supports them, PSNR and VMAF against the source clip.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+import ffmpeg
+from .video_processing import ENCODING_PROFILES, VIDEO_ENCODER, plan_processing, _transcode_ladder
+
+# Synthetic sources from ffmpeg's lavfi devices. testsrc2 is easy to compress,
+# mandelbrot has fine moving detail that stresses the encoder. Both are above
+# the remux limits, so uploads like them always take the ladder path.
+TEST_CLIPS = {
+    "1080p30-testsrc2": {"source": "testsrc2=size=1920x1080:rate=30", "fps": 30},
+    "720p60-mandelbrot": {"source": "mandelbrot=size=1280x720:rate=60", "fps": 60},
+}
+
+
+def generate_clip(name: str, duration: int, work_dir: str) -> str:
+    """Renders a near-lossless test clip with a sine tone so audio is encoded too."""
+    clip = TEST_CLIPS[name]
+    path = os.path.join(work_dir, f"{name}.mkv")
+    video = ffmpeg.input(clip["source"], f="lavfi", t=duration)
+    audio = ffmpeg.input("sine=frequency=440:sample_rate=48000", f="lavfi", t=duration)
+    (
+        ffmpeg
+        .output(video, audio, path, vcodec="libx264", preset="ultrafast", qp=0, acodec="pcm_s16le")
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return path
+
+
+def has_filter(name: str) -> bool:
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-filters"], capture_output=True, text=True)
+    return re.search(rf"\s{name}\s", result.stdout) is not None
+
+
+def measure_quality(distorted: str, reference: str, use_vmaf: bool) -> dict:
+    """Scores the encode against the reference, scaled to the encode's resolution."""
+    stream = next(s for s in ffmpeg.probe(distorted)["streams"] if s["codec_type"] == "video")
+    scaled_ref = f"[1:v]scale={stream['width']}:{stream['height']}:flags=bicubic"
+    graphs = {"psnr": f"{scaled_ref},fps={_fps(stream)}[ref];[0:v][ref]psnr"}
+    if use_vmaf:
+        graphs["vmaf"] = f"{scaled_ref},fps={_fps(stream)}[ref];[0:v][ref]libvmaf"
+
+    scores = {}
+    for metric, graph in graphs.items():
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-i", distorted, "-i", reference, "-lavfi", graph, "-f", "null", "-"],
+            capture_output=True, text=True
+        )
+        pattern = r"average:([\d.]+|inf)" if metric == "psnr" else r"VMAF score[:=]\s*([\d.]+)"
+        match = re.search(pattern, result.stderr)
+        scores[metric] = float(match.group(1)) if match else None
+    return scores
+
+
+def run_benchmark(profiles: list, duration: int) -> list:
+    use_vmaf = has_filter("libvmaf")
+    results = []
+    with tempfile.TemporaryDirectory(prefix="encoding-bench-") as work_dir:
+        for clip_name, clip in TEST_CLIPS.items():
+            source = generate_clip(clip_name, duration, work_dir)
+            probe = ffmpeg.probe(source)
+            path, reason = plan_processing(probe)
+            if path != "transcode":
+                raise RuntimeError(f"{clip_name} would not be transcoded ({reason})")
+            for profile_name in profiles:
+                output_dir = os.path.join(work_dir, f"{clip_name}-{profile_name}")
+                started = time.perf_counter()
+                _transcode_ladder(source, output_dir, probe, profile_name)
+                wall_time = time.perf_counter() - started
+
+                run = {
+                    "clip": clip_name,
+                    "profile": profile_name,
+                    "encoder": VIDEO_ENCODER,
+                    "wall_seconds": round(wall_time, 2),
+                    "encode_fps": round(duration * clip["fps"] / wall_time, 1),
+                    "seconds_per_input_minute": round(wall_time * 60 / duration, 1),
+                }
+                for rendition in sorted(os.listdir(output_dir)):
+                    rendition_dir = os.path.join(output_dir, rendition)
+                    if not os.path.isdir(rendition_dir):
+                        continue
+                    output_bytes = sum(
+                        os.path.getsize(os.path.join(rendition_dir, name))
+                        for name in os.listdir(rendition_dir) if name.endswith(".ts")
+                    )
+                    result = dict(
+                        run, rendition=rendition, output_bytes=output_bytes,
+                        bitrate_kbps=round(output_bytes * 8 / duration / 1000)
+                    )
+                    result.update(measure_quality(os.path.join(rendition_dir, "playlist.m3u8"), source, use_vmaf))
+                    results.append(result)
+                print(f"  {clip_name} / {profile_name}: {run['encode_fps']} fps in {run['wall_seconds']}s")
+    return results
+
+
+def print_table(results: list):
+    columns = ["clip", "profile", "rendition", "encode_fps", "wall_seconds", "seconds_per_input_minute",
+               "output_bytes", "bitrate_kbps", "psnr", "vmaf"]
+    rows = [[str(r.get(c) if r.get(c) is not None else "n/a") for c in columns] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def _fps(stream: dict) -> str:
+    return stream.get("r_frame_rate", "30/1")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark video encoding profiles.")
+    parser.add_argument("--duration", type=int, default=20, help="Length of each test clip in seconds.")
+    parser.add_argument("--profiles", nargs="+", default=list(ENCODING_PROFILES), choices=list(ENCODING_PROFILES))
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    print(f"Benchmarking {', '.join(args.profiles)} with {VIDEO_ENCODER} on {args.duration}s clips...")
+    benchmark_results = run_benchmark(args.profiles, args.duration)
+    if args.json:
+        print(json.dumps(benchmark_results, indent=2))
+    else:
+        print_table(benchmark_results)
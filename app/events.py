@@ -0,0 +1,139 @@
+import asyncio
+import json
+import time
+from decouple import config
+from .database import run_db, fetch_one, fetch_all, execute
+
+# Workers run in other processes, so they publish by appending to the
+# video_events table. While anyone is subscribed, one task in the web process
+# reads new rows and fans them out to the subscribers' queues.
+EVENT_POLL_INTERVAL = config("EVENT_POLL_INTERVAL", default=0.5, cast=float)
+EVENT_RETENTION_SECONDS = config("EVENT_RETENTION_SECONDS", default=3600, cast=int)
+SSE_KEEPALIVE_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 100
+PRUNE_INTERVAL_SECONDS = 300
+
+_subscribers = {}
+_poller = None
+_poller_lock = asyncio.Lock()
+_last_event_id = 0
+
+
+def video_status(video_id: int) -> dict:
+    """The processing and transcription state pages react to."""
+    row = fetch_one(
+        """SELECT id, processing_status, hls_playlist_url, transcription_status, audio_url,
+                  transcript IS NOT NULL AS has_transcript
+           FROM videos WHERE id = ? AND deleted_at IS NULL""",
+        (video_id,)
+    )
+    if not row:
+        return None
+    status = dict(row)
+    # Rows from before processing_status existed were fully processed
+    status["processing_status"] = status["processing_status"] or "ready"
+    status["has_transcript"] = bool(status["has_transcript"])
+    return status
+
+
+def publish_status(video_id: int):
+    """Publishes the video's current state. Call after every status change is committed."""
+    try:
+        status = video_status(video_id)
+    except Exception as e:
+        print(f"Could not read status for video_id {video_id}: {e}")
+        return
+    if status:
+        _publish(video_id, "status", status)
+
+
+def publish_progress(video_id: int, percent: float):
+    _publish(video_id, "progress", {"percent": round(percent, 1)})
+
+
+def prune_events():
+    execute("DELETE FROM video_events WHERE created_at < ?", (time.time() - EVENT_RETENTION_SECONDS,))
+
+
+async def subscribe(video_id: int) -> asyncio.Queue:
+    """Returns a queue that receives (event, data) for the video until unsubscribe() is called."""
+    global _poller, _last_event_id
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    _subscribers.setdefault(video_id, set()).add(queue)
+    async with _poller_lock:
+        if _poller is None or _poller.done():
+            # Start from the current end of the table; the caller reads a
+            # snapshot after this, so nothing between the two is missed
+            row = await run_db(fetch_one, "SELECT COALESCE(MAX(id), 0) AS id FROM video_events")
+            _last_event_id = row["id"]
+            _poller = asyncio.create_task(_poll_events())
+    return queue
+
+
+def unsubscribe(video_id: int, queue: asyncio.Queue):
+    queues = _subscribers.get(video_id)
+    if queues:
+        queues.discard(queue)
+        if not queues:
+            del _subscribers[video_id]
+
+
+async def event_stream(video_id: int, queue: asyncio.Queue, snapshot: dict, request):
+    """Server-Sent Events for one subscriber: the snapshot first, then each event as it arrives."""
+    try:
+        yield _format_event("status", json.dumps(snapshot))
+        while not await request.is_disconnected():
+            try:
+                event, data = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield _format_event(event, data)
+    finally:
+        unsubscribe(video_id, queue)
+
+
+def _publish(video_id: int, event: str, data: dict):
+    # Events are best-effort; a failure here must not fail the job publishing them
+    try:
+        execute(
+            "INSERT INTO video_events (video_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+            (video_id, event, json.dumps(data), time.time())
+        )
+    except Exception as e:
+        print(f"Could not publish {event} event for video_id {video_id}: {e}")
+
+
+def _format_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def _poll_events():
+    """Runs while there are subscribers; one query per interval however many there are."""
+    global _last_event_id
+    last_prune = time.monotonic()
+    while _subscribers:
+        await asyncio.sleep(EVENT_POLL_INTERVAL)
+        if time.monotonic() - last_prune >= PRUNE_INTERVAL_SECONDS:
+            last_prune = time.monotonic()
+            try:
+                await run_db(prune_events)
+            except Exception as e:
+                print(f"Could not prune video events: {e}")
+        try:
+            rows = await run_db(
+                fetch_all, "SELECT id, video_id, event, data FROM video_events WHERE id > ? ORDER BY id",
+                (_last_event_id,)
+            )
+        except Exception as e:
+            print(f"Could not read video events: {e}")
+            continue
+        for row in rows:
+            _last_event_id = row["id"]
+            for queue in _subscribers.get(row["video_id"], ()):
+                try:
+                    queue.put_nowait((row["event"], row["data"]))
+                except asyncio.QueueFull:
+                    # A stalled client misses events; the next status event carries the full state
+                    pass
@@ -0,0 +1,102 @@
+"""
+A deterministic stand-in for the AssemblyAI transcript API, for tests and
+load benchmarks. Run it with:
+
+    uvicorn app.fake_transcription_server:app --port 8010
+
+and set ASSEMBLYAI_BASE_URL=http://localhost:8010 with any ASSEMBLYAI_API_KEY.
+The transcript for an audio_url is always the same, so results can be compared
+across runs. The media itself is never fetched. Requests with a webhook_url
+get the webhook call once the transcript completes.
+"""
+import asyncio
+import hashlib
+import random
+import time
+import uuid
+from decouple import config
+import httpx
+from fastapi import FastAPI, HTTPException, Body
+
+# Seconds a transcript stays queued/processing before it completes
+FAKE_TRANSCRIPTION_LATENCY = config("FAKE_TRANSCRIPTION_LATENCY", default=2.0, cast=float)
+FAKE_TRANSCRIPT_WORDS = config("FAKE_TRANSCRIPT_WORDS", default=300, cast=int)
+# Fraction of audio URLs that always fail, chosen by hash so failures are reproducible
+FAKE_TRANSCRIPTION_ERROR_RATE = config("FAKE_TRANSCRIPTION_ERROR_RATE", default=0.0, cast=float)
+
+VOCABULARY = (
+    "today i want to talk about how we can make our team more effective and why it matters "
+    "for the people we work with every day so let me start with a story from last year"
+).split()
+FILLERS = ["um", "uh", "like", "so", "basically", "actually"]
+
+app = FastAPI(title="Fake transcription server")
+_transcripts = {}
+
+
+@app.post("/v2/transcript")
+async def create_transcript(request: dict = Body(...)):
+    audio_url = request.get("audio_url")
+    if not audio_url:
+        raise HTTPException(status_code=400, detail="audio_url is required")
+    transcript_id = str(uuid.uuid4())
+    _transcripts[transcript_id] = {"audio_url": audio_url, "created": time.monotonic()}
+    if request.get("webhook_url"):
+        asyncio.create_task(_deliver_webhook(transcript_id, request))
+    return _response(transcript_id)
+
+
+@app.get("/v2/transcript/{transcript_id}")
+async def get_transcript(transcript_id: str):
+    if transcript_id not in _transcripts:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return _response(transcript_id)
+
+
+async def _deliver_webhook(transcript_id: str, request: dict):
+    """Calls the webhook like AssemblyAI does: once, with only the id and final status."""
+    await asyncio.sleep(FAKE_TRANSCRIPTION_LATENCY)
+    headers = {}
+    if request.get("webhook_auth_header_name"):
+        headers[request["webhook_auth_header_name"]] = request.get("webhook_auth_header_value") or ""
+    payload = {"transcript_id": transcript_id, "status": _response(transcript_id)["status"]}
+    try:
+        async with httpx.AsyncClient() as client:
+            await client.post(request["webhook_url"], json=payload, headers=headers, timeout=10)
+    except httpx.HTTPError as e:
+        print(f"Webhook delivery for {transcript_id} failed: {e}")
+
+
+def _response(transcript_id: str) -> dict:
+    entry = _transcripts[transcript_id]
+    elapsed = time.monotonic() - entry["created"]
+    response = {"id": transcript_id, "audio_url": entry["audio_url"], "status": "queued", "text": None, "words": None}
+    if elapsed < FAKE_TRANSCRIPTION_LATENCY / 2:
+        return response
+    if elapsed < FAKE_TRANSCRIPTION_LATENCY:
+        return {**response, "status": "processing"}
+
+    seed = int.from_bytes(hashlib.sha256(entry["audio_url"].encode()).digest()[:8], "big")
+    if seed / 2 ** 64 < FAKE_TRANSCRIPTION_ERROR_RATE:
+        return {**response, "status": "error", "error": "Simulated transcription failure"}
+    words = fake_words(seed)
+    return {
+        **response,
+        "status": "completed",
+        "text": " ".join(word["text"] for word in words),
+        "words": words,
+        "audio_duration": words[-1]["end"] // 1000 if words else 0,
+        "confidence": 0.9,
+    }
+
+
+def fake_words(seed: int) -> list:
+    """Word list with millisecond timings, the same for every call with the same seed."""
+    rng = random.Random(seed)
+    words, position = [], 0
+    for index in range(FAKE_TRANSCRIPT_WORDS):
+        text = rng.choice(FILLERS) if rng.random() < 0.08 else VOCABULARY[(index + seed) % len(VOCABULARY)]
+        duration = rng.randint(150, 450)
+        words.append({"text": text, "start": position, "end": position + duration, "confidence": 0.9, "speaker": None})
+        position += duration + rng.choice([40, 80, 120, 600])
+    return words
@@ -0,0 +1,281 @@
+import importlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from decouple import config
+from .database import get_db_connection
+
+# --- Job Queue Configuration ---
+# Each queue gets its own pool of worker processes so a burst of uploads
+# can never starve transcription (or the web process) of CPU.
+QUEUE_WORKERS = {
+    "transcode": config("TRANSCODE_WORKERS", default=2, cast=int),
+    "transcription": config("TRANSCRIPTION_WORKERS", default=2, cast=int),
+    # Waveform and prosody analysis, kept off the transcode workers so it
+    # runs alongside the HLS encode
+    "prosody": config("PROSODY_WORKERS", default=1, cast=int),
+    # Storage sweeps and reconciliation; one process is plenty
+    "maintenance": config("MAINTENANCE_WORKERS", default=1, cast=int),
+}
+# Jobs each worker process runs at once. Transcription jobs mostly wait on a
+# remote service, so one process can keep several in flight; lower it to 1
+# (and raise TRANSCRIPTION_WORKERS) for CPU-bound local transcription.
+QUEUE_THREADS = {
+    "transcode": 1,
+    "transcription": config("TRANSCRIPTION_THREADS", default=4, cast=int),
+}
+JOB_MAX_PENDING = config("JOB_MAX_PENDING", default=100, cast=int)
+JOB_POLL_INTERVAL = config("JOB_POLL_INTERVAL", default=1.0, cast=float)
+JOB_RETRY_DELAY = config("JOB_RETRY_DELAY", default=30, cast=int)
+
+_workers = []
+_stop_event = None
+# Task name -> function that settles the task's work when recovery gives up on it
+_failure_handlers = {}
+
+
+def enqueue_job(queue: str, func, *args, max_attempts: int = 3, delay: float = 0) -> int:
+    """Persist a call to `func(*args)` on the given queue and return the job id."""
+    task = _task_name(func)
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            "INSERT INTO jobs (queue, task, args, max_attempts, run_after) VALUES (?, ?, ?, ?, ?)",
+            (queue, task, json.dumps(args), max_attempts, time.time() + delay)
+        )
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def has_queued_job(func, *args) -> bool:
+    """
+    Check whether a call to `func` is already waiting or running on any queue.
+    With args, only a call with exactly those arguments counts.
+    """
+    task = _task_name(func)
+    conn = get_db_connection()
+    try:
+        if args:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE task = ? AND args = ? AND status IN ('queued', 'running') LIMIT 1",
+                (task, json.dumps(args))
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE task = ? AND status IN ('queued', 'running') LIMIT 1", (task,)
+            ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def is_queue_full(queue: str) -> bool:
+    """Check whether a queue has reached JOB_MAX_PENDING waiting jobs."""
+    conn = get_db_connection()
+    try:
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status = 'queued'", (queue,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    return pending >= JOB_MAX_PENDING
+
+
+def get_job(job_id: int):
+    """Return a job row as a dict, or None if it does not exist."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT id, queue, task, status, attempts, max_attempts, last_error, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def on_job_failure(func):
+    """
+    Registers the decorated function to run, with the job's args, when a job
+    of `func` fails for good: its last attempt raised or was interrupted. The
+    row it was working on then doesn't stay 'processing' or 'in_progress'
+    forever, and tasks can leave their status alone between retries.
+    """
+    def register(handler):
+        _failure_handlers[_task_name(func)] = handler
+        return handler
+    return register
+
+
+def recover_jobs():
+    """
+    Requeue jobs left 'running' by worker processes that are no longer alive.
+    Jobs that have used up their attempts are marked 'failed' instead, and
+    their failure handler runs. Jobs of live workers, e.g. those of another
+    web process, are left alone.
+    """
+    conn = get_db_connection()
+    try:
+        running = conn.execute("SELECT id, task, args, worker_pid FROM jobs WHERE status = 'running'").fetchall()
+        interrupted = [job for job in running if not _worker_alive(job["worker_pid"])]
+        failed = conn.execute(f"""
+            UPDATE jobs SET
+                status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                last_error = COALESCE(last_error, 'Interrupted by application restart'),
+                worker_pid = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id IN ({", ".join("?" for _ in interrupted)}) AND status = 'running'
+            RETURNING id, task, args, status
+        """, tuple(job["id"] for job in interrupted)).fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    if interrupted:
+        print(f"Recovered {len(interrupted)} interrupted job(s).")
+
+    for job in failed:
+        if job["status"] == "failed":
+            _run_failure_handler(job)
+
+
+def start_workers():
+    """Spawn the worker pool for every configured queue."""
+    global _stop_event
+    ctx = multiprocessing.get_context("spawn")
+    _stop_event = ctx.Event()
+    for queue, count in QUEUE_WORKERS.items():
+        for _ in range(count):
+            process = ctx.Process(target=_worker_loop, args=(queue, _stop_event), daemon=True)
+            process.start()
+            _workers.append(process)
+    print(f"Started {len(_workers)} job worker(s): {QUEUE_WORKERS}, threads per worker: {QUEUE_THREADS}")
+
+
+def stop_workers(timeout: float = 10):
+    """Ask workers to finish their current job and exit."""
+    if _stop_event is None:
+        return
+    _stop_event.set()
+    for process in _workers:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+    _workers.clear()
+
+
+# --- Worker Internals ---
+
+def _task_name(func) -> str:
+    return f"{func.__module__}:{func.__name__}"
+
+
+def _worker_alive(pid) -> bool:
+    """Whether a worker process is still running. This process is never a worker."""
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+def _run_failure_handler(job):
+    handler = _failure_handlers.get(job["task"])
+    if handler is None:
+        return
+    try:
+        handler(*json.loads(job["args"]))
+    except Exception as e:
+        print(f"Failure handler for job {job['id']} ({job['task']}) failed: {e}")
+
+
+def _claim_next_job(queue: str):
+    conn = get_db_connection()
+    try:
+        row = conn.execute("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                worker_pid = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE queue = ? AND status = 'queued' AND run_after <= ?
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, task, args, attempts, max_attempts
+        """, (os.getpid(), queue, time.time())).fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    return row
+
+
+def _finish_job(job, error: str = None):
+    conn = get_db_connection()
+    try:
+        if error is None:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', last_error = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (job["id"],)
+            )
+        elif job["attempts"] < job["max_attempts"]:
+            # Exponential backoff before the next attempt
+            delay = JOB_RETRY_DELAY * (2 ** (job["attempts"] - 1))
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', last_error = ?, run_after = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (error, time.time() + delay, job["id"])
+            )
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', last_error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (error, job["id"])
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _run_job(job):
+    module_name, func_name = job["task"].split(":")
+    func = getattr(importlib.import_module(module_name), func_name)
+    func(*json.loads(job["args"]))
+
+
+def _worker_loop(queue: str, stop_event):
+    threads = [
+        threading.Thread(target=_claim_loop, args=(queue, stop_event), daemon=True)
+        for _ in range(QUEUE_THREADS.get(queue, 1) - 1)
+    ]
+    for thread in threads:
+        thread.start()
+    _claim_loop(queue, stop_event)
+    for thread in threads:
+        thread.join()
+
+
+def _claim_loop(queue: str, stop_event):
+    while not stop_event.is_set():
+        try:
+            job = _claim_next_job(queue)
+        except Exception as e:
+            print(f"Job worker ({queue}) could not claim a job: {e}")
+            job = None
+        if job is None:
+            stop_event.wait(JOB_POLL_INTERVAL)
+            continue
+        try:
+            _run_job(job)
+            _finish_job(job)
+        except Exception:
+            error = traceback.format_exc()
+            print(f"Job {job['id']} ({job['task']}) failed on attempt {job['attempts']}:\n{error}")
+            _finish_job(job, error)
+            if job["attempts"] >= job["max_attempts"]:
+                _run_failure_handler(job)
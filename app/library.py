@@ -0,0 +1,88 @@
+import base64
+import json
+from datetime import datetime, timezone
+from .database import fetch_all
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+PROCESSING_STATUSES = {"queued", "processing", "ready", "failed"}
+TRANSCRIPTION_STATUSES = {"not_started", "pending", "in_progress", "completed", "failed"}
+
+LIBRARY_COLUMNS = "id, original_filename, created_at, processing_status, transcription_status, duration_seconds"
+
+
+def encode_cursor(created_at: str, video_id: int) -> str:
+    """Opaque cursor for the position after (created_at, id)."""
+    raw = json.dumps([created_at, video_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, video_id = json.loads(raw)
+        return str(created_at), int(video_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+
+
+def video_page_query(limit: int = PAGE_SIZE, cursor: str = None, status: str = None,
+                     transcription_status: str = None, created_after: str = None,
+                     created_before: str = None) -> tuple:
+    """
+    Builds the keyset query for one page, newest first. Fetches limit + 1
+    rows so the caller knows whether another page exists. Every page is a
+    range read on idx_videos_created_at, however deep into the library it is.
+    """
+    # Deleted videos stay in the table until the storage sweeper releases them
+    conditions, params = ["deleted_at IS NULL"], []
+    if cursor:
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    if status:
+        if status not in PROCESSING_STATUSES:
+            raise ValueError(f"status must be one of: {', '.join(sorted(PROCESSING_STATUSES))}")
+        # Rows from before processing_status existed were fully processed
+        conditions.append("COALESCE(processing_status, 'ready') = ?")
+        params.append(status)
+    if transcription_status:
+        if transcription_status not in TRANSCRIPTION_STATUSES:
+            raise ValueError(f"transcription_status must be one of: {', '.join(sorted(TRANSCRIPTION_STATUSES))}")
+        conditions.append("transcription_status = ?")
+        params.append(transcription_status)
+    if created_after:
+        conditions.append("created_at >= ?")
+        params.append(_to_db_timestamp(created_after))
+    if created_before:
+        conditions.append("created_at < ?")
+        params.append(_to_db_timestamp(created_before))
+
+    where = f"WHERE {' AND '.join(conditions)}"
+    sql = f"SELECT {LIBRARY_COLUMNS} FROM videos {where} ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    return sql, tuple(params)
+
+
+def list_videos(limit: int = PAGE_SIZE, cursor: str = None, **filters) -> dict:
+    """Returns one page of videos and the cursor for the next page (None on the last page)."""
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    sql, params = video_page_query(limit, cursor, **filters)
+    rows = fetch_all(sql, params)
+    videos = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = videos[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return {"videos": videos, "next_cursor": next_cursor}
+
+
+def _to_db_timestamp(value: str) -> str:
+    """Accepts an ISO date or datetime and returns it in SQLite's CURRENT_TIMESTAMP format (UTC)."""
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}. Use ISO 8601, e.g. 2024-05-01 or 2024-05-01T12:00:00Z.")
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
@@ -1,18 +1,49 @@
 import os
+import re
 import json
+import asyncio
+import hmac
 import shutil
 import sys
+import tempfile
 from datetime import datetime, timezone
-from fastapi import FastAPI, Request, UploadFile, File, HTTPException, Body, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, Body
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from markupsafe import Markup
-from .database import get_db_connection, create_tables
-from .r2 import is_r2_configured, upload_file_to_r2, download_file_from_r2, test_r2_connection, generate_presigned_url
+from decouple import config
+from .database import get_db_connection, create_tables, init_db_pool, close_db_pool, run_db, fetch_one, fetch_all, execute
+from .jobs import enqueue_job, has_queued_job, is_queue_full, get_job, on_job_failure, recover_jobs, start_workers, stop_workers
+from .r2 import (
+    is_r2_configured, upload_file_to_r2, upload_files_to_r2, download_file_from_r2, read_file_from_r2,
+    delete_file_from_r2, test_r2_connection, generate_presigned_url
+)
 from .seed_prompts import seed_prompts
-from .video_processing import transcode_to_hls
-from .transcription import is_transcription_configured, transcribe_and_poll as assemblyai_transcribe
+from .prosody import analyze_audio, save_prosody, load_prosody, encode_binary as encode_prosody
+from .uploads import (
+    init_upload, get_upload, part_size, store_part, complete_upload, abort_upload, expire_upload_sessions,
+    part_executor, UploadError, UPLOAD_PARTS_DIR, UPLOAD_EXPIRY_SWEEP_SECONDS
+)
+from .video_processing import transcode_to_hls, extract_audio, ENCODING_PROFILES, DEFAULT_ENCODING_PROFILE, AUDIO_RENDITION_FILENAME
+from .transcription import (
+    is_transcription_configured, get_transcription_backend, uses_webhooks, webhook_signature,
+    verify_webhook_signature, WEBHOOK_AUTH_HEADER
+)
+from .blobs import hash_stream, claim_blob, add_blob_reference, release_blob, cached_transcript, cache_transcript
+from .library import list_videos, PAGE_SIZE
+from .prompt_cache import load_prompts, get_prompt, get_prompts, add_prompt, update_prompt, reorder_prompts, cache_version, PromptError, VIEW_TYPES
+from .search import search as search_library
+from .word_timings import save_words, copy_words_from_duplicate, load_words, word_slice, WORD_SLICE_MS, MAX_WORD_SLICE_MS
+from .events import video_status, publish_status, publish_progress, prune_events, subscribe, unsubscribe, event_stream
+from .media import media_response, etag_matches
+from .storage_gc import tombstone_videos, sweep_deleted_videos, reconcile_storage, STORAGE_RECONCILE_SECONDS
+from .reports import (
+    save_notes as store_notes, get_report, render_report, report_filename, export_reports_task, export_filename,
+    REPORT_FORMATS, EXPORTS_DIR, EXPORTS_PREFIX
+)
+from .transcript_analytics import index_transcript, update_speaking_rate, get_transcript_stats, find_phrase, filler_summary, tokenize, MAX_PHRASE_TERMS
 
 
 # --- Constants ---
@@ -21,6 +52,39 @@ ALLOWED_EXTENSIONS = {".mp4", ".mov", ".avi", ".webm"}
 ALLOWED_MIME_TYPES = {"video/mp4", "video/quicktime", "video/x-msvideo", "video/webm"}
 UPLOADS_DIR = "uploads"
 HLS_PLAYLIST_DIR = "hls_playlists"
+MAX_BATCH_DELETE = 1000
+MAX_NOTE_BATCH = 100
+# How long a duplicate upload waits before re-checking whether the original has finished processing
+DUPLICATE_RECHECK_SECONDS = 15
+ADMIN_TOKEN = config("ADMIN_TOKEN", default=None)
+# How often, and after how long, transcriptions whose webhook never arrived are checked directly
+TRANSCRIPTION_RECONCILE_SECONDS = config("TRANSCRIPTION_RECONCILE_SECONDS", default=600, cast=int)
+# In R2 mode, finished HLS output is published under a new prefix per encode,
+# so a segment's URL always names the same bytes and may be cached forever.
+# Playlists get a short TTL. With a public bucket domain (or CDN) set, players
+# fetch straight from it; otherwise through /hls/, which redirects segments to
+# presigned URLs.
+R2_PUBLIC_BASE_URL = config("R2_PUBLIC_BASE_URL", default=None)
+HLS_SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HLS_PLAYLIST_CACHE_CONTROL = "public, max-age=60"
+AUDIO_RENDITION_CACHE_CONTROL = "public, max-age=86400"
+# Local uploads get a fresh random name and are never rewritten. Local HLS
+# output is rewritten in place when a transcode is retried, and its playlists
+# grow while encoding, so clients revalidate it (a cheap 304) on every use.
+UPLOAD_CACHE_CONTROL = "public, max-age=86400"
+LOCAL_HLS_CACHE_CONTROL = "no-cache"
+
+# Reports change whenever a note is saved, so clients always revalidate (a 304 when unchanged)
+REPORT_CACHE_CONTROL = "private, no-cache"
+
+# --- Hot Queries ---
+# Run on every page view. Kept here so app.query_plan_check can verify they use indexes.
+# The index page's query is built by app.library.video_page_query, and the
+# report page's is app.reports.REPORT_QUERY. Prompts themselves come from
+# app.prompt_cache, so analysis pages only look up the video's notes.
+ANALYSIS_VIDEO_QUERY = "SELECT * FROM videos WHERE id = ? AND deleted_at IS NULL"
+
+VIDEO_NOTES_QUERY = "SELECT prompt_id, content, version FROM notes WHERE video_id = ?"
 
 app = FastAPI()
 
@@ -28,10 +92,9 @@ app = FastAPI()
 # Ensure static directories exist before mounting
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 os.makedirs(HLS_PLAYLIST_DIR, exist_ok=True)
+os.makedirs(UPLOAD_PARTS_DIR, exist_ok=True)
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
-app.mount(f"/{UPLOADS_DIR}", StaticFiles(directory=UPLOADS_DIR), name="uploads")
-app.mount(f"/{HLS_PLAYLIST_DIR}", StaticFiles(directory=HLS_PLAYLIST_DIR), name="hls")
 
 templates = Jinja2Templates(directory="app/templates")
 
@@ -41,23 +104,49 @@ def nl2br(value: str) -> str:
         return value
     return Markup(value.replace('\n', '<br>\n'))
 
+def tojson(value) -> str:
+    """
+    JSON for embedding in a <script> block. <, > and & are escaped so note or
+    transcript text containing "</script>" can't end the block early.
+    """
+    return (json.dumps(value).replace("&", "\\u0026")
+            .replace("<", "\\u003c").replace(">", "\\u003e"))
+
 templates.env.filters['nl2br'] = nl2br
-templates.env.filters['tojson'] = json.dumps
+templates.env.filters['tojson'] = tojson
 
 @app.on_event("startup")
 def on_startup():
+    init_db_pool()
     create_tables()
     seed_prompts()
+    load_prompts()
+    recover_jobs()
+    prune_events()
+    if uses_webhooks() and not has_queued_job(reconcile_transcriptions):
+        enqueue_job("transcription", reconcile_transcriptions, delay=TRANSCRIPTION_RECONCILE_SECONDS, max_attempts=1)
+    if not has_queued_job(sweep_deleted_videos):
+        enqueue_job("maintenance", sweep_deleted_videos, max_attempts=1)
+    if not has_queued_job(expire_upload_sessions):
+        enqueue_job("maintenance", expire_upload_sessions, delay=UPLOAD_EXPIRY_SWEEP_SECONDS, max_attempts=1)
+    if not has_queued_job(reconcile_storage):
+        enqueue_job("maintenance", reconcile_storage, delay=STORAGE_RECONCILE_SECONDS, max_attempts=1)
+    start_workers()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    stop_workers()
+    close_db_pool()
 
 # --- Page Routes ---
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    conn = get_db_connection()
-    videos_cursor = conn.execute("SELECT id, original_filename, created_at FROM videos ORDER BY created_at DESC")
-    videos = videos_cursor.fetchall()
-    conn.close()
-    return templates.TemplateResponse("index.html", {"request": request, "videos": videos})
+    # Only the first page is rendered; the rest load from /api/videos as the user scrolls
+    page = await run_db(list_videos, PAGE_SIZE)
+    return templates.TemplateResponse(
+        "index.html", {"request": request, "videos": page["videos"], "next_cursor": page["next_cursor"]}
+    )
 
 @app.get("/video/{video_id}", response_class=HTMLResponse)
 async def video_page(request: Request, video_id: int):
@@ -73,65 +162,41 @@ async def text_page(request: Request, video_id: int):
 
 @app.get("/report/{video_id}", response_class=HTMLResponse)
 async def report_page(request: Request, video_id: int):
-    conn = get_db_connection()
-    notes_cursor = conn.execute("""
-        SELECT p.question, n.content, p.view_type
-        FROM notes n
-        JOIN prompts p ON n.prompt_id = p.id
-        WHERE n.video_id = ?
-        ORDER BY
-            CASE p.view_type
-                WHEN 'audio' THEN 1
-                WHEN 'video' THEN 2
-                WHEN 'text' THEN 3
-                ELSE 4
-            END,
-            p.order_index
-    """, (video_id,))
-    notes_data = notes_cursor.fetchall()
-    conn.close()
-
-    # Group notes by view_type in the desired order
-    report_sections_data = {
-        "audio": [],
-        "video": [],
-        "text": []
-    }
-    for note in notes_data:
-        view_type = note['view_type']
-        if view_type in report_sections_data:
-            report_sections_data[view_type].append(dict(note))
-
-    # Create a list of sections in the correct order, with correct titles
-    report_sections = [
-        {"title": "Audio Image", "notes": report_sections_data["audio"]},
-        {"title": "Video Image", "notes": report_sections_data["video"]},
-        {"title": "Audio Transcription", "notes": report_sections_data["text"]},
-    ]
-
-    # Filter out empty sections
-    report_sections = [section for section in report_sections if section["notes"]]
+    report = await run_db(get_report, video_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Video not found")
+    headers = {"ETag": report["etag"], "Cache-Control": REPORT_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), report["etag"]):
+        return Response(status_code=304, headers=headers)
 
-    return templates.TemplateResponse("report.html", {"request": request, "video_id": video_id, "report_sections": report_sections})
+    report_sections = [section for section in report["sections"] if section["notes"]]
+    return templates.TemplateResponse(
+        "report.html",
+        {"request": request, "video_id": video_id, "report_sections": report_sections},
+        headers=headers
+    )
 
 # --- API Endpoints ---
 
 @app.post("/upload")
-async def handle_upload(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    if file.size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail="File is too large (max 500MB).")
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in ALLOWED_EXTENSIONS or file.content_type not in ALLOWED_MIME_TYPES:
-        raise HTTPException(status_code=400, detail="Invalid file type.")
-    
+async def handle_upload(file: UploadFile = File(...), profile: str = Form(DEFAULT_ENCODING_PROFILE)):
+    file_ext = _validate_upload(file.filename, file.content_type, file.size)
+    _validate_profile(profile)
     db_filename = f"video_{os.urandom(8).hex()}{file_ext}"
-    upload_url = None
 
-    if is_r2_configured():
+    # The upload is already spooled by the server, so hash it before storing:
+    # content that is already stored is referenced instead of stored again.
+    content_hash = await run_in_threadpool(hash_stream, file.file)
+    existing_filename = await run_db(claim_blob, content_hash)
+
+    if existing_filename:
+        file.file.close()
+        db_filename = existing_filename
+    elif is_r2_configured():
         try:
-            # Upload stream directly to R2 without saving locally first
-            upload_file_to_r2(file.file, db_filename)
-            upload_url = "R2"
+            # Upload stream directly to R2 without saving locally first.
+            # The multipart transfer blocks, so keep it off the event loop.
+            await run_in_threadpool(upload_file_to_r2, file.file, db_filename)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"R2 upload failed: {e}")
         finally:
@@ -140,32 +205,92 @@ async def handle_upload(background_tasks: BackgroundTasks, file: UploadFile = Fi
         # Save locally for non-R2 setups
         local_path = os.path.join(UPLOADS_DIR, db_filename)
         try:
-            with open(local_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            await run_in_threadpool(_save_local_upload, file.file, local_path)
         finally:
             file.file.close()
-        upload_url = f"/{UPLOADS_DIR}/{db_filename}"
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    upload_url = "R2" if is_r2_configured() else f"/{UPLOADS_DIR}/{db_filename}"
+    video_id = await run_db(
+        _register_video, db_filename, file.filename, file.size, file.content_type, upload_url, profile,
+        content_hash, existing_filename is not None
+    )
+    return RedirectResponse(url=f"/audio/{video_id}", status_code=303)
+
+# --- Resumable Upload API ---
+# init -> PUT parts (in any order, concurrently) -> complete. Each step maps
+# directly onto an R2 multipart upload; in local mode parts are kept on disk.
+
+@app.post("/api/uploads")
+async def init_resumable_upload(
+    filename: str = Body(...),
+    content_type: str = Body(...),
+    file_size: int = Body(...)
+):
+    file_ext = _validate_upload(filename, content_type, file_size)
+    db_filename = f"video_{os.urandom(8).hex()}{file_ext}"
     try:
-        cursor.execute(
-            "INSERT INTO videos (filename, original_filename, file_size, mime_type, upload_url) VALUES (?, ?, ?, ?, ?)",
-            (db_filename, file.filename, file.size, file.content_type, upload_url)
-        )
-        conn.commit()
-        video_id = cursor.lastrowid
+        return await run_in_threadpool(init_upload, filename, content_type, file_size, db_filename)
     except Exception as e:
-        if not is_r2_configured() and os.path.exists(temp_path):
-            os.remove(temp_path)
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        conn.close()
+        raise HTTPException(status_code=500, detail=f"Could not start upload: {e}")
+
+@app.get("/api/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    """Returns the session, including acknowledged parts, so a client can resume."""
+    upload = await run_db(get_upload, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+@app.put("/api/uploads/{upload_id}/parts/{part_number}")
+async def put_upload_part(upload_id: str, part_number: int, request: Request):
+    try:
+        expected_size = await run_db(part_size, upload_id, part_number)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    too_large = HTTPException(status_code=413, detail=f"Part {part_number} must be {expected_size} bytes.")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > expected_size:
+        raise too_large
+    # Counted as it arrives, so an oversized body is refused without buffering it
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > expected_size:
+            raise too_large
+
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(part_executor, store_part, upload_id, part_number, bytes(data))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Part upload failed: {e}")
+    return {"status": "success", "part_number": part_number}
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str, profile: str = Body(DEFAULT_ENCODING_PROFILE, embed=True)):
+    _validate_profile(profile)
+    try:
+        upload = await run_in_threadpool(complete_upload, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Could not complete upload: {e}")
 
-    # Start transcoding in the background
-    background_tasks.add_task(transcode_and_update_db, db_filename, video_id, is_r2_configured())
+    upload_url = "R2" if is_r2_configured() else f"/{UPLOADS_DIR}/{upload['filename']}"
+    video_id = await run_db(
+        _register_video, upload["filename"], upload["original_filename"], upload["file_size"], upload["mime_type"], upload_url, profile,
+        upload["content_hash"], upload["blob_claimed"]
+    )
+    return {"status": "success", "video_id": video_id, "redirect_url": f"/audio/{video_id}"}
 
-    return RedirectResponse(url=f"/audio/{video_id}", status_code=303)
+@app.delete("/api/uploads/{upload_id}")
+async def abort_resumable_upload(upload_id: str):
+    try:
+        await run_in_threadpool(abort_upload, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "message": "Upload aborted."}
 
 @app.post("/api/notes")
 async def save_note(
@@ -174,126 +299,193 @@ async def save_note(
     view_type: str = Body(...),
     content: str = Body(...)
 ):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            INSERT INTO notes (video_id, prompt_id, view_type, content)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(video_id, prompt_id) DO UPDATE SET
-            content = excluded.content,
-            created_at = CURRENT_TIMESTAMP
-        """, (video_id, prompt_id, view_type, content))
-        conn.commit()
-        return {"status": "success", "message": "Note saved."}
+        # Also updates the video's stored report
+        result = await run_db(store_notes, video_id, view_type, [{"prompt_id": prompt_id, "content": content}])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        conn.close()
+    if result is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    return {"status": "success", "message": "Note saved.", "version": result["saved"][0]["version"]}
+
+@app.post("/api/notes/batch")
+async def save_notes(
+    video_id: int = Body(...),
+    view_type: str = Body(...),
+    notes: list[dict] = Body(...)
+):
+    """
+    Saves up to MAX_NOTE_BATCH notes, {"prompt_id", "content", "version"},
+    in one transaction. "version" is the note's version when the page loaded
+    or last saved it (0 for a new note); a note changed since, e.g. from
+    another tab, is not written and is returned in "conflicts" instead.
+    """
+    if not 1 <= len(notes) <= MAX_NOTE_BATCH:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_NOTE_BATCH} notes.")
+    for note in notes:
+        if (not isinstance(note.get("prompt_id"), int) or not isinstance(note.get("content"), str)
+                or not isinstance(note.get("version"), int)):
+            raise HTTPException(status_code=400, detail="Each note needs an integer prompt_id and version and a string content.")
+    if len({note["prompt_id"] for note in notes}) != len(notes):
+        raise HTTPException(status_code=400, detail="Each prompt can appear only once per batch.")
+
+    try:
+        result = await run_db(_store_note_batch, video_id, view_type, notes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+    if result is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    return {"status": "success", **result}
 
 @app.post("/api/transcript")
 async def save_transcript(
     video_id: int = Body(...),
     content: str = Body(...)
 ):
-    conn = get_db_connection()
     try:
-        conn.execute(
-            "UPDATE videos SET transcript = ? WHERE id = ?",
-            (content, video_id)
+        updated = await run_db(
+            execute, "UPDATE videos SET transcript = ? WHERE id = ? AND deleted_at IS NULL", (content, video_id)
         )
-        conn.commit()
-        return {"status": "success", "message": "Transcript saved."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        conn.close()
+    if not updated:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    try:
+        await run_db(index_transcript, video_id, content)
+    except Exception as e:
+        # The transcript itself is saved; analytics catch up on the next save
+        print(f"Could not index transcript for video_id {video_id}: {e}")
+    return {"status": "success", "message": "Transcript saved."}
 
 @app.post("/api/video/{video_id}/start-transcription")
-async def start_transcription(video_id: int, background_tasks: BackgroundTasks):
+async def start_transcription(video_id: int):
     """Triggers the transcription process for a given video."""
     if not is_transcription_configured():
         raise HTTPException(status_code=501, detail="Transcription service not configured.")
 
-    conn = get_db_connection()
-    video_cursor = conn.execute("SELECT filename, transcription_status FROM videos WHERE id = ?", (video_id,))
-    video_data = video_cursor.fetchone()
+    # Move to 'pending' in the same statement that checks the status, so two
+    # concurrent requests can't both start a transcription
+    video_data = await run_db(_claim_transcription, video_id)
 
-    if not video_data:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Video not found")
+    # The same content may already have been transcribed for another upload
+    if await run_db(_use_cached_transcript, video_id):
+        return {"status": "success", "message": "Transcript reused from an identical upload.", "job_id": None}
 
-    current_status = video_data["transcription_status"]
-    if current_status not in ['not_started', 'failed']:
-        conn.close()
-        raise HTTPException(status_code=400, detail=f"Transcription already in progress or completed. Status: {current_status}")
+    # Run the actual submission on the worker pool. Not retried automatically,
+    # since every attempt is billed by the transcription service.
+    job_id = await run_db(
+        enqueue_job, "transcription", submit_transcription_task, video_id, video_data["filename"], max_attempts=1
+    )
 
-    # Update status to 'pending' to prevent duplicate requests
-    conn.execute("UPDATE videos SET transcription_status = 'pending' WHERE id = ?", (video_id,))
-    conn.commit()
-    conn.close()
+    return {"status": "success", "message": "Transcription process has been initiated.", "job_id": job_id}
 
-    # Run the actual submission in the background
-    background_tasks.add_task(submit_transcription_task, video_id, video_data["filename"])
+@app.get("/api/video/{video_id}/events")
+async def video_events(video_id: int, request: Request):
+    """
+    Server-Sent Events for a video: a `status` snapshot on connect, then a
+    `status` event on every processing or transcription change and `progress`
+    events while it transcodes.
+    """
+    queue = await subscribe(video_id)
+    snapshot = await run_db(video_status, video_id)
+    if not snapshot:
+        unsubscribe(video_id, queue)
+        raise HTTPException(status_code=404, detail="Video not found")
+    return StreamingResponse(
+        event_stream(video_id, queue, snapshot, request),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they are written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/webhooks/assemblyai")
+async def assemblyai_webhook(request: Request, video_id: int, payload: dict = Body(...)):
+    """
+    Completion callback for submitted transcriptions. The payload only names
+    the transcript, so the result is fetched from the API on a worker rather
+    than trusted from the request.
+    """
+    if not verify_webhook_signature(video_id, request.headers.get(WEBHOOK_AUTH_HEADER)):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature.")
+
+    transcript_id = payload.get("transcript_id")
+    video = await run_db(fetch_one, "SELECT transcript_id, transcription_status FROM videos WHERE id = ?", (video_id,))
+    if not video or not transcript_id or video["transcript_id"] != transcript_id:
+        raise HTTPException(status_code=404, detail="Unknown transcript.")
+    if video["transcription_status"] != "in_progress":
+        # Repeated delivery of a transcript that is already stored
+        return {"status": "ignored"}
+
+    await run_db(enqueue_job, "transcription", complete_transcription_task, video_id, transcript_id)
+    return {"status": "accepted"}
+
+@app.get("/api/videos")
+async def get_videos(
+    cursor: str = None,
+    limit: int = PAGE_SIZE,
+    status: str = None,
+    transcription_status: str = None,
+    created_after: str = None,
+    created_before: str = None
+):
+    """
+    Lists videos newest first, one page at a time. Pass next_cursor back as
+    cursor for the following page. Filters: processing status,
+    transcription status and an ISO 8601 created_at range.
+    """
+    try:
+        return await run_db(
+            list_videos, limit, cursor, status=status, transcription_status=transcription_status,
+            created_after=created_after, created_before=created_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return {"status": "success", "message": "Transcription process has been initiated."}
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: int):
+    """Returns the status of a background job."""
+    job = await run_db(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 
 @app.delete("/api/video/{video_id}")
 async def delete_video(video_id: int):
-    conn = get_db_connection()
-    try:
-        # First, get the video's filename to delete the file
-        video_cursor = conn.execute("SELECT filename FROM videos WHERE id = ?", (video_id,))
-        video_data = video_cursor.fetchone()
-        if not video_data:
-            raise HTTPException(status_code=404, detail="Video not found")
-
-        # Delete from R2 or local storage
-        if is_r2_configured():
-            from .r2 import delete_file_from_r2
-            try:
-                delete_file_from_r2(video_data["filename"])
-            except Exception as e:
-                # Log the error but proceed to delete DB record
-                print(f"Could not delete file from R2: {e}")
-        else:
-            # Clean up the permanent video file and its HLS playlist
-            permanent_path = os.path.join(UPLOADS_DIR, video_data["filename"])
-            if os.path.exists(permanent_path):
-                os.remove(permanent_path)
-            hls_dir = os.path.join(HLS_PLAYLIST_DIR, str(video_id))
-            if os.path.exists(hls_dir):
-                shutil.rmtree(hls_dir)
-
-        # Delete the video record. Associated notes are deleted by CASCADE.
-        conn.execute("DELETE FROM videos WHERE id = ?", (video_id,))
-        conn.commit()
+    """Hides the video at once; its data and files are removed by the storage sweeper."""
+    if not await run_db(tombstone_videos, [video_id]):
+        raise HTTPException(status_code=404, detail="Video not found")
+    return {"status": "success", "message": "Video deleted. Its files are removed in the background."}
 
-        return {"status": "success", "message": "Video and associated data deleted."}
-    except HTTPException as e:
-        # Re-raise HTTP exceptions
-        raise e
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database or file system error: {e}")
-    finally:
-        conn.close()
+@app.post("/api/videos/delete")
+async def delete_videos(video_ids: list[int] = Body(..., embed=True)):
+    """Deletes up to MAX_BATCH_DELETE videos in one request, like DELETE /api/video/{id}."""
+    if not 1 <= len(video_ids) <= MAX_BATCH_DELETE:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_BATCH_DELETE} video ids.")
+    deleted = await run_db(tombstone_videos, sorted(set(video_ids)))
+    return {"deleted": deleted, "not_found": sorted(set(video_ids) - set(deleted))}
 
 @app.get("/api/video/{video_id}/transcript")
 async def get_transcript(video_id: int):
     """API endpoint to fetch the transcript for a video."""
-    conn = get_db_connection()
-    cursor = conn.execute("SELECT transcript, hls_playlist_url FROM videos WHERE id = ?", (video_id,))
-    video_data = cursor.fetchone()
-    conn.close()
+    video_data = await run_db(
+        fetch_one,
+        "SELECT transcript, hls_playlist_url, processing_status FROM videos WHERE id = ? AND deleted_at IS NULL",
+        (video_id,)
+    )
 
     if not video_data:
         raise HTTPException(status_code=404, detail="Video not found")
 
-    # A non-null hls_playlist_url is a good proxy for transcoding being done.
+    # The playlist URL is published mid-transcode, so also check the status.
+    # Rows created before processing_status existed have it NULL.
     # Transcription doesn't start until after transcoding.
-    transcoding_done = video_data["hls_playlist_url"] is not None
+    transcoding_done = (video_data["hls_playlist_url"] is not None
+                        and video_data["processing_status"] in (None, "ready"))
     transcript_text = video_data["transcript"]
 
     return {
@@ -302,6 +494,151 @@ async def get_transcript(video_id: int):
         "is_processing": transcoding_done and not bool(transcript_text)
     }
 
+@app.get("/api/video/{video_id}/prosody")
+async def get_prosody(video_id: int, format: str = "json"):
+    """
+    Serves precomputed waveform peaks, loudness, pitch and pauses.
+    format=binary returns the compact layout documented in app.prosody.encode_binary.
+    """
+    prosody = await run_db(load_prosody, video_id)
+    if not prosody:
+        raise HTTPException(status_code=404, detail="Prosody has not been computed for this video yet.")
+    if format == "binary":
+        return Response(content=encode_prosody(prosody), media_type="application/octet-stream")
+    return {
+        "frame_ms": prosody["frame_ms"],
+        "peaks": prosody["peaks"].tolist(),
+        "loudness": prosody["loudness"].tolist(),
+        "pitch": prosody["pitch"].tolist(),
+        "pauses": prosody["pauses"],
+    }
+
+@app.get("/api/video/{video_id}/words")
+async def get_words(video_id: int, start_ms: int = 0, end_ms: int = None):
+    """
+    Word timings of the machine transcript overlapping [start_ms, end_ms), as
+    parallel arrays. The range is found by binary search, so any slice of an
+    hour-long talk costs the same. Defaults to a WORD_SLICE_MS window.
+    """
+    if end_ms is None:
+        end_ms = start_ms + WORD_SLICE_MS
+    if start_ms < 0 or end_ms <= start_ms or end_ms - start_ms > MAX_WORD_SLICE_MS:
+        raise HTTPException(status_code=400, detail=f"Give 0 <= start_ms < end_ms, at most {MAX_WORD_SLICE_MS} ms apart.")
+    words = await run_db(load_words, video_id)
+    if not words:
+        raise HTTPException(status_code=404, detail="No word timings for this video.")
+    return word_slice(words, start_ms, end_ms)
+
+@app.get("/api/video/{video_id}/report")
+async def export_report(request: Request, video_id: int, format: str = "json"):
+    """The video's report as JSON, Markdown or PDF, streamed. Markdown and PDF are sent as downloads."""
+    if format not in REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(REPORT_FORMATS)}")
+    report = await run_db(get_report, video_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Video not found")
+    # Each format is a different representation, so each gets its own ETag
+    etag = f'{report["etag"][:-1]}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": REPORT_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if format != "json":
+        headers["Content-Disposition"] = f'attachment; filename="{report_filename(report, format)}"'
+    return StreamingResponse(render_report(report, format), media_type=REPORT_FORMATS[format][0], headers=headers)
+
+@app.post("/api/reports/export")
+async def export_all_reports(format: str = Body("markdown", embed=True)):
+    """
+    Starts a background export of every video's report into one zip. Poll
+    /api/jobs/{job_id} and download from download_url once it is done.
+    """
+    if format not in REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(REPORT_FORMATS)}")
+    export_id = os.urandom(8).hex()
+    job_id = await run_db(enqueue_job, "maintenance", export_reports_task, export_id, format)
+    return {"job_id": job_id, "export_id": export_id, "download_url": f"/api/reports/exports/{export_id}"}
+
+@app.get("/api/reports/exports/{export_id}")
+async def download_report_export(request: Request, export_id: str):
+    if not re.fullmatch(r"[0-9a-f]{16}", export_id):
+        raise HTTPException(status_code=404, detail="Export not found")
+    if is_r2_configured():
+        presigned_url = generate_presigned_url(f"{EXPORTS_PREFIX}{export_filename(export_id)}")
+        if not presigned_url:
+            raise HTTPException(status_code=500, detail="Could not generate presigned URL.")
+        return RedirectResponse(url=presigned_url, status_code=302)
+    return await media_response(request, EXPORTS_DIR, export_filename(export_id), REPORT_CACHE_CONTROL)
+
+@app.get("/api/video/{video_id}/analytics")
+async def get_transcript_analytics(video_id: int):
+    """Filler counts, words per minute and repeated phrases for a saved transcript."""
+    stats = await run_db(get_transcript_stats, video_id)
+    if not stats:
+        raise HTTPException(status_code=404, detail="No transcript has been analyzed for this video yet.")
+    return stats
+
+@app.get("/api/analytics/terms")
+async def search_terms(q: str, limit: int = 50):
+    """Finds a word or phrase across all transcripts using the term index."""
+    if limit < 1 or limit > 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500.")
+    if len(tokenize(q)) > MAX_PHRASE_TERMS:
+        raise HTTPException(status_code=400, detail=f"Phrases can have at most {MAX_PHRASE_TERMS} words.")
+    return {"query": q, "results": await run_db(find_phrase, q, limit)}
+
+@app.get("/api/analytics/fillers")
+async def get_filler_summary():
+    """Filler word totals across all transcripts."""
+    return await run_db(filler_summary)
+
+@app.get("/api/search")
+async def search(q: str, limit: int = 20, offset: int = 0):
+    """Ranked full-text search over transcripts, file names and notes, with highlighted snippets."""
+    if limit < 1 or limit > 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100 and offset non-negative.")
+    return await run_db(search_library, q, limit, offset)
+
+# --- Admin API ---
+# Prompt management. Requests must send the ADMIN_TOKEN in an X-Admin-Token header.
+
+@app.get("/api/admin/prompts")
+async def list_prompts(request: Request):
+    _require_admin(request)
+    # Reading the cache may refresh it from the database
+    return await run_db(_list_prompts)
+
+@app.post("/api/admin/prompts")
+async def create_prompt(
+    request: Request,
+    view_type: str = Body(...),
+    question: str = Body(...),
+    order_index: int = Body(None)
+):
+    _require_admin(request)
+    try:
+        prompt = await run_db(add_prompt, view_type, question, order_index)
+    except PromptError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "prompt": prompt, "version": cache_version()}
+
+@app.put("/api/admin/prompts/{prompt_id}")
+async def edit_prompt(request: Request, prompt_id: int, question: str = Body(..., embed=True)):
+    _require_admin(request)
+    try:
+        prompt = await run_db(update_prompt, prompt_id, question)
+    except PromptError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "prompt": prompt, "version": cache_version()}
+
+@app.post("/api/admin/prompts/reorder")
+async def reorder_view_prompts(request: Request, view_type: str = Body(...), prompt_ids: list[int] = Body(...)):
+    _require_admin(request)
+    try:
+        prompts = await run_db(reorder_prompts, view_type, prompt_ids)
+    except PromptError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "prompts": prompts, "version": cache_version()}
+
 # --- Health & Test Routes ---
 
 @app.get("/health")
@@ -328,10 +665,7 @@ async def get_video_file(video_id: int):
     Redirects to a presigned URL for the video file in R2.
     This provides a stable URL for the transcription service.
     """
-    conn = get_db_connection()
-    video_cursor = conn.execute("SELECT filename FROM videos WHERE id = ?", (video_id,))
-    video_data = video_cursor.fetchone()
-    conn.close()
+    video_data = await run_db(fetch_one, "SELECT filename FROM videos WHERE id = ? AND deleted_at IS NULL", (video_id,))
 
     if not video_data or not is_r2_configured():
         raise HTTPException(status_code=404, detail="Video not found or R2 not configured.")
@@ -342,13 +676,165 @@ async def get_video_file(video_id: int):
 
     return RedirectResponse(url=presigned_url)
 
+@app.api_route(f"/{UPLOADS_DIR}/{{path:path}}", methods=["GET", "HEAD"])
+async def get_local_upload(request: Request, path: str):
+    """Locally stored uploads, with byte ranges for seeking."""
+    return await media_response(request, UPLOADS_DIR, path, UPLOAD_CACHE_CONTROL)
+
+@app.api_route(f"/{HLS_PLAYLIST_DIR}/{{path:path}}", methods=["GET", "HEAD"])
+async def get_local_hls_file(request: Request, path: str):
+    """Locally stored HLS output and audio renditions."""
+    return await media_response(request, HLS_PLAYLIST_DIR, path, LOCAL_HLS_CACHE_CONTROL)
+
+@app.get("/hls/{video_id}/{path:path}")
+async def get_hls_file(video_id: int, path: str):
+    """
+    Serves HLS output published to R2 when the bucket has no public URL.
+    Playlists are small and returned directly, so the relative URIs in them
+    keep resolving here; segments redirect to a presigned URL, so their bytes
+    never pass through this process.
+    """
+    if not is_r2_configured() or not path.startswith("hls-") or ".." in path.split("/"):
+        raise HTTPException(status_code=404, detail="File not found.")
+    object_name = f"derived/{video_id}/{path}"
+
+    if path.endswith(".m3u8"):
+        try:
+            playlist = await run_in_threadpool(read_file_from_r2, object_name)
+        except IOError:
+            raise HTTPException(status_code=404, detail="File not found.")
+        return Response(
+            content=playlist, media_type="application/vnd.apple.mpegurl",
+            headers={"Cache-Control": HLS_PLAYLIST_CACHE_CONTROL}
+        )
+
+    presigned_url = generate_presigned_url(object_name)
+    if not presigned_url:
+        raise HTTPException(status_code=500, detail="Could not generate presigned URL.")
+    return RedirectResponse(url=presigned_url, status_code=302)
+
 # --- Helper Functions ---
 
-def transcode_and_update_db(db_filename: str, video_id: int, is_r2: bool):
+def _validate_upload(filename: str, content_type: str, file_size: int) -> str:
+    """Checks size, type and queue capacity. Returns the lowercased file extension."""
+    if file_size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File is too large (max 500MB).")
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in ALLOWED_EXTENSIONS or content_type not in ALLOWED_MIME_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid file type.")
+    if is_queue_full("transcode"):
+        raise HTTPException(status_code=503, detail="Too many videos are waiting to be processed. Please try again shortly.")
+    return file_ext
+
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=501, detail="Admin API is not configured. Set ADMIN_TOKEN to enable it.")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+def _validate_profile(profile: str):
+    if profile not in ENCODING_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding profile. Choose one of: {', '.join(ENCODING_PROFILES)}")
+
+def _claim_transcription(video_id: int):
+    """Sets the status to 'pending' if no transcription is running. Returns the video row."""
+    conn = get_db_connection()
+    try:
+        video_data = conn.execute(
+            """UPDATE videos SET transcription_status = 'pending'
+               WHERE id = ? AND transcription_status IN ('not_started', 'failed') AND deleted_at IS NULL
+               RETURNING filename""",
+            (video_id,)
+        ).fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    if video_data:
+        publish_status(video_id)
+        return video_data
+    current = fetch_one("SELECT transcription_status FROM videos WHERE id = ? AND deleted_at IS NULL", (video_id,))
+    if not current:
+        raise HTTPException(status_code=404, detail="Video not found")
+    raise HTTPException(
+        status_code=400,
+        detail=f"Transcription already in progress or completed. Status: {current['transcription_status']}"
+    )
+
+def _list_prompts() -> dict:
+    return {"version": cache_version(), "prompts": {view_type: get_prompts(view_type) for view_type in VIEW_TYPES}}
+
+def _store_note_batch(video_id: int, view_type: str, notes: list):
+    """Checks that every note answers a prompt of view_type, then saves the batch. May refresh the prompt cache."""
+    for note in notes:
+        prompt = get_prompt(note["prompt_id"])
+        if not prompt or prompt["view_type"] != view_type:
+            raise HTTPException(status_code=400, detail=f"Unknown {view_type} prompt: {note['prompt_id']}")
+    return store_notes(video_id, view_type, notes)
+
+def _save_local_upload(file_obj, local_path: str):
+    with open(local_path, "wb") as buffer:
+        shutil.copyfileobj(file_obj, buffer)
+
+def _register_video(db_filename: str, original_filename: str, file_size: int, mime_type: str, upload_url: str,
+                    profile: str = DEFAULT_ENCODING_PROFILE, content_hash: str = None, blob_claimed: bool = False) -> int:
+    """
+    Inserts the video row for a stored upload and queues it for transcoding.
+    blob_claimed means db_filename is an existing blob the caller already holds
+    a reference on; otherwise a newly stored upload is recorded as a blob.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    redundant_copy = None
+    try:
+        if content_hash and not blob_claimed:
+            stored_filename = add_blob_reference(conn, content_hash, db_filename, file_size, mime_type)
+            if stored_filename != db_filename:
+                # An identical upload finished storing first: use it and drop this copy
+                redundant_copy, db_filename = db_filename, stored_filename
+                upload_url = "R2" if is_r2_configured() else f"/{UPLOADS_DIR}/{db_filename}"
+        cursor.execute(
+            """INSERT INTO videos (filename, original_filename, file_size, mime_type, upload_url, processing_status, content_hash)
+               VALUES (?, ?, ?, ?, ?, 'queued', ?)""",
+            (db_filename, original_filename, file_size, mime_type, upload_url, content_hash)
+        )
+        conn.commit()
+        video_id = cursor.lastrowid
+    except Exception as e:
+        conn.rollback()
+        if blob_claimed:
+            if release_blob(conn, content_hash):
+                _delete_stored_upload(db_filename)
+            conn.commit()
+        else:
+            local_path = os.path.join(UPLOADS_DIR, db_filename)
+            if not is_r2_configured() and os.path.exists(local_path):
+                os.remove(local_path)
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+    finally:
+        conn.close()
+
+    if redundant_copy:
+        _delete_stored_upload(redundant_copy)
+
+    # Queue transcoding for the worker pool
+    enqueue_job("transcode", transcode_and_update_db, db_filename, video_id, is_r2_configured(), profile)
+    return video_id
+
+def _delete_stored_upload(filename: str):
+    if is_r2_configured():
+        delete_file_from_r2(filename)
+    else:
+        local_path = os.path.join(UPLOADS_DIR, filename)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+
+def transcode_and_update_db(db_filename: str, video_id: int, is_r2: bool, profile: str = DEFAULT_ENCODING_PROFILE):
     """
-    Background task to process video:
-    1. Transcodes to HLS.
-    2. Triggers transcription.
+    Job queue task to process video:
+    1. Extracts the compact audio rendition (the audio page is shown first).
+    2. Transcodes to HLS.
+    3. In R2 mode, publishes the HLS output to R2 and removes the local copy.
+    Errors are re-raised so the job queue can retry the job.
     """
     try:
         BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
@@ -363,62 +849,416 @@ def transcode_and_update_db(db_filename: str, video_id: int, is_r2: bool):
             # Use the local file path for local files
             video_url = os.path.join(UPLOADS_DIR, db_filename)
 
-        # 1. Transcode to HLS
-        hls_url = transcode_to_hls(video_url, video_id)
+        if _reuse_duplicate_outputs(db_filename, video_id, is_r2, profile):
+            return
+
+        _set_processing_status(video_id, "processing")
+
+        # 1. Audio-only rendition. Optional, so a failure here doesn't block HLS.
+        try:
+            _store_audio_rendition(video_url, video_id, is_r2)
+        except Exception as e:
+            print(f"Could not create audio rendition for video_id {video_id}: {e}")
+        # Prosody runs on its own queue so it overlaps with the HLS encode
+        _queue_prosody(video_id)
+
+        # 2. Transcode to HLS. The playlist URL is published as soon as the
+        # first segment exists, so the video page can play partial output.
+        def publish_playlist(hls_url: str):
+            conn = get_db_connection()
+            try:
+                conn.execute("UPDATE videos SET hls_playlist_url = ? WHERE id = ?", (hls_url, video_id))
+                conn.commit()
+            finally:
+                conn.close()
+            publish_status(video_id)
+
+        result = transcode_to_hls(
+            video_url, video_id, profile, on_playable=publish_playlist,
+            on_progress=lambda percent: publish_progress(video_id, percent)
+        )
+        # 3. In R2 mode, move the finished output to R2 so any node (or a CDN) can serve it
+        hls_url = _publish_hls_to_r2(video_id) if is_r2 else result["hls_url"]
         conn = get_db_connection()
         try:
-            conn.execute("UPDATE videos SET hls_playlist_url = ? WHERE id = ?", (hls_url, video_id))
+            conn.execute(
+                """UPDATE videos SET hls_playlist_url = ?, processing_status = 'ready', processing_path = ?,
+                   processing_reason = ?, duration_seconds = ? WHERE id = ?""",
+                (hls_url, result["processing_path"], result["processing_reason"], result["duration_seconds"], video_id)
+            )
+            # The transcript may have been analyzed before the duration was known
+            update_speaking_rate(conn, video_id, result["duration_seconds"])
             conn.commit()
         finally:
             conn.close()
+        publish_status(video_id)
 
         # Transcription is now triggered manually by the user.
 
     except Exception as e:
         print(f"Error during background processing for video_id {video_id}: {e}")
+        # Hide partial output and wait for the retry; pages fall back to the
+        # original upload. Only _fail_interrupted_transcode marks it failed,
+        # once the job has no attempts left.
+        if execute(
+            """UPDATE videos SET hls_playlist_url = NULL, processing_status = 'queued'
+               WHERE id = ? AND processing_status = 'processing'""",
+            (video_id,)
+        ):
+            publish_status(video_id)
+        raise
+
+@on_job_failure(transcode_and_update_db)
+def _fail_interrupted_transcode(db_filename: str, video_id: int, *args):
+    """Marks a video failed when its transcode failed or was interrupted on its last attempt."""
+    if execute(
+        """UPDATE videos SET hls_playlist_url = NULL, processing_status = 'failed'
+           WHERE id = ? AND processing_status IN ('queued', 'processing')""",
+        (video_id,)
+    ):
+        publish_status(video_id)
+
+def _reuse_duplicate_outputs(db_filename: str, video_id: int, is_r2: bool, profile: str) -> bool:
+    """
+    Reuses the HLS output, audio rendition and prosody of an earlier upload
+    with the same content. If that upload is still being processed, this job
+    re-queues itself to check again later instead of encoding the same content
+    twice. Returns True if this video needs no processing of its own now.
+    """
+    conn = get_db_connection()
+    try:
+        # Only earlier uploads are considered, so two duplicates never wait on each other
+        source = conn.execute(
+            """SELECT s.* FROM videos v
+               JOIN videos s ON s.content_hash = v.content_hash AND s.id < v.id
+               WHERE v.id = ? AND s.processing_status IN ('queued', 'processing', 'ready') AND s.deleted_at IS NULL
+               ORDER BY s.processing_status = 'ready' DESC, s.id LIMIT 1""",
+            (video_id,)
+        ).fetchone()
+        if not source:
+            return False
+        if source["processing_status"] != "ready":
+            enqueue_job("transcode", transcode_and_update_db, db_filename, video_id, is_r2, profile,
+                        delay=DUPLICATE_RECHECK_SECONDS)
+            return True
 
-def submit_transcription_task(video_id: int, db_filename: str):
+        conn.execute(
+            """UPDATE videos SET hls_playlist_url = ?, processing_status = 'ready', processing_path = ?,
+               processing_reason = ?, duration_seconds = ?, audio_filename = ?, audio_url = ? WHERE id = ?""",
+            (source["hls_playlist_url"], source["processing_path"], source["processing_reason"],
+             source["duration_seconds"], source["audio_filename"], source["audio_url"], video_id)
+        )
+        update_speaking_rate(conn, video_id, source["duration_seconds"])
+        copied_prosody = conn.execute(
+            """INSERT OR REPLACE INTO prosody (video_id, frame_ms, frame_count, peaks, loudness, pitch, pauses)
+               SELECT ?, frame_ms, frame_count, peaks, loudness, pitch, pauses FROM prosody WHERE video_id = ?""",
+            (video_id, source["id"])
+        ).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+
+    publish_status(video_id)
+    if not copied_prosody:
+        _queue_prosody(video_id)
+    print(f"Reused processed outputs of video_id {source['id']} for duplicate video_id {video_id}.")
+    return True
+
+def _publish_hls_to_r2(video_id: int) -> str:
     """
-    Submits a video for transcription, polls for the result, and saves it.
-    This is run in the background.
+    Uploads the finished HLS output to a fresh prefix in R2, removes the local
+    playlists and segments once every upload is verified, and returns the
+    master playlist URL to serve. The audio rendition is stored separately.
     """
-    print(f"Starting transcription task for video_id: {video_id}")
+    output_dir = os.path.join(HLS_PLAYLIST_DIR, str(video_id))
+    version = f"hls-{os.urandom(4).hex()}"
+    files = []
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            local_path = os.path.join(root, name)
+            relative_path = os.path.relpath(local_path, output_dir).replace("\\", "/")
+            if relative_path == AUDIO_RENDITION_FILENAME:
+                continue
+            if name.endswith(".m3u8"):
+                files.append((local_path, f"derived/{video_id}/{version}/{relative_path}",
+                              "application/vnd.apple.mpegurl", HLS_PLAYLIST_CACHE_CONTROL))
+            else:
+                files.append((local_path, f"derived/{video_id}/{version}/{relative_path}",
+                              "video/mp2t", HLS_SEGMENT_CACHE_CONTROL))
+    upload_files_to_r2(files)
+    print(f"Published {len(files)} HLS file(s) for video_id {video_id} to R2.")
+
+    for local_path, _, _, _ in files:
+        os.remove(local_path)
+    for entry in os.listdir(output_dir):
+        if os.path.isdir(os.path.join(output_dir, entry)):
+            shutil.rmtree(os.path.join(output_dir, entry), ignore_errors=True)
+
+    if R2_PUBLIC_BASE_URL:
+        return f"{R2_PUBLIC_BASE_URL.rstrip('/')}/derived/{video_id}/{version}/master.m3u8"
+    return f"/hls/{video_id}/{version}/master.m3u8"
+
+def _store_audio_rendition(video_url: str, video_id: int, is_r2: bool):
+    audio_path = extract_audio(video_url, video_id)
+    audio_filename = None
+    audio_url = f"/{audio_path}".replace("\\", "/")
+    if is_r2:
+        audio_filename = f"derived/{video_id}/{os.path.basename(audio_path)}"
+        upload_files_to_r2([(audio_path, audio_filename, "audio/mp4", AUDIO_RENDITION_CACHE_CONTROL)])
+        audio_url = "R2"
     conn = get_db_connection()
-    conn.execute("UPDATE videos SET transcription_status = 'in_progress' WHERE id = ?", (video_id,))
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute(
+            "UPDATE videos SET audio_filename = ?, audio_url = ? WHERE id = ?", (audio_filename, audio_url, video_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    publish_status(video_id)
+
+def _queue_prosody(video_id: int):
+    """Queues prosody analysis once per video: a retried transcode job calls this again."""
+    if fetch_one("SELECT 1 FROM prosody WHERE video_id = ?", (video_id,)):
+        return
+    if not has_queued_job(analyze_prosody_task, video_id):
+        enqueue_job("prosody", analyze_prosody_task, video_id)
 
+def analyze_prosody_task(video_id: int):
+    """
+    Job queue task that stores waveform and prosody arrays for the audio page.
+    Decodes the small audio rendition when it exists, otherwise the original
+    upload. R2 URLs are presigned here, so a job that waited in the queue
+    never starts with an expired URL.
+    """
+    video = fetch_one("SELECT filename, audio_filename FROM videos WHERE id = ? AND deleted_at IS NULL", (video_id,))
+    if not video:
+        return
+    audio_path = os.path.join(HLS_PLAYLIST_DIR, str(video_id), AUDIO_RENDITION_FILENAME)
+    if os.path.exists(audio_path):
+        source = audio_path
+    elif is_r2_configured():
+        source = generate_presigned_url(video["audio_filename"] or video["filename"], expiration=3600)
+        if not source:
+            raise Exception("Could not generate presigned URL for prosody analysis.")
+    else:
+        source = os.path.join(UPLOADS_DIR, video["filename"])
+    save_prosody(video_id, analyze_audio(source))
+    print(f"Stored prosody for video_id {video_id}.")
+    if source == audio_path and video["audio_filename"]:
+        # The rendition was uploaded to R2 and verified before this job was
+        # queued; nothing else reads the local copy
+        os.remove(audio_path)
+
+def _set_processing_status(video_id: int, status: str):
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE videos SET processing_status = ? WHERE id = ?", (status, video_id))
+        conn.commit()
+    finally:
+        conn.close()
+    publish_status(video_id)
+
+def _local_transcription_media(video_id: int, db_filename: str) -> tuple:
+    """
+    A local file for a local transcription backend: the audio rendition when
+    there is one, since it is a fraction of the upload's size, else the upload.
+    Returns (path, temp_path), where temp_path is a download to remove afterwards.
+    """
+    video = fetch_one("SELECT audio_filename, audio_url FROM videos WHERE id = ?", (video_id,))
+    audio_url = video["audio_url"] if video else None
+    if audio_url and audio_url.startswith("/") and os.path.exists(audio_url[1:]):
+        return audio_url[1:], None
+    if not is_r2_configured():
+        return os.path.join(UPLOADS_DIR, db_filename), None
+
+    object_name = video["audio_filename"] if video and video["audio_filename"] else db_filename
+    fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(object_name)[1])
+    os.close(fd)
+    try:
+        download_file_from_r2(object_name, temp_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return temp_path, temp_path
+
+def _use_cached_transcript(video_id: int) -> bool:
+    """Completes the transcription from an identical upload's transcript, if there is one."""
+    transcript_text = cached_transcript(video_id)
+    if transcript_text is None:
+        return False
+    conn = get_db_connection()
     try:
-        BASE_URL = os.getenv("BASE_URL", "http://localhost:8000").rstrip('/')
-        is_r2 = is_r2_configured()
-        
-        video_url = f"{BASE_URL}/video-file/{video_id}" if is_r2 else f"{BASE_URL}/{UPLOADS_DIR}/{db_filename}"
-        
-        print(f"Starting transcription for video URL: {video_url}")
-        transcript_text = assemblyai_transcribe(video_url)
-        
-        conn = get_db_connection()
         conn.execute(
             "UPDATE videos SET transcript = ?, transcription_status = 'completed' WHERE id = ?",
             (transcript_text, video_id)
         )
+        copy_words_from_duplicate(conn, video_id)
         conn.commit()
+    finally:
         conn.close()
-        print(f"Successfully transcribed and saved video_id {video_id}.")
+    publish_status(video_id)
+    try:
+        index_transcript(video_id, transcript_text)
+    except Exception as e:
+        print(f"Could not index transcript for video_id {video_id}: {e}")
+    print(f"Reused the transcript of an identical upload for video_id {video_id}.")
+    return True
+
+def submit_transcription_task(video_id: int, db_filename: str):
+    """
+    Submits a video for transcription and saves the result. With webhooks
+    enabled the job returns once the backend has accepted the media, and the
+    result arrives at the webhook; otherwise it waits for the result.
+    This is run on the "transcription" job queue.
+    """
+    print(f"Starting transcription task for video_id: {video_id}")
+    # An identical upload may have been transcribed while this job was queued
+    if _use_cached_transcript(video_id):
+        return
+    conn = get_db_connection()
+    conn.execute(
+        "UPDATE videos SET transcription_status = 'in_progress', transcript_id = NULL WHERE id = ?", (video_id,)
+    )
+    conn.commit()
+    conn.close()
+    publish_status(video_id)
+
+    temp_path = None
+    try:
+        backend = get_transcription_backend()
+        BASE_URL = os.getenv("BASE_URL", "http://localhost:8000").rstrip('/')
+        if backend.remote:
+            is_r2 = is_r2_configured()
+
+            media = f"{BASE_URL}/video-file/{video_id}" if is_r2 else f"{BASE_URL}/{UPLOADS_DIR}/{db_filename}"
+        else:
+            media, temp_path = _local_transcription_media(video_id, db_filename)
+
+        if uses_webhooks():
+            webhook_url = f"{BASE_URL}/api/webhooks/assemblyai?video_id={video_id}"
+            transcript_id = backend.submit(media, webhook_url, webhook_signature(video_id))
+            execute(
+                "UPDATE videos SET transcript_id = ?, transcription_submitted_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (transcript_id, video_id)
+            )
+            print(f"Submitted {backend.name} transcript {transcript_id} for video_id {video_id}.")
+            return
+
+        print(f"Starting {backend.name} transcription for: {media}")
+        result = backend.transcribe(media)
+        _save_machine_transcript(video_id, None, result["text"] or "", result["words"])
 
     except Exception as e:
         print(f"Error during transcription for video_id {video_id}: {e}")
-        conn = get_db_connection()
-        conn.execute("UPDATE videos SET transcription_status = 'failed' WHERE id = ?", (video_id,))
+        _fail_transcription(video_id)
+        raise
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+@on_job_failure(submit_transcription_task)
+def _fail_interrupted_transcription(video_id: int, db_filename: str):
+    """Marks a transcription failed when its job was interrupted, so it can be retried."""
+    if execute(
+        """UPDATE videos SET transcription_status = 'failed'
+           WHERE id = ? AND transcription_status IN ('pending', 'in_progress')""",
+        (video_id,)
+    ):
+        publish_status(video_id)
+
+def complete_transcription_task(video_id: int, transcript_id: str) -> bool:
+    """
+    Fetches a submitted transcript once and stores it if it has finished.
+    Run for each webhook delivery and by the reconciliation sweep. Returns
+    True once the transcription is settled (completed or failed).
+    """
+    result = get_transcription_backend().fetch_result(transcript_id)
+    if result["status"] == "completed":
+        _save_machine_transcript(video_id, transcript_id, result["text"] or "", result["words"])
+        return True
+    if result["status"] == "error":
+        print(f"Transcription {transcript_id} failed for video_id {video_id}: {result['error']}")
+        _fail_transcription(video_id, transcript_id)
+        return True
+    return False
+
+def reconcile_transcriptions():
+    """
+    Fallback for webhooks that never arrive: checks transcriptions submitted
+    more than TRANSCRIPTION_RECONCILE_SECONDS ago that are still in progress,
+    then schedules the next sweep. It runs with max_attempts=1: the next
+    sweep is its retry, so a failure never starts a second chain.
+    """
+    try:
+        pending = fetch_all(
+            """SELECT id, transcript_id FROM videos
+               WHERE transcription_status = 'in_progress' AND transcription_submitted_at <= datetime('now', ?)
+               AND transcript_id IS NOT NULL""",
+            (f"-{TRANSCRIPTION_RECONCILE_SECONDS} seconds",)
+        )
+        settled = 0
+        for video in pending:
+            try:
+                settled += complete_transcription_task(video["id"], video["transcript_id"])
+            except Exception as e:
+                print(f"Could not reconcile transcript {video['transcript_id']} for video_id {video['id']}: {e}")
+        if pending:
+            print(f"Reconciled {settled} of {len(pending)} pending transcription(s).")
+    finally:
+        enqueue_job("transcription", reconcile_transcriptions, delay=TRANSCRIPTION_RECONCILE_SECONDS, max_attempts=1)
+
+def _save_machine_transcript(video_id: int, transcript_id: str, transcript_text: str, words: list):
+    conn = get_db_connection()
+    try:
+        # Only the submission the video is waiting on may complete it, once
+        saved = conn.execute(
+            """UPDATE videos SET transcript = ?, transcription_status = 'completed'
+               WHERE id = ? AND transcription_status = 'in_progress' AND transcript_id IS ?""",
+            (transcript_text, video_id, transcript_id)
+        ).rowcount
+        if saved:
+            # Keep the machine transcript for identical uploads
+            cache_transcript(conn, video_id, transcript_text)
+            save_words(conn, video_id, words)
         conn.commit()
+    finally:
         conn.close()
+    if not saved:
+        return
+    print(f"Successfully transcribed and saved video_id {video_id}.")
+    publish_status(video_id)
+
+    try:
+        index_transcript(video_id, transcript_text)
+    except Exception as e:
+        print(f"Could not index transcript for video_id {video_id}: {e}")
+
+def _fail_transcription(video_id: int, transcript_id: str = None):
+    if execute(
+        """UPDATE videos SET transcription_status = 'failed'
+           WHERE id = ? AND transcription_status = 'in_progress' AND transcript_id IS ?""",
+        (video_id, transcript_id)
+    ):
+        publish_status(video_id)
 
 
 async def analysis_page_factory(view_type: str, request: Request, video_id: int):
     """Factory to render video, audio, or text analysis pages."""
+    video, prompts = await run_db(_load_analysis_page, view_type, video_id)
+    template_name = f"{view_type}.html"
+    context = {
+        "request": request,
+        "video": video,
+        "prompts": prompts,
+        "video_id": video_id,
+        "word_slice_ms": WORD_SLICE_MS
+    }
+    return templates.TemplateResponse(template_name, context)
+
+def _load_analysis_page(view_type: str, video_id: int):
     conn = get_db_connection()
     
-    video_cursor = conn.execute("SELECT * FROM videos WHERE id = ?", (video_id,))
+    video_cursor = conn.execute(ANALYSIS_VIDEO_QUERY, (video_id,))
     video_data = video_cursor.fetchone()
     if not video_data:
         conn.close()
@@ -431,6 +1271,12 @@ async def analysis_page_factory(view_type: str, request: Request, video_id: int)
         if view_type == 'video' and video.get("hls_playlist_url"):
             # For the video page, prioritize the HLS stream
             video["upload_url"] = video["hls_playlist_url"]
+        elif view_type != 'video' and video.get("audio_filename"):
+            # Audio/text pages only need sound: use the compact audio rendition
+            presigned_url = generate_presigned_url(video["audio_filename"])
+            if presigned_url:
+                video["upload_url"] = presigned_url
+                video["mime_type"] = "audio/mp4"
         elif video.get("filename"):
             # For audio/text pages on R2, always generate a presigned URL
             presigned_url = generate_presigned_url(video["filename"])
@@ -439,24 +1285,18 @@ async def analysis_page_factory(view_type: str, request: Request, video_id: int)
     elif view_type == 'video' and video.get("hls_playlist_url"):
         # For local video playback, use the HLS stream
         video["upload_url"] = video["hls_playlist_url"]
+    elif view_type != 'video' and video.get("audio_url"):
+        video["upload_url"] = video["audio_url"]
+        video["mime_type"] = "audio/mp4"
     # If local and not HLS, the default local file URL in the DB is used
     
-    prompts_cursor = conn.execute("""
-        SELECT p.id, p.question, p.order_index, n.content
-        FROM prompts p
-        LEFT JOIN notes n ON p.id = n.prompt_id AND n.video_id = ?
-        WHERE p.view_type = ?
-        ORDER BY p.order_index
-    """, (video_id, view_type))
-    prompts = prompts_cursor.fetchall()
+    notes_cursor = conn.execute(VIDEO_NOTES_QUERY, (video_id,))
+    notes_by_prompt = {note["prompt_id"]: note for note in notes_cursor.fetchall()}
     
     conn.close()
-    
-    template_name = f"{view_type}.html"
-    context = {
-        "request": request,
-        "video": video,
-        "prompts": prompts,
-        "video_id": video_id
-    }
-    return templates.TemplateResponse(template_name, context)
\ No newline at end of file
+    prompts = []
+    for prompt in get_prompts(view_type):
+        note = notes_by_prompt.get(prompt["id"])
+        # version 0 tells /api/notes/batch the page saw no note for this prompt
+        prompts.append(dict(prompt, content=note["content"] if note else None, version=note["version"] if note else 0))
+    return video, prompts
\ No newline at end of file
@@ -0,0 +1,167 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from stat import S_ISREG
+from decouple import config
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+# Local-mode media (uploads and HLS output) is served by media_response()
+# rather than StaticFiles: it answers seeks with a single byte range, revalidates
+# with ETag/Last-Modified, and streams the body in large chunks read with
+# os.pread in the threadpool. There is no zero-copy send: uvicorn, which
+# serves this app, offers no ASGI extension to hand it a file, so every
+# chunk is copied through Python.
+MEDIA_CHUNK_SIZE = config("MEDIA_CHUNK_SIZE", default=1024 * 1024, cast=int)
+
+# mimetypes maps .ts to Qt translation files on most systems
+MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".m4a": "audio/mp4",
+    ".mp4": "video/mp4",
+    ".mov": "video/quicktime",
+    ".webm": "video/webm",
+    ".avi": "video/x-msvideo",
+    ".zip": "application/zip",
+}
+
+
+class MediaFileResponse(Response):
+    """
+    A file body, or one byte range of it. Build it with media_response(),
+    which has already checked the path, the conditional headers and the range.
+    """
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: dict, send_body: bool):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        length = self.end - self.start
+        if not self.send_body or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        file = await run_in_threadpool(open, self.path, "rb")
+        try:
+            offset = self.start
+            while offset < self.end:
+                chunk = await run_in_threadpool(os.pread, file.fileno(), min(MEDIA_CHUNK_SIZE, self.end - offset), offset)
+                if not chunk:
+                    # Truncated while being served; end the response rather than loop forever
+                    break
+                offset += len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": offset < self.end})
+            if offset < self.end:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            file.close()
+
+
+async def media_response(request, root: str, path: str, cache_control: str) -> Response:
+    """
+    Serves root/path for a GET or HEAD request: 404 for anything outside root,
+    304 when the client's copy is current, 206 for a satisfiable single range
+    and 416 otherwise. Multi-range requests get the whole file.
+    """
+    found = await run_in_threadpool(_stat_file, root, path)
+    if found is None:
+        return Response(status_code=404)
+    full_path, stat = found
+
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if _not_modified(request.headers, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Type"] = MEDIA_TYPES.get(os.path.splitext(full_path)[1].lower(), "application/octet-stream")
+    start, end, status_code = 0, size, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range in (etag, last_modified)):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+    return MediaFileResponse(full_path, start, end, status_code, headers, request.method != "HEAD")
+
+
+def _stat_file(root: str, path: str):
+    """(real path, stat) of a regular file under root, or None. Blocks on the filesystem."""
+    root = os.path.realpath(root)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if not full_path.startswith(root + os.sep):
+        return None
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        return None
+    if not S_ISREG(stat.st_mode):
+        return None
+    return full_path, stat
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header covers etag, using the weak comparison it requires."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _not_modified(request_headers, etag: str, mtime: float) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int):
+    """
+    The [start, end) of a single "bytes=" range. Returns () to ignore the
+    header (malformed or several ranges) and None if it can't be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return ()
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return ()
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            suffix = int(last)
+            if suffix == 0:
+                return None
+            start, end = max(size - suffix, 0), size
+    except ValueError:
+        return ()
+    if start >= size:
+        return None
+    if end <= start:
+        return ()
+    return start, min(end, size)
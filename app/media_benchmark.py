@@ -0,0 +1,158 @@
+"""
+Compares local media serving through StaticFiles with app.media.
+
+Usage:
+    python -m app.media_benchmark [--size-mb 500] [--seeks 400] [--concurrency 8] [--json]
+
+Serves a generated file from each implementation under uvicorn and reports
+full-download throughput and the latency of random seeks: 256 KiB range
+requests at random offsets, as a player issues after a jump.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+from .media import media_response
+
+BENCH_DIR_ENV = "MEDIA_BENCHMARK_DIR"
+BENCH_FILENAME = "upload.mp4"
+SEEK_BYTES = 256 * 1024
+IMPLEMENTATIONS = ("staticfiles", "media_response")
+
+
+def staticfiles_app():
+    """The mounts the app used before app.media."""
+    app = FastAPI()
+    app.mount("/uploads", StaticFiles(directory=os.environ[BENCH_DIR_ENV]), name="uploads")
+    return app
+
+
+def media_response_app():
+    app = FastAPI()
+
+    @app.api_route("/uploads/{path:path}", methods=["GET", "HEAD"])
+    async def get_upload(request: Request, path: str):
+        return await media_response(request, os.environ[BENCH_DIR_ENV], path, "public, max-age=86400")
+
+    return app
+
+
+def generate_file(path: str, size_mb: int):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as file:
+        for _ in range(size_mb):
+            file.write(block)
+
+
+async def measure(base_url: str, size: int, seeks: int, concurrency: int, downloads: int) -> dict:
+    url = f"{base_url}/uploads/{BENCH_FILENAME}"
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        # Throughput: concurrent full downloads, bodies discarded as they arrive
+        async def download():
+            received = 0
+            async with client.stream("GET", url) as response:
+                async for chunk in response.aiter_raw():
+                    received += len(chunk)
+            return received
+
+        started = time.perf_counter()
+        received = sum(await asyncio.gather(*(download() for _ in range(downloads))))
+        throughput = received / (time.perf_counter() - started) / (1024 * 1024)
+
+        # Seeks: time until the whole requested range has arrived
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def seek():
+            start = random.randrange(0, size - SEEK_BYTES)
+            async with semaphore:
+                began = time.perf_counter()
+                response = await client.get(url, headers={"Range": f"bytes={start}-{start + SEEK_BYTES - 1}"})
+                elapsed = time.perf_counter() - began
+            if response.status_code != 206 or len(response.content) != SEEK_BYTES:
+                raise RuntimeError(f"Unexpected range response: {response.status_code}, {len(response.content)} bytes")
+            return elapsed
+
+        latencies = sorted(await asyncio.gather(*(seek() for _ in range(seeks))))
+
+    return {
+        "throughput_mb_s": round(throughput, 1),
+        "seek_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "seek_p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+    }
+
+
+def run_benchmark(size_mb: int, seeks: int, concurrency: int, downloads: int) -> list:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="media-bench-") as work_dir:
+        generate_file(os.path.join(work_dir, BENCH_FILENAME), size_mb)
+        for implementation in IMPLEMENTATIONS:
+            port = _free_port()
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", f"app.media_benchmark:{implementation}_app", "--factory",
+                 "--port", str(port), "--log-level", "warning"],
+                env={**os.environ, BENCH_DIR_ENV: work_dir},
+            )
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                _wait_for_server(base_url)
+                result = {"implementation": implementation}
+                result.update(asyncio.run(measure(base_url, size_mb * 1024 * 1024, seeks, concurrency, downloads)))
+                results.append(result)
+                print(f"  {implementation}: {result['throughput_mb_s']} MB/s, seek p99 {result['seek_p99_ms']} ms")
+            finally:
+                server.terminate()
+                server.wait()
+    return results
+
+
+def print_table(results: list):
+    columns = ["implementation", "throughput_mb_s", "seek_p50_ms", "seek_p99_ms"]
+    rows = [[str(r[c]) for c in columns] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(base_url: str, timeout: float = 15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.head(f"{base_url}/uploads/{BENCH_FILENAME}")
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark local media serving.")
+    parser.add_argument("--size-mb", type=int, default=500, help="Size of the served file.")
+    parser.add_argument("--seeks", type=int, default=400, help="Range requests to time.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once.")
+    parser.add_argument("--downloads", type=int, default=4, help="Full downloads for the throughput test.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    print(f"Benchmarking local media serving with a {args.size_mb} MB file...")
+    benchmark_results = run_benchmark(args.size_mb, args.seeks, args.concurrency, args.downloads)
+    if args.json:
+        print(json.dumps(benchmark_results, indent=2))
+    else:
+        print_table(benchmark_results)
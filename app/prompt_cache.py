@@ -0,0 +1,144 @@
+import threading
+import time
+from decouple import config
+from .database import get_db_connection, fetch_one
+
+VIEW_TYPES = ("audio", "video", "text")
+# How often a process re-reads the stored version to pick up edits made by
+# other processes. Edits made in this process are visible immediately.
+PROMPT_CACHE_CHECK_SECONDS = config("PROMPT_CACHE_CHECK_SECONDS", default=5.0, cast=float)
+
+_cache = {"version": None, "by_view": {}, "by_id": {}, "checked_at": 0.0}
+_lock = threading.Lock()
+
+
+class PromptError(Exception):
+    """Raised when a prompt edit is invalid."""
+
+
+def load_prompts():
+    """(Re)loads every prompt into memory together with the version it was read at."""
+    global _cache
+    conn = get_db_connection()
+    try:
+        version = _stored_version(conn)
+        rows = conn.execute(
+            "SELECT id, view_type, question, order_index FROM prompts ORDER BY view_type, order_index, id"
+        ).fetchall()
+    finally:
+        conn.close()
+
+    by_view = {view_type: [] for view_type in VIEW_TYPES}
+    for row in rows:
+        by_view.setdefault(row["view_type"], []).append(dict(row))
+    # Rebind to a complete new cache so readers never see a partial reload
+    _cache = {
+        "version": version,
+        "by_view": {view_type: tuple(prompts) for view_type, prompts in by_view.items()},
+        "by_id": {row["id"]: dict(row) for row in rows},
+        "checked_at": time.monotonic(),
+    }
+
+
+def get_prompts(view_type: str) -> tuple:
+    """Prompts for one view in display order, served from memory."""
+    _refresh_if_stale()
+    return _cache["by_view"].get(view_type, ())
+
+
+def get_prompt(prompt_id: int) -> dict:
+    _refresh_if_stale()
+    return _cache["by_id"].get(prompt_id)
+
+
+def cache_version() -> int:
+    _refresh_if_stale()
+    return _cache["version"]
+
+
+def add_prompt(view_type: str, question: str, order_index: int = None) -> dict:
+    """Adds a prompt, at the end of the view unless order_index is given."""
+    if view_type not in VIEW_TYPES:
+        raise PromptError(f"view_type must be one of: {', '.join(VIEW_TYPES)}")
+    if not question.strip():
+        raise PromptError("Question must not be empty.")
+    conn = get_db_connection()
+    try:
+        if order_index is None:
+            order_index = conn.execute(
+                "SELECT COALESCE(MAX(order_index), 0) + 1 FROM prompts WHERE view_type = ?", (view_type,)
+            ).fetchone()[0]
+        cursor = conn.execute(
+            "INSERT INTO prompts (view_type, question, order_index) VALUES (?, ?, ?)",
+            (view_type, question.strip(), order_index)
+        )
+        prompt_id = cursor.lastrowid
+        _bump_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    load_prompts()
+    return get_prompt(prompt_id)
+
+
+def update_prompt(prompt_id: int, question: str) -> dict:
+    if not question.strip():
+        raise PromptError("Question must not be empty.")
+    conn = get_db_connection()
+    try:
+        updated = conn.execute(
+            "UPDATE prompts SET question = ? WHERE id = ?", (question.strip(), prompt_id)
+        ).rowcount
+        if not updated:
+            raise PromptError("Prompt not found.")
+        _bump_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    load_prompts()
+    return get_prompt(prompt_id)
+
+
+def reorder_prompts(view_type: str, prompt_ids: list) -> tuple:
+    """Sets the display order of a view. prompt_ids must list every prompt of that view exactly once."""
+    conn = get_db_connection()
+    try:
+        current = {row["id"] for row in conn.execute("SELECT id FROM prompts WHERE view_type = ?", (view_type,))}
+        if not current or sorted(prompt_ids) != sorted(current):
+            raise PromptError(f"prompt_ids must contain each of the {view_type} prompts exactly once.")
+        conn.executemany(
+            "UPDATE prompts SET order_index = ? WHERE id = ?",
+            [(index, prompt_id) for index, prompt_id in enumerate(prompt_ids, start=1)]
+        )
+        _bump_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    load_prompts()
+    return get_prompts(view_type)
+
+
+def _refresh_if_stale():
+    now = time.monotonic()
+    if _cache["version"] is not None and now - _cache["checked_at"] < PROMPT_CACHE_CHECK_SECONDS:
+        return
+    with _lock:
+        if _cache["version"] is not None and now - _cache["checked_at"] < PROMPT_CACHE_CHECK_SECONDS:
+            return
+        stored = fetch_one("SELECT version FROM cache_versions WHERE name = 'prompts'")
+        if _cache["version"] is None or (stored and stored["version"] != _cache["version"]):
+            load_prompts()
+        else:
+            _cache["checked_at"] = now
+
+
+def _stored_version(conn) -> int:
+    row = conn.execute("SELECT version FROM cache_versions WHERE name = 'prompts'").fetchone()
+    return row["version"] if row else 0
+
+
+def _bump_version(conn):
+    conn.execute(
+        """INSERT INTO cache_versions (name, version) VALUES ('prompts', 1)
+           ON CONFLICT(name) DO UPDATE SET version = version + 1"""
+    )
@@ -0,0 +1,152 @@
+import json
+import struct
+import ffmpeg
+import numpy as np
+from .database import get_db_connection
+
+SAMPLE_RATE = 16000
+FRAME_MS = 50
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+# Frames decoded per read from ffmpeg. Memory stays bounded by this, not by the recording length.
+CHUNK_FRAMES = 1200  # one minute of audio
+PITCH_MIN_HZ = 70
+PITCH_MAX_HZ = 400
+VOICING_THRESHOLD = 0.45
+MIN_PAUSE_MS = 300
+
+
+def analyze_audio(input_path: str) -> dict:
+    """
+    Decodes the audio once and computes, per FRAME_MS frame:
+      peaks    - waveform peak, 0-255
+      loudness - RMS level in dBFS, -100 to 0
+      pitch    - fundamental frequency in Hz, 0 where unvoiced
+    plus a list of [start_ms, end_ms] pauses.
+    PCM is streamed from ffmpeg's stdout in fixed-size chunks.
+    """
+    process = (
+        ffmpeg
+        .input(input_path)
+        .output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=SAMPLE_RATE, vn=None)
+        .global_args('-loglevel', 'error')
+        .run_async(pipe_stdout=True)
+    )
+    peaks, loudness, pitch = [], [], []
+    chunk_bytes = CHUNK_FRAMES * FRAME_SAMPLES * 2
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype='<i2')
+            # Pad the final partial frame with silence
+            if len(samples) % FRAME_SAMPLES:
+                samples = np.pad(samples, (0, FRAME_SAMPLES - len(samples) % FRAME_SAMPLES))
+            frames = samples.reshape(-1, FRAME_SAMPLES).astype(np.float32) / 32768.0
+            chunk_peaks, chunk_loudness, chunk_pitch = _analyze_frames(frames)
+            peaks.append(chunk_peaks)
+            loudness.append(chunk_loudness)
+            pitch.append(chunk_pitch)
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode audio from {input_path}")
+
+    if not peaks:
+        raise ValueError(f"No audio decoded from {input_path}")
+    loudness = np.concatenate(loudness)
+    return {
+        "frame_ms": FRAME_MS,
+        "peaks": np.concatenate(peaks),
+        "loudness": loudness,
+        "pitch": np.concatenate(pitch),
+        "pauses": _find_pauses(loudness),
+    }
+
+
+def save_prosody(video_id: int, analysis: dict):
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            """INSERT OR REPLACE INTO prosody (video_id, frame_ms, frame_count, peaks, loudness, pitch, pauses)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (
+                video_id, analysis["frame_ms"], len(analysis["peaks"]),
+                analysis["peaks"].astype(np.uint8).tobytes(),
+                analysis["loudness"].astype(np.int8).tobytes(),
+                analysis["pitch"].astype('<u2').tobytes(),
+                json.dumps(analysis["pauses"]),
+            )
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_prosody(video_id: int) -> dict:
+    """Returns the stored arrays as NumPy arrays, or None if not analyzed yet or the video is deleted."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute("""SELECT p.* FROM prosody p JOIN videos v ON v.id = p.video_id AND v.deleted_at IS NULL
+               WHERE p.video_id = ?""", (video_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    return {
+        "frame_ms": row["frame_ms"],
+        "peaks": np.frombuffer(row["peaks"], dtype=np.uint8),
+        "loudness": np.frombuffer(row["loudness"], dtype=np.int8),
+        "pitch": np.frombuffer(row["pitch"], dtype='<u2'),
+        "pauses": json.loads(row["pauses"]),
+    }
+
+
+def encode_binary(prosody: dict) -> bytes:
+    """
+    Packs prosody for the browser:
+      uint32 LE header length, JSON header {frame_ms, frame_count, pauses},
+      then uint8 peaks[n], int8 loudness[n], uint16 LE pitch[n].
+    """
+    header = json.dumps({
+        "frame_ms": prosody["frame_ms"],
+        "frame_count": len(prosody["peaks"]),
+        "pauses": prosody["pauses"],
+    }).encode()
+    # Pad the header so the uint16 pitch array stays 2-byte aligned for a JS Uint16Array
+    header += b" " * (len(header) % 2)
+    return b"".join([
+        struct.pack("<I", len(header)), header,
+        prosody["peaks"].tobytes(), prosody["loudness"].tobytes(), prosody["pitch"].astype('<u2').tobytes(),
+    ])
+
+
+def _analyze_frames(frames: np.ndarray) -> tuple:
+    peaks = np.minimum(np.abs(frames).max(axis=1) * 255, 255).astype(np.uint8)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    loudness = np.clip(20 * np.log10(np.maximum(rms, 1e-5)), -100, 0).round().astype(np.int8)
+
+    # Autocorrelation of every frame at once via FFT; the strongest lag in the
+    # speech range gives F0, and its normalized strength decides voicing.
+    n_fft = 2 * FRAME_SAMPLES
+    centered = frames - frames.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(centered, n=n_fft, axis=1)
+    autocorr = np.fft.irfft(np.abs(spectrum) ** 2, n=n_fft, axis=1)[:, :FRAME_SAMPLES]
+    min_lag = SAMPLE_RATE // PITCH_MAX_HZ
+    max_lag = SAMPLE_RATE // PITCH_MIN_HZ
+    best_lag = np.argmax(autocorr[:, min_lag:max_lag], axis=1) + min_lag
+    energy = np.maximum(autocorr[:, 0], 1e-9)
+    strength = autocorr[np.arange(len(frames)), best_lag] / energy
+    voiced = (strength > VOICING_THRESHOLD) & (loudness > -50)
+    pitch = np.where(voiced, SAMPLE_RATE / best_lag, 0).round().astype(np.uint16)
+    return peaks, loudness, pitch
+
+
+def _find_pauses(loudness: np.ndarray) -> list:
+    """Finds runs of quiet frames of at least MIN_PAUSE_MS, relative to the recording's noise floor."""
+    threshold = np.clip(np.percentile(loudness, 10) + 12, -55, -30)
+    silent = np.concatenate([[False], loudness < threshold, [False]])
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    long_enough = (ends - starts) * FRAME_MS >= MIN_PAUSE_MS
+    return [[int(start) * FRAME_MS, int(end) * FRAME_MS] for start, end in zip(starts[long_enough], ends[long_enough])]
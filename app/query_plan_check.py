@@ -0,0 +1,55 @@
+"""
+Checks that the queries run on every page view are served by indexes.
+
+Usage:
+    python -m app.query_plan_check
+
+Applies pending migrations, then runs EXPLAIN QUERY PLAN on each hot query
+and exits non-zero if any step reads a whole table instead of an index.
+"""
+import sys
+from .database import create_tables, get_db_connection
+from .library import video_page_query, encode_cursor
+from .main import ANALYSIS_VIDEO_QUERY, VIDEO_NOTES_QUERY
+from .reports import REPORT_QUERY
+
+HOT_QUERIES = {
+    "read_root": video_page_query(),
+    "/api/videos (next page)": video_page_query(cursor=encode_cursor("2024-01-01 00:00:00", 1)),
+    "/api/videos (status + date range)": video_page_query(
+        status="ready", created_after="2024-01-01", created_before="2024-02-01"
+    ),
+    "analysis_page_factory (video)": (ANALYSIS_VIDEO_QUERY, (1,)),
+    "analysis_page_factory (notes)": (VIDEO_NOTES_QUERY, (1,)),
+    "report_page / report exports": (REPORT_QUERY, (1,)),
+}
+
+
+def query_plan(sql: str, params: tuple) -> list:
+    conn = get_db_connection()
+    try:
+        return [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    finally:
+        conn.close()
+
+
+def full_scans(plan: list) -> list:
+    """Plan steps that scan a table without an index. Walking an index in order is fine."""
+    return [step for step in plan if step.startswith("SCAN") and "USING" not in step]
+
+
+def check_query_plans() -> bool:
+    ok = True
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = query_plan(sql, params)
+        scans = full_scans(plan)
+        ok = ok and not scans
+        print(f"{'FAIL' if scans else 'ok  '}  {name}")
+        for step in plan:
+            print(f"        {step}")
+    return ok
+
+
+if __name__ == "__main__":
+    create_tables()
+    sys.exit(0 if check_query_plans() else 1)
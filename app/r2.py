@@ -1,4 +1,10 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from botocore.exceptions import ClientError
 from decouple import config
@@ -9,6 +15,28 @@ CLOUDFLARE_R2_ACCESS_KEY = config("CLOUDFLARE_R2_ACCESS_KEY", default=None)
 CLOUDFLARE_R2_SECRET_KEY = config("CLOUDFLARE_R2_SECRET_KEY", default=None)
 CLOUDFLARE_R2_BUCKET_NAME = config("CLOUDFLARE_R2_BUCKET_NAME", default=None)
 
+# --- Multipart Upload Configuration ---
+# R2 (like S3) requires every part except the last to be at least 5MiB.
+R2_MULTIPART_CHUNK_SIZE = config("R2_MULTIPART_CHUNK_SIZE", default=8 * 1024 * 1024, cast=int)
+R2_UPLOAD_CONCURRENCY = config("R2_UPLOAD_CONCURRENCY", default=4, cast=int)
+# Files uploaded at once when publishing a directory of small objects (HLS segments)
+R2_PUBLISH_CONCURRENCY = config("R2_PUBLISH_CONCURRENCY", default=16, cast=int)
+# S3's DeleteObjects limit, also used as the listing page size
+R2_DELETE_BATCH_SIZE = 1000
+
+# --- Client & Presigned URL Configuration ---
+# Shared by every thread in the process: page renders, upload parts and transfers.
+R2_MAX_POOL_CONNECTIONS = config("R2_MAX_POOL_CONNECTIONS", default=50, cast=int)
+R2_PRESIGNED_CACHE_SIZE = config("R2_PRESIGNED_CACHE_SIZE", default=1024, cast=int)
+# A cached URL is reused while at least this fraction of its lifetime remains,
+# so callers always get a URL that stays valid for a good while after rendering.
+R2_PRESIGNED_MIN_REMAINING = 0.5
+
+_r2_client = None
+_r2_client_lock = threading.Lock()
+_presigned_cache = OrderedDict()  # (object_name, expiration) -> (url, expires_at)
+_presigned_lock = threading.Lock()
+
 def is_r2_configured():
     """Check if all necessary R2 environment variables are set."""
     return all([
@@ -19,36 +47,177 @@ def is_r2_configured():
     ])
 
 def get_r2_client():
-    """Initialize and return a boto3 client for R2."""
+    """
+    Return the process-wide boto3 client for R2, creating it on first use.
+    boto3 clients are thread-safe, and reusing one keeps its connection pool warm.
+    """
+    global _r2_client
     if not is_r2_configured():
         return None
-    try:
-        return boto3.client(
-            's3',
-            endpoint_url=CLOUDFLARE_R2_ENDPOINT,
-            aws_access_key_id=CLOUDFLARE_R2_ACCESS_KEY,
-            aws_secret_access_key=CLOUDFLARE_R2_SECRET_KEY,
-            config=Config(signature_version='s3v4')
-        )
-    except Exception:
-        return None
+    if _r2_client is None:
+        with _r2_client_lock:
+            if _r2_client is None:
+                try:
+                    _r2_client = boto3.client(
+                        's3',
+                        endpoint_url=CLOUDFLARE_R2_ENDPOINT,
+                        aws_access_key_id=CLOUDFLARE_R2_ACCESS_KEY,
+                        aws_secret_access_key=CLOUDFLARE_R2_SECRET_KEY,
+                        config=Config(
+                            signature_version='s3v4',
+                            max_pool_connections=R2_MAX_POOL_CONNECTIONS,
+                            tcp_keepalive=True,
+                            retries={'max_attempts': 3, 'mode': 'standard'}
+                        )
+                    )
+                except Exception:
+                    return None
+    return _r2_client
 
 def upload_file_to_r2(file_obj, object_name: str):
-    """Upload a file-like object to R2."""
+    """
+    Upload a file-like object to R2.
+    Large files are split into multipart chunks uploaded concurrently.
+    This call blocks, so run it off the event loop.
+    """
     r2_client = get_r2_client()
     if not r2_client:
         raise ConnectionError("R2 client is not available or configured.")
 
+    transfer_config = TransferConfig(
+        multipart_threshold=R2_MULTIPART_CHUNK_SIZE,
+        multipart_chunksize=R2_MULTIPART_CHUNK_SIZE,
+        max_concurrency=R2_UPLOAD_CONCURRENCY,
+        use_threads=True
+    )
     try:
         r2_client.upload_fileobj(
             file_obj,
             CLOUDFLARE_R2_BUCKET_NAME,
-            object_name
+            object_name,
+            Config=transfer_config
         )
     except ClientError as e:
         print(f"Error uploading to R2: {e}")
         raise IOError("Could not upload file to R2.")
 
+def upload_local_file_to_r2(local_path: str, object_name: str, content_type: str = None, cache_control: str = None):
+    """Upload a file from local disk to R2."""
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    extra_args = {}
+    if content_type:
+        extra_args["ContentType"] = content_type
+    if cache_control:
+        extra_args["CacheControl"] = cache_control
+    try:
+        r2_client.upload_file(local_path, CLOUDFLARE_R2_BUCKET_NAME, object_name, ExtraArgs=extra_args or None)
+    except ClientError as e:
+        print(f"Error uploading {local_path} to R2: {e}")
+        raise IOError(f"Could not upload file to R2: {object_name}")
+
+def upload_files_to_r2(files: list):
+    """
+    Upload [(local_path, object_name, content_type, cache_control), ...] in
+    parallel, then check each object's size in R2 against the local file.
+    Raises IOError unless every file arrived intact, so callers can safely
+    delete their local copies once this returns.
+    """
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    def upload_and_verify(entry):
+        local_path, object_name, content_type, cache_control = entry
+        upload_local_file_to_r2(local_path, object_name, content_type, cache_control)
+        try:
+            size = r2_client.head_object(Bucket=CLOUDFLARE_R2_BUCKET_NAME, Key=object_name)["ContentLength"]
+        except ClientError as e:
+            print(f"Error verifying {object_name} in R2: {e}")
+            raise IOError(f"Could not verify upload to R2: {object_name}")
+        if size != os.path.getsize(local_path):
+            raise IOError(f"Upload to R2 is incomplete: {object_name}")
+
+    with ThreadPoolExecutor(max_workers=R2_PUBLISH_CONCURRENCY) as executor:
+        # Consuming the results re-raises the first failure
+        list(executor.map(upload_and_verify, files))
+
+def create_multipart_upload(object_name: str, content_type: str) -> str:
+    """Start a multipart upload in R2 and return its upload ID."""
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    try:
+        response = r2_client.create_multipart_upload(
+            Bucket=CLOUDFLARE_R2_BUCKET_NAME,
+            Key=object_name,
+            ContentType=content_type
+        )
+        return response["UploadId"]
+    except ClientError as e:
+        print(f"Error starting multipart upload to R2: {e}")
+        raise IOError(f"Could not start multipart upload: {object_name}")
+
+def upload_part_to_r2(object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+    """Upload one part of a multipart upload and return its ETag."""
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    try:
+        response = r2_client.upload_part(
+            Bucket=CLOUDFLARE_R2_BUCKET_NAME,
+            Key=object_name,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return response["ETag"]
+    except ClientError as e:
+        print(f"Error uploading part {part_number} to R2: {e}")
+        raise IOError(f"Could not upload part {part_number} of {object_name}")
+
+def complete_multipart_upload(object_name: str, upload_id: str, parts: list):
+    """Complete a multipart upload from a list of (part_number, etag) pairs."""
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    try:
+        r2_client.complete_multipart_upload(
+            Bucket=CLOUDFLARE_R2_BUCKET_NAME,
+            Key=object_name,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [{"PartNumber": number, "ETag": etag} for number, etag in sorted(parts)]
+            }
+        )
+    except ClientError as e:
+        print(f"Error completing multipart upload to R2: {e}")
+        raise IOError(f"Could not complete multipart upload: {object_name}")
+
+def abort_multipart_upload(object_name: str, upload_id: str):
+    """Abort a multipart upload so R2 discards its stored parts."""
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    try:
+        r2_client.abort_multipart_upload(
+            Bucket=CLOUDFLARE_R2_BUCKET_NAME,
+            Key=object_name,
+            UploadId=upload_id
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+            # Already aborted or completed; nothing is left to discard
+            return
+        print(f"Error aborting multipart upload to R2: {e}")
+        raise IOError(f"Could not abort multipart upload: {object_name}")
+
 def download_file_from_r2(object_name: str, destination_path: str):
     """Download a file from an R2 bucket."""
     r2_client = get_r2_client()
@@ -61,8 +230,33 @@ def download_file_from_r2(object_name: str, destination_path: str):
         print(f"Error downloading file from R2: {e}")
         raise IOError(f"Could not download file from R2: {object_name}")
 
+def read_file_from_r2(object_name: str) -> bytes:
+    """Read a small object from R2 into memory."""
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    try:
+        response = r2_client.get_object(Bucket=CLOUDFLARE_R2_BUCKET_NAME, Key=object_name)
+        return response["Body"].read()
+    except ClientError as e:
+        print(f"Error reading file from R2: {e}")
+        raise IOError(f"Could not read file from R2: {object_name}")
+
 def generate_presigned_url(object_name: str, expiration: int = 3600) -> str:
-    """Generate a presigned URL to share an R2 object."""
+    """
+    Generate a presigned URL to share an R2 object.
+    URLs are cached per object and reused until half their lifetime is used
+    up, so repeated renders skip signing and browsers see a stable URL.
+    """
+    key = (object_name, expiration)
+    now = time.time()
+    with _presigned_lock:
+        cached = _presigned_cache.get(key)
+        if cached and cached[1] - now >= expiration * R2_PRESIGNED_MIN_REMAINING:
+            _presigned_cache.move_to_end(key)
+            return cached[0]
+
     r2_client = get_r2_client()
     if not r2_client:
         return None
@@ -73,11 +267,23 @@ def generate_presigned_url(object_name: str, expiration: int = 3600) -> str:
             Params={'Bucket': CLOUDFLARE_R2_BUCKET_NAME, 'Key': object_name},
             ExpiresIn=expiration
         )
-        return response
     except ClientError as e:
         print(f"Error generating presigned URL: {e}")
         return None
 
+    with _presigned_lock:
+        _presigned_cache[key] = (response, now + expiration)
+        _presigned_cache.move_to_end(key)
+        while len(_presigned_cache) > R2_PRESIGNED_CACHE_SIZE:
+            _presigned_cache.popitem(last=False)
+    return response
+
+def forget_presigned_urls(object_name: str):
+    """Drop cached URLs for an object, e.g. once it has been deleted."""
+    with _presigned_lock:
+        for key in [key for key in _presigned_cache if key[0] == object_name]:
+            del _presigned_cache[key]
+
 def delete_file_from_r2(object_name: str):
     """Delete a file from an R2 bucket."""
     r2_client = get_r2_client()
@@ -86,10 +292,79 @@ def delete_file_from_r2(object_name: str):
 
     try:
         r2_client.delete_object(Bucket=CLOUDFLARE_R2_BUCKET_NAME, Key=object_name)
+        forget_presigned_urls(object_name)
     except ClientError as e:
         print(f"Error deleting file from R2: {e}")
         raise IOError(f"Could not delete file from R2: {object_name}")
 
+def delete_files_from_r2(object_names: list) -> dict:
+    """
+    Delete objects with DeleteObjects, up to 1000 per request.
+    Returns {object_name: error} for the objects that could not be deleted.
+    """
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    failed = {}
+    for start in range(0, len(object_names), R2_DELETE_BATCH_SIZE):
+        batch = object_names[start:start + R2_DELETE_BATCH_SIZE]
+        try:
+            response = r2_client.delete_objects(
+                Bucket=CLOUDFLARE_R2_BUCKET_NAME,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+        except ClientError as e:
+            print(f"Error deleting {len(batch)} file(s) from R2: {e}")
+            failed.update((key, str(e)) for key in batch)
+            continue
+        errors = {error["Key"]: error.get("Message", error.get("Code")) for error in response.get("Errors", [])}
+        failed.update(errors)
+        for key in batch:
+            if key not in errors:
+                forget_presigned_urls(key)
+    return failed
+
+def delete_prefix_from_r2(prefix: str) -> int:
+    """Delete every object whose key starts with prefix. Returns how many were deleted."""
+    deleted = 0
+    for page in _list_pages(prefix):
+        keys = [obj["Key"] for obj in page.get("Contents", [])]
+        if not keys:
+            continue
+        failed = delete_files_from_r2(keys)
+        if failed:
+            raise IOError(f"Could not delete {len(failed)} object(s) under {prefix}")
+        deleted += len(keys)
+    return deleted
+
+def list_files_in_r2(prefix: str):
+    """Yield (object_name, last_modified) for every object whose key starts with prefix."""
+    for page in _list_pages(prefix):
+        for obj in page.get("Contents", []):
+            yield obj["Key"], obj["LastModified"]
+
+def list_folders_in_r2(prefix: str):
+    """Yield the distinct "folders" directly under prefix, e.g. derived/1/ for prefix derived/."""
+    for page in _list_pages(prefix, delimiter="/"):
+        for common_prefix in page.get("CommonPrefixes", []):
+            yield common_prefix["Prefix"]
+
+def _list_pages(prefix: str, delimiter: str = None):
+    r2_client = get_r2_client()
+    if not r2_client:
+        raise ConnectionError("R2 client is not available or configured.")
+
+    params = {"Bucket": CLOUDFLARE_R2_BUCKET_NAME, "Prefix": prefix,
+              "PaginationConfig": {"PageSize": R2_DELETE_BATCH_SIZE}}
+    if delimiter:
+        params["Delimiter"] = delimiter
+    try:
+        yield from r2_client.get_paginator("list_objects_v2").paginate(**params)
+    except ClientError as e:
+        print(f"Error listing {prefix} in R2: {e}")
+        raise IOError(f"Could not list files in R2: {prefix}")
+
 def test_r2_connection():
     """Test the connection to R2 by listing buckets."""
     r2_client = get_r2_client()
@@ -0,0 +1,335 @@
+import io
+import json
+import os
+import re
+import textwrap
+import time
+import zipfile
+from decouple import config
+from .database import get_db_connection, fetch_all
+from .prompt_cache import get_prompt, get_prompts, cache_version
+from .r2 import is_r2_configured, upload_files_to_r2, list_files_in_r2, delete_files_from_r2
+
+# Each video's report is stored ready to render: its notes grouped by
+# section in prompt order. Saving a note updates that one entry in the same
+# transaction, so viewing a report is a single primary-key read. A report
+# built under an older prompt cache version is rebuilt on its next read,
+# since prompt edits and reorders change its questions and order.
+REPORT_SECTIONS = (("audio", "Audio Image"), ("video", "Video Image"), ("text", "Audio Transcription"))
+REPORT_FORMATS = {
+    "json": ("application/json", "json"),
+    "markdown": ("text/markdown; charset=utf-8", "md"),
+    "pdf": ("application/pdf", "pdf"),
+}
+# Run on every report view; checked by app.query_plan_check
+REPORT_QUERY = """SELECT r.video_id, r.title, r.sections, r.revision, r.prompts_version FROM reports r
+                  JOIN videos v ON v.id = r.video_id AND v.deleted_at IS NULL
+                  WHERE r.video_id = ?"""
+EXPORTS_DIR = "exports"
+EXPORTS_PREFIX = "exports/"
+EXPORT_RETENTION_SECONDS = config("EXPORT_RETENTION_SECONDS", default=86400, cast=int)
+
+
+def save_notes(video_id: int, view_type: str, notes: list) -> dict:
+    """
+    Saves notes, each {"prompt_id", "content", "version"}, and applies them
+    to the video's stored report in one transaction. A note is written only
+    if its stored version (0 if there is none) still equals "version"; one
+    without "version" is always written. Returns {"saved": [{"prompt_id",
+    "version"}], "conflicts": [{"prompt_id", "version", "content"}]}, or None
+    if the video doesn't exist.
+    """
+    conn = get_db_connection()
+    try:
+        if not conn.execute("SELECT 1 FROM videos WHERE id = ? AND deleted_at IS NULL", (video_id,)).fetchone():
+            return None
+        saved, conflicts = [], []
+        for note in notes:
+            row = conn.execute(
+                """INSERT INTO notes (video_id, prompt_id, view_type, content)
+                   VALUES (?1, ?2, ?3, ?4)
+                   ON CONFLICT(video_id, prompt_id) DO UPDATE SET
+                   content = excluded.content,
+                   version = notes.version + 1,
+                   created_at = CURRENT_TIMESTAMP
+                   WHERE ?5 IS NULL OR notes.version = ?5
+                   RETURNING version""",
+                (video_id, note["prompt_id"], view_type, note["content"], note.get("version"))
+            ).fetchone()
+            if row:
+                saved.append({"prompt_id": note["prompt_id"], "version": row["version"], "content": note["content"]})
+            else:
+                current = conn.execute(
+                    "SELECT version, content FROM notes WHERE video_id = ? AND prompt_id = ?",
+                    (video_id, note["prompt_id"])
+                ).fetchone()
+                conflicts.append({"prompt_id": note["prompt_id"], "version": current["version"], "content": current["content"]})
+        if saved:
+            _apply_notes(conn, video_id, saved)
+        conn.commit()
+    finally:
+        conn.close()
+    return {
+        "saved": [{"prompt_id": note["prompt_id"], "version": note["version"]} for note in saved],
+        "conflicts": conflicts,
+    }
+
+
+def get_report(video_id: int) -> dict:
+    """
+    The stored report, {"video_id", "title", "sections", "etag"}, building it
+    first if it is missing or stale. Returns None if the video doesn't exist.
+    """
+    conn = get_db_connection()
+    try:
+        report = conn.execute(REPORT_QUERY, (video_id,)).fetchone()
+        if not report or report["prompts_version"] != cache_version():
+            if not conn.execute("SELECT 1 FROM videos WHERE id = ? AND deleted_at IS NULL", (video_id,)).fetchone():
+                return None
+            _build_report(conn, video_id)
+            conn.commit()
+            report = conn.execute(REPORT_QUERY, (video_id,)).fetchone()
+    finally:
+        conn.close()
+    return {
+        "video_id": report["video_id"],
+        "title": report["title"],
+        "sections": json.loads(report["sections"]),
+        "etag": f'"report-{report["video_id"]}-{report["revision"]}-{report["prompts_version"]}"',
+    }
+
+
+def render_report(report: dict, report_format: str):
+    """Yields the report as bytes in the given REPORT_FORMATS format."""
+    if report_format == "json":
+        yield json.dumps({key: report[key] for key in ("video_id", "title", "sections")}).encode()
+    elif report_format == "markdown":
+        yield from (chunk.encode() for chunk in _markdown_chunks(report))
+    elif report_format == "pdf":
+        yield from _pdf_chunks(report)
+    else:
+        raise ValueError(f"format must be one of: {', '.join(REPORT_FORMATS)}")
+
+
+def report_filename(report: dict, report_format: str) -> str:
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "-", os.path.splitext(report["title"])[0]).strip("-") or "video"
+    return f"report-{report['video_id']}-{stem}.{REPORT_FORMATS[report_format][1]}"
+
+
+def export_reports_task(export_id: str, report_format: str):
+    """
+    Job queue task: writes the report of every video with notes into one zip
+    (EXPORTS_DIR, then R2 in R2 mode) and removes exports past their retention.
+    """
+    _remove_expired_exports()
+    videos = fetch_all(
+        """SELECT id FROM videos v WHERE deleted_at IS NULL
+           AND EXISTS (SELECT 1 FROM notes n WHERE n.video_id = v.id) ORDER BY id"""
+    )
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    filename = export_filename(export_id)
+    path = os.path.join(EXPORTS_DIR, filename)
+    temp_path = f"{path}.partial"
+    with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for video in videos:
+            report = get_report(video["id"])
+            if not report:
+                continue
+            with archive.open(report_filename(report, report_format), "w") as entry:
+                for chunk in render_report(report, report_format):
+                    entry.write(chunk)
+    os.replace(temp_path, path)
+
+    if is_r2_configured():
+        upload_files_to_r2([(path, f"{EXPORTS_PREFIX}{filename}", "application/zip", "private, no-cache")])
+        os.remove(path)
+    print(f"Exported {len(videos)} report(s) as {report_format} to {filename}.")
+
+
+def export_filename(export_id: str) -> str:
+    return f"reports-{export_id}.zip"
+
+
+def _build_report(conn, video_id: int):
+    """Rebuilds a report from the video's notes, in the caller's transaction."""
+    video = conn.execute("SELECT original_filename FROM videos WHERE id = ?", (video_id,)).fetchone()
+    if not video:
+        return
+    notes = conn.execute("SELECT prompt_id, content FROM notes WHERE video_id = ?", (video_id,)).fetchall()
+    content_by_prompt = {note["prompt_id"]: note["content"] for note in notes}
+    sections = [
+        {
+            "view_type": view_type,
+            "title": title,
+            "notes": [
+                {"prompt_id": prompt["id"], "question": prompt["question"], "content": content_by_prompt[prompt["id"]]}
+                for prompt in get_prompts(view_type)
+                if prompt["id"] in content_by_prompt
+            ],
+        }
+        for view_type, title in REPORT_SECTIONS
+    ]
+    _store_report(conn, video_id, video["original_filename"], sections, cache_version())
+
+
+def _apply_notes(conn, video_id: int, notes: list):
+    """Applies saved notes to the stored report, or rebuilds it if it is missing or stale."""
+    report = conn.execute(
+        "SELECT title, sections, prompts_version FROM reports WHERE video_id = ?", (video_id,)
+    ).fetchone()
+    prompts = [get_prompt(note["prompt_id"]) for note in notes]
+    version = cache_version()
+    if report and all(prompts) and report["prompts_version"] == version:
+        sections = json.loads(report["sections"])
+        for prompt, note in zip(prompts, notes):
+            _apply_note(sections, prompt, note["content"])
+        _store_report(conn, video_id, report["title"], sections, version)
+    else:
+        _build_report(conn, video_id)
+
+
+def _apply_note(sections: list, prompt: dict, content: str):
+    """Sets one note in a stored report, keeping its section in prompt order."""
+    section = next((section for section in sections if section["view_type"] == prompt["view_type"]), None)
+    if section is None:
+        return
+    notes = [note for note in section["notes"] if note["prompt_id"] != prompt["id"]]
+    notes.append({"prompt_id": prompt["id"], "question": prompt["question"], "content": content})
+    order = {entry["id"]: index for index, entry in enumerate(get_prompts(prompt["view_type"]))}
+    section["notes"] = sorted(notes, key=lambda note: order.get(note["prompt_id"], len(order)))
+
+
+def _store_report(conn, video_id: int, title: str, sections: list, prompts_version: int):
+    conn.execute(
+        """INSERT INTO reports (video_id, title, sections, revision, prompts_version)
+           VALUES (?, ?, ?, 1, ?)
+           ON CONFLICT(video_id) DO UPDATE SET
+           title = excluded.title,
+           sections = excluded.sections,
+           revision = revision + 1,
+           prompts_version = excluded.prompts_version,
+           updated_at = CURRENT_TIMESTAMP""",
+        (video_id, title, json.dumps(sections), prompts_version)
+    )
+
+
+def _remove_expired_exports():
+    cutoff = time.time() - EXPORT_RETENTION_SECONDS
+    if os.path.isdir(EXPORTS_DIR):
+        for entry in os.scandir(EXPORTS_DIR):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+    if is_r2_configured():
+        expired = [name for name, modified in list_files_in_r2(EXPORTS_PREFIX) if modified.timestamp() < cutoff]
+        if expired:
+            delete_files_from_r2(expired)
+
+
+def _markdown_chunks(report: dict):
+    yield f"# Public Speaking Analysis Report\n\n_{report['title']}_\n"
+    sections = [section for section in report["sections"] if section["notes"]]
+    if not sections:
+        yield "\nNo notes have been added yet.\n"
+    for section in sections:
+        yield f"\n## {section['title']}\n"
+        for note in section["notes"]:
+            yield f"\n### {note['question']}\n\n{note['content']}\n"
+
+
+# --- PDF ---
+# A minimal text-only PDF writer, so exports need no extra dependency. Text
+# uses the standard Helvetica fonts, so characters outside Windows-1252 become "?".
+PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT = 595, 842  # A4 in points
+PDF_MARGIN = 56
+PDF_STYLES = {
+    # style: (font resource, size, leading, characters per line)
+    "title": ("F2", 18, 26, 48),
+    "heading": ("F2", 14, 22, 62),
+    "question": ("F2", 11, 16, 80),
+    "body": ("F1", 11, 15, 88),
+    "blank": ("F1", 11, 8, 88),
+}
+
+
+def _pdf_lines(report: dict):
+    yield "title", "Public Speaking Analysis Report"
+    yield "body", report["title"]
+    sections = [section for section in report["sections"] if section["notes"]]
+    if not sections:
+        yield "blank", ""
+        yield "body", "No notes have been added yet."
+    for section in sections:
+        yield "blank", ""
+        yield "heading", section["title"]
+        for note in section["notes"]:
+            yield "blank", ""
+            yield "question", note["question"]
+            for paragraph in (note["content"] or "").splitlines() or [""]:
+                yield "body", paragraph
+
+
+def _pdf_pages(report: dict):
+    """Lays out wrapped lines and yields each page's content stream."""
+    commands, y = [], PDF_PAGE_HEIGHT - PDF_MARGIN
+    for style, text in _pdf_lines(report):
+        font, size, leading, width = PDF_STYLES[style]
+        for line in textwrap.wrap(text, width) or [""]:
+            if y - leading < PDF_MARGIN:
+                yield "\n".join(commands).encode("cp1252")
+                commands, y = [], PDF_PAGE_HEIGHT - PDF_MARGIN
+            y -= leading
+            if line:
+                commands.append(f"BT /{font} {size} Tf {PDF_MARGIN} {y} Td ({_pdf_escape(line)}) Tj ET")
+    yield "\n".join(commands).encode("cp1252")
+
+
+def _pdf_chunks(report: dict):
+    """
+    Streams the PDF page by page. Objects 1-4 are the catalog, page tree and
+    fonts; each page adds a page and a content object. The page tree, which
+    lists every page, is written last, once the page count is known.
+    """
+    offsets = {}
+    position = 0
+
+    def emit(number: int, body: bytes) -> bytes:
+        nonlocal position
+        offsets[number] = position
+        chunk = f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+        position += len(chunk)
+        return chunk
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    yield emit(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    yield emit(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    page_numbers = []
+    number = 5
+    for content in _pdf_pages(report):
+        page_numbers.append(number)
+        yield emit(number, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PDF_PAGE_WIDTH} {PDF_PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {number + 1} 0 R >>"
+        ).encode())
+        yield emit(number + 1, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        number += 2
+
+    kids = " ".join(f"{page} 0 R" for page in page_numbers)
+    yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_numbers)} >>".encode())
+
+    xref = io.StringIO()
+    xref.write(f"xref\n0 {number}\n0000000000 65535 f \n")
+    for object_number in range(1, number):
+        xref.write(f"{offsets[object_number]:010d} 00000 n \n")
+    xref.write(f"trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n")
+    yield xref.getvalue().encode()
+
+
+def _pdf_escape(text: str) -> str:
+    # The fonts use WinAnsiEncoding, which is cp1252: smart quotes, dashes and
+    # ellipses survive, and anything else becomes "?"
+    text = text.encode("cp1252", "replace").decode("cp1252")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
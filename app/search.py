@@ -0,0 +1,89 @@
+import html
+import re
+from .database import get_db_connection
+
+# snippet() wraps matches in these control characters; the text is escaped
+# afterwards and they become <mark> tags, so transcripts can't inject markup.
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+SNIPPET_TOKENS = 16
+
+QUERY_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 query: every word must match, and the last
+    word also matches as a prefix so results update while typing.
+    User input never reaches FTS5 syntax unquoted.
+    """
+    words = QUERY_TOKEN_PATTERN.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(query: str, limit: int = 20, offset: int = 0) -> dict:
+    """
+    Ranked full-text search over video transcripts, file names and notes.
+    Both indexes are queried with bm25 and merged in one ordered result set.
+    """
+    match_query = build_match_query(query)
+    if not match_query:
+        return {"query": query, "results": [], "limit": limit, "offset": offset, "has_more": False}
+
+    # Each index returns only its own top offset + limit + 1 rows (FTS5 keeps
+    # a top-N heap for ORDER BY rank), so the merge stays small however many
+    # recordings there are.
+    window = offset + limit + 1
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT * FROM (
+                SELECT 'video' AS type, v.id AS video_id, v.original_filename, NULL AS note_id, NULL AS question,
+                       snippet(videos_fts, -1, ?, ?, '…', {SNIPPET_TOKENS}) AS snippet, videos_fts.rank AS score
+                FROM videos_fts JOIN videos v ON v.id = videos_fts.rowid
+                WHERE videos_fts MATCH ? AND v.deleted_at IS NULL
+                ORDER BY videos_fts.rank LIMIT ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'note' AS type, n.video_id, v.original_filename, n.id AS note_id, p.question,
+                       snippet(notes_fts, 0, ?, ?, '…', {SNIPPET_TOKENS}) AS snippet, notes_fts.rank AS score
+                FROM notes_fts
+                JOIN notes n ON n.id = notes_fts.rowid
+                JOIN videos v ON v.id = n.video_id
+                JOIN prompts p ON p.id = n.prompt_id
+                WHERE notes_fts MATCH ? AND v.deleted_at IS NULL
+                ORDER BY notes_fts.rank LIMIT ?
+            )
+            ORDER BY score
+            LIMIT ? OFFSET ?
+            """,
+            (MATCH_START, MATCH_END, match_query, window,
+             MATCH_START, MATCH_END, match_query, window, limit + 1, offset)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    results = [
+        {
+            "type": row["type"],
+            "video_id": row["video_id"],
+            "original_filename": row["original_filename"],
+            "note_id": row["note_id"],
+            "question": row["question"],
+            "snippet": _highlight(row["snippet"]),
+            "score": -row["score"],
+        }
+        for row in rows[:limit]
+    ]
+    return {"query": query, "results": results, "limit": limit, "offset": offset, "has_more": len(rows) > limit}
+
+
+def _highlight(snippet: str) -> str:
+    escaped = html.escape(snippet or "")
+    return escaped.replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
@@ -8,10 +8,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app.database import get_db_connection, create_tables
 
 def seed_prompts():
-    """Seed the database with initial prompts for each view."""
-    # First, ensure tables exist
-    create_tables()
-
+    """Seed the database with initial prompts for each view. Expects create_tables() to have run."""
     prompts = [
         # Video Prompts (Body Language)
         ('video', 'How do you use your hands?',  1),
@@ -55,5 +52,6 @@ def seed_prompts():
 
 if __name__ == "__main__":
     print("Seeding prompts into the database...")
+    create_tables()
     seed_prompts()
     print("Seeding complete.")
\ No newline at end of file
@@ -0,0 +1,123 @@
+// Note autosave for the audio, video and text pages. Edits are coalesced
+// per prompt and sent together to /api/notes/batch once typing pauses, so an
+// editing session costs a few write transactions rather than one per pause
+// in every textarea. Each note carries the version it was loaded or last
+// saved at; the server refuses a write based on an older version, which
+// means the note was changed in another tab.
+const NOTE_SAVE_DELAY_MS = 1500;
+// Save at least this often while someone types without pausing
+const NOTE_MAX_WAIT_MS = 10000;
+
+function loadNotes() {
+    const notes = {};
+    JSON.parse(document.getElementById('notes-data').textContent).forEach(prompt => {
+        notes[prompt.id] = { content: prompt.content || '', version: prompt.version };
+    });
+    return notes;
+}
+
+function noteSaver(videoId, viewType) {
+    return {
+        videoId: videoId,
+        viewType: viewType,
+        notes: loadNotes(),
+        status: {},
+        // The text of a local edit that lost to another tab's save, by prompt id
+        conflicts: {},
+        pendingNotes: {},
+        noteTimer: null,
+        firstPendingAt: null,
+        saving: false,
+        listening: false,
+
+        queueNote(promptId) {
+            if (!this.listening) {
+                // Send whatever is still queued when the page is left or hidden
+                this.listening = true;
+                window.addEventListener('pagehide', () => this.flushNotes(true));
+                document.addEventListener('visibilitychange', () => {
+                    if (document.visibilityState === 'hidden') this.flushNotes(true);
+                });
+            }
+            this.pendingNotes[promptId] = true;
+            this.status[promptId] = { message: 'Unsaved changes', saved: false };
+            const now = Date.now();
+            this.firstPendingAt = this.firstPendingAt || now;
+            clearTimeout(this.noteTimer);
+            const delay = Math.min(NOTE_SAVE_DELAY_MS, this.firstPendingAt + NOTE_MAX_WAIT_MS - now);
+            this.noteTimer = setTimeout(() => this.flushNotes(false), Math.max(delay, 0));
+        },
+        flushNotes(leaving) {
+            clearTimeout(this.noteTimer);
+            const promptIds = Object.keys(this.pendingNotes);
+            if (!promptIds.length) return;
+            if (this.saving && !leaving) {
+                // Versions change when the request in flight returns; send after it
+                this.noteTimer = setTimeout(() => this.flushNotes(false), NOTE_SAVE_DELAY_MS);
+                return;
+            }
+            const batch = promptIds.map(promptId => ({
+                prompt_id: Number(promptId),
+                content: this.notes[promptId].content,
+                version: this.notes[promptId].version
+            }));
+            this.pendingNotes = {};
+            this.firstPendingAt = null;
+            this.saving = true;
+            batch.forEach(note => { this.status[note.prompt_id] = { message: 'Saving...', saved: false }; });
+
+            fetch('/api/notes/batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ video_id: this.videoId, view_type: this.viewType, notes: batch }),
+                keepalive: leaving
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status !== 'success') {
+                    this.requeueNotes(batch, `Error: ${data.detail || 'Unknown error'}`);
+                    return;
+                }
+                data.saved.forEach(note => {
+                    this.notes[note.prompt_id].version = note.version;
+                    if (!this.pendingNotes[note.prompt_id]) {
+                        this.showNoteStatus(note.prompt_id, 'Saved!', true);
+                    }
+                });
+                data.conflicts.forEach(note => {
+                    // Keep the local text (including edits made since) so it can be restored
+                    this.conflicts[note.prompt_id] = this.notes[note.prompt_id].content;
+                    this.notes[note.prompt_id] = { content: note.content, version: note.version };
+                    delete this.pendingNotes[note.prompt_id];
+                    this.status[note.prompt_id] = { message: '', saved: false };
+                });
+            })
+            .catch(() => this.requeueNotes(batch, 'Error: Could not connect to server.'))
+            .finally(() => {
+                this.saving = false;
+            });
+        },
+        requeueNotes(batch, message) {
+            batch.forEach(note => {
+                this.pendingNotes[note.prompt_id] = true;
+                this.showNoteStatus(note.prompt_id, message, false);
+            });
+            // Retry later; a new edit sends them sooner
+            clearTimeout(this.noteTimer);
+            this.noteTimer = setTimeout(() => this.flushNotes(false), NOTE_MAX_WAIT_MS);
+        },
+        keepMyNote(promptId) {
+            this.notes[promptId].content = this.conflicts[promptId];
+            delete this.conflicts[promptId];
+            this.queueNote(promptId);
+        },
+        showNoteStatus(promptId, message, saved) {
+            this.status[promptId] = { message: message, saved: saved };
+            setTimeout(() => {
+                if (this.status[promptId]?.message === message) {
+                    this.status[promptId] = { message: '', saved: false };
+                }
+            }, 2000);
+        }
+    };
+}
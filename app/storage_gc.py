@@ -0,0 +1,258 @@
+import os
+import re
+import shutil
+import time
+from decouple import config
+from .blobs import release_blob
+from .database import get_db_connection, fetch_all
+from .jobs import enqueue_job
+from .r2 import is_r2_configured, delete_files_from_r2, delete_prefix_from_r2, list_files_in_r2, list_folders_in_r2
+from .uploads import UPLOADS_DIR
+from .video_processing import HLS_PLAYLIST_DIR
+
+# Deleting a video only sets videos.deleted_at, so the request returns at once
+# and the video disappears from every page. The sweeper then releases each
+# tombstoned video in its own transaction, queueing its files in
+# storage_deletions, and removes queued files in batches. A file leaves the
+# queue only once it is gone, so failures are retried by the next sweep.
+# Both periodic tasks reschedule themselves and are enqueued with
+# max_attempts=1, so a failed run is never retried alongside the next one.
+STORAGE_SWEEP_SECONDS = config("STORAGE_SWEEP_SECONDS", default=60, cast=int)
+# Tombstoned videos keep their files this long, so jobs already running for them can finish
+DELETE_GRACE_SECONDS = config("DELETE_GRACE_SECONDS", default=60, cast=int)
+# How often storage is listed and compared with the videos table to find leaked files
+STORAGE_RECONCILE_SECONDS = config("STORAGE_RECONCILE_SECONDS", default=86400, cast=int)
+# Uploads are stored before their row is written, so younger files are never treated as leaked
+ORPHAN_MIN_AGE_SECONDS = 3600
+SWEEP_BATCH_SIZE = 500
+DELETION_BATCH_SIZE = 5000
+
+# Uploads are stored as video_<random>.<ext>; derived files under a directory
+# or prefix named after the video id. Nothing else is ever reclaimed.
+UPLOAD_NAME_PREFIX = "video_"
+DERIVED_PREFIX = "derived/"
+# Artifact URLs and keys that point into a video's derived storage
+ARTIFACT_ID_PATTERN = re.compile(rf"(?:^|/)(?:derived|hls|{HLS_PLAYLIST_DIR})/(\d+)/")
+
+
+def tombstone_videos(video_ids: list) -> list:
+    """Marks videos deleted. Returns the ids that existed and weren't already deleted."""
+    if not video_ids:
+        return []
+    placeholders = ", ".join("?" for _ in video_ids)
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            f"""UPDATE videos SET deleted_at = CURRENT_TIMESTAMP
+                WHERE id IN ({placeholders}) AND deleted_at IS NULL RETURNING id""",
+            tuple(video_ids)
+        ).fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    return sorted(row["id"] for row in rows)
+
+
+def sweep_deleted_videos():
+    """
+    Job queue task: releases videos tombstoned more than DELETE_GRACE_SECONDS
+    ago, removes queued files, then schedules the next sweep.
+    """
+    try:
+        tombstoned = fetch_all(
+            """SELECT id FROM videos
+               WHERE deleted_at IS NOT NULL AND deleted_at <= datetime('now', ?)
+               ORDER BY deleted_at LIMIT ?""",
+            (f"-{DELETE_GRACE_SECONDS} seconds", SWEEP_BATCH_SIZE)
+        )
+        for video in tombstoned:
+            try:
+                _release_video(video["id"])
+            except Exception as e:
+                print(f"Could not release deleted video_id {video['id']}: {e}")
+        if tombstoned:
+            print(f"Released {len(tombstoned)} deleted video(s).")
+        delete_queued_files()
+    finally:
+        enqueue_job("maintenance", sweep_deleted_videos, delay=STORAGE_SWEEP_SECONDS, max_attempts=1)
+
+
+def delete_queued_files() -> int:
+    """
+    Removes files queued in storage_deletions: R2 objects with DeleteObjects
+    in batches of 1000, prefixes and local paths one by one. Returns how many
+    were removed; the rest stay queued with their error.
+    """
+    queued = fetch_all("SELECT id, kind, path FROM storage_deletions ORDER BY id LIMIT ?", (DELETION_BATCH_SIZE,))
+    if not queued:
+        return 0
+    errors = {}
+
+    objects = {row["path"]: row["id"] for row in queued if row["kind"] == "r2_object"}
+    if objects:
+        try:
+            for path, error in delete_files_from_r2(list(objects)).items():
+                errors[objects[path]] = error
+        except Exception as e:
+            errors.update((deletion_id, str(e)) for deletion_id in objects.values())
+
+    for row in queued:
+        try:
+            if row["kind"] == "r2_prefix":
+                delete_prefix_from_r2(row["path"])
+            elif row["kind"] == "local_file":
+                if os.path.exists(row["path"]):
+                    os.remove(row["path"])
+            elif row["kind"] == "local_dir":
+                if os.path.exists(row["path"]):
+                    shutil.rmtree(row["path"])
+        except Exception as e:
+            errors[row["id"]] = str(e)
+
+    conn = get_db_connection()
+    try:
+        conn.executemany("DELETE FROM storage_deletions WHERE id = ?", [
+            (row["id"],) for row in queued if row["id"] not in errors
+        ])
+        conn.executemany(
+            "UPDATE storage_deletions SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+            [(error, deletion_id) for deletion_id, error in errors.items()]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    removed = len(queued) - len(errors)
+    print(f"Deleted {removed} stored file(s); {len(errors)} failed and stay queued.")
+    return removed
+
+
+def reconcile_storage():
+    """
+    Job queue task: lists uploads and derived files in R2 and on disk, queues
+    the ones no video references for deletion, then schedules the next run.
+    """
+    try:
+        queued = _queue_deletions(find_orphaned_files())
+        if queued:
+            print(f"Queued {queued} leaked file(s) for deletion.")
+    finally:
+        enqueue_job("maintenance", reconcile_storage, delay=STORAGE_RECONCILE_SECONDS, max_attempts=1)
+
+
+def find_orphaned_files() -> list:
+    """(kind, path) of stored uploads and derived files that no video, blob or upload session references."""
+    conn = get_db_connection()
+    try:
+        filenames = {row[0] for row in conn.execute(
+            """SELECT filename FROM videos UNION SELECT filename FROM blobs
+               UNION SELECT filename FROM upload_sessions"""
+        )}
+        # A duplicate upload can use another video's derived files after that video is gone
+        derived_ids = set()
+        for row in conn.execute("SELECT id, hls_playlist_url, audio_url, audio_filename FROM videos"):
+            derived_ids.add(row["id"])
+            derived_ids.update(artifact_owners(row))
+    finally:
+        conn.close()
+
+    cutoff = time.time() - ORPHAN_MIN_AGE_SECONDS
+    orphans = []
+    if is_r2_configured():
+        for object_name, last_modified in list_files_in_r2(UPLOAD_NAME_PREFIX):
+            if object_name not in filenames and last_modified.timestamp() < cutoff:
+                orphans.append(("r2_object", object_name))
+        for prefix in list_folders_in_r2(DERIVED_PREFIX):
+            video_id = prefix[len(DERIVED_PREFIX):].rstrip("/")
+            if video_id.isdigit() and int(video_id) not in derived_ids:
+                orphans.append(("r2_prefix", prefix))
+    if os.path.isdir(UPLOADS_DIR):
+        for entry in os.scandir(UPLOADS_DIR):
+            if (entry.is_file() and entry.name.startswith(UPLOAD_NAME_PREFIX)
+                    and entry.name not in filenames and entry.stat().st_mtime < cutoff):
+                orphans.append(("local_file", entry.path))
+    if os.path.isdir(HLS_PLAYLIST_DIR):
+        for entry in os.scandir(HLS_PLAYLIST_DIR):
+            if entry.is_dir() and entry.name.isdigit() and int(entry.name) not in derived_ids:
+                orphans.append(("local_dir", entry.path))
+    return orphans
+
+
+def artifact_owners(video) -> set:
+    """Ids of the videos whose derived storage this video's HLS output and audio rendition live in."""
+    owners = set()
+    for value in (video["hls_playlist_url"], video["audio_url"], video["audio_filename"]):
+        match = ARTIFACT_ID_PATTERN.search(value or "")
+        if match:
+            owners.add(int(match.group(1)))
+    return owners
+
+
+def shared_artifact_owners(conn, video) -> set:
+    """
+    Ids of derived storage still needed by another video. Outputs are only
+    reused between uploads with the same content (see _reuse_duplicate_outputs),
+    so only videos holding a reference to the same blob are checked.
+    """
+    owners = set()
+    for other in conn.execute(
+        """SELECT id, hls_playlist_url, audio_url, audio_filename FROM videos
+           WHERE content_hash = ? AND id != ?""",
+        (video["content_hash"], video["id"])
+    ):
+        owners.add(other["id"])
+        owners.update(artifact_owners(other))
+    return owners
+
+
+def _release_video(video_id: int):
+    """
+    Drops a tombstoned video's row and queues the files only it used, in one
+    transaction, so a file is never both released and still referenced.
+    """
+    conn = get_db_connection()
+    try:
+        video = conn.execute(
+            """SELECT id, filename, content_hash, hls_playlist_url, audio_url, audio_filename
+               FROM videos WHERE id = ? AND deleted_at IS NOT NULL""",
+            (video_id,)
+        ).fetchone()
+        if not video:
+            return
+        files = []
+        # Its own derived storage, plus that of a deleted video it reused outputs from
+        owners = {video_id} | artifact_owners(video)
+        # An upload shared by identical videos is only removed with its last reference,
+        # and while other references remain, so might the outputs they reuse
+        if not video["content_hash"] or release_blob(conn, video["content_hash"]):
+            if is_r2_configured():
+                files.append(("r2_object", video["filename"]))
+            else:
+                files.append(("local_file", os.path.join(UPLOADS_DIR, video["filename"])))
+        else:
+            owners -= shared_artifact_owners(conn, video)
+        for owner in sorted(owners):
+            if is_r2_configured():
+                files.append(("r2_prefix", f"{DERIVED_PREFIX}{owner}/"))
+            files.append(("local_dir", os.path.join(HLS_PLAYLIST_DIR, str(owner))))
+        _insert_deletions(conn, files)
+        # Notes, prosody and other per-video rows are deleted by CASCADE
+        conn.execute("DELETE FROM videos WHERE id = ?", (video_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _queue_deletions(files: list) -> int:
+    conn = get_db_connection()
+    try:
+        queued = _insert_deletions(conn, files)
+        conn.commit()
+    finally:
+        conn.close()
+    return queued
+
+
+def _insert_deletions(conn, files: list) -> int:
+    before = conn.total_changes
+    conn.executemany("INSERT OR IGNORE INTO storage_deletions (kind, path) VALUES (?, ?)", files)
+    return conn.total_changes - before
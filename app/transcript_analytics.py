@@ -0,0 +1,234 @@
+import json
+import re
+from collections import Counter
+from .database import get_db_connection
+
+# Single-word fillers are looked up directly in the term index; multi-word
+# fillers are matched as consecutive positions.
+FILLER_WORDS = ["um", "umm", "uh", "uhm", "uhh", "er", "erm", "ah", "ahh", "hmm", "like", "basically", "actually", "literally"]
+FILLER_PHRASES = ["you know", "i mean", "kind of", "sort of"]
+MIN_REPEATED_PHRASE_WORDS = 3
+MAX_REPEATED_PHRASES = 10
+# find_phrase joins the term index once per word, and SQLite allows at most 64 tables in a join
+MAX_PHRASE_TERMS = 16
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens; a token's index in the list is its offset in the index."""
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def analyze_transcript(text: str, duration_seconds: float = None) -> dict:
+    """Computes word count, speaking rate, filler counts and repeated phrases."""
+    tokens = tokenize(text)
+    term_counts = Counter(tokens)
+    filler_counts = {word: term_counts[word] for word in FILLER_WORDS if term_counts[word]}
+    for phrase in FILLER_PHRASES:
+        count = _count_phrase(tokens, phrase.split())
+        if count:
+            filler_counts[phrase] = count
+
+    filler_total = sum(filler_counts.values())
+    word_count = len(tokens)
+    return {
+        "word_count": word_count,
+        "words_per_minute": round(word_count / (duration_seconds / 60), 1) if duration_seconds else None,
+        "filler_count": filler_total,
+        "fillers_per_100_words": round(filler_total * 100 / word_count, 1) if word_count else 0,
+        "filler_counts": dict(sorted(filler_counts.items(), key=lambda item: -item[1])),
+        "repeated_phrases": _repeated_phrases(tokens),
+    }
+
+
+def index_transcript(video_id: int, text: str) -> dict:
+    """
+    Replaces the video's postings in transcript_terms and its row in
+    transcript_stats. Called whenever a transcript is saved.
+    """
+    conn = get_db_connection()
+    try:
+        video = conn.execute("SELECT duration_seconds FROM videos WHERE id = ?", (video_id,)).fetchone()
+        if not video:
+            return None
+        stats = analyze_transcript(text, video["duration_seconds"])
+        conn.execute("DELETE FROM transcript_terms WHERE video_id = ?", (video_id,))
+        conn.executemany(
+            "INSERT INTO transcript_terms (term, video_id, position) VALUES (?, ?, ?)",
+            ((term, video_id, position) for position, term in enumerate(tokenize(text)))
+        )
+        conn.execute(
+            """INSERT OR REPLACE INTO transcript_stats
+               (video_id, word_count, words_per_minute, filler_count, filler_counts, repeated_phrases, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+            (
+                video_id, stats["word_count"], stats["words_per_minute"], stats["filler_count"],
+                json.dumps(stats["filler_counts"]), json.dumps(stats["repeated_phrases"]),
+            )
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return stats
+
+
+def update_speaking_rate(conn, video_id: int, duration_seconds: float):
+    """
+    Recomputes words per minute for a new duration, in the caller's
+    transaction. A transcript can be indexed before transcoding has
+    measured the duration, which would otherwise leave the rate empty.
+    """
+    row = conn.execute("SELECT word_count FROM transcript_stats WHERE video_id = ?", (video_id,)).fetchone()
+    if not row:
+        return
+    words_per_minute = round(row["word_count"] / (duration_seconds / 60), 1) if duration_seconds else None
+    conn.execute(
+        "UPDATE transcript_stats SET words_per_minute = ?, updated_at = CURRENT_TIMESTAMP WHERE video_id = ?",
+        (words_per_minute, video_id)
+    )
+
+
+def get_transcript_stats(video_id: int) -> dict:
+    conn = get_db_connection()
+    try:
+        row = conn.execute("""SELECT s.* FROM transcript_stats s JOIN videos v ON v.id = s.video_id AND v.deleted_at IS NULL
+               WHERE s.video_id = ?""", (video_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    return {
+        "video_id": row["video_id"],
+        "word_count": row["word_count"],
+        "words_per_minute": row["words_per_minute"],
+        "filler_count": row["filler_count"],
+        "fillers_per_100_words": round(row["filler_count"] * 100 / row["word_count"], 1) if row["word_count"] else 0,
+        "filler_counts": json.loads(row["filler_counts"]),
+        "repeated_phrases": json.loads(row["repeated_phrases"]),
+        "updated_at": row["updated_at"],
+    }
+
+
+def find_phrase(phrase: str, limit: int = 50) -> list:
+    """
+    Looks up a word or phrase across all transcripts through the term index.
+    Phrases are matched as consecutive positions. Returns per-video counts
+    and the word offsets where each match starts. Raises ValueError for
+    phrases longer than MAX_PHRASE_TERMS words.
+    """
+    terms = tokenize(phrase)
+    if not terms:
+        return []
+    if len(terms) > MAX_PHRASE_TERMS:
+        raise ValueError(f"Phrases can have at most {MAX_PHRASE_TERMS} words.")
+    joins = "".join(
+        f" JOIN transcript_terms t{i} ON t{i}.video_id = t0.video_id AND t{i}.position = t0.position + {i}"
+        f" AND t{i}.term = ?"
+        for i in range(1, len(terms))
+    )
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            f"""SELECT t0.video_id, v.original_filename, group_concat(t0.position) AS positions
+                FROM transcript_terms t0{joins}
+                JOIN videos v ON v.id = t0.video_id
+                WHERE t0.term = ? AND v.deleted_at IS NULL
+                GROUP BY t0.video_id
+                ORDER BY COUNT(*) DESC, t0.video_id DESC
+                LIMIT ?""",
+            (*terms[1:], terms[0], limit)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    results = []
+    for row in rows:
+        positions = sorted(int(position) for position in row["positions"].split(","))
+        results.append({
+            "video_id": row["video_id"],
+            "original_filename": row["original_filename"],
+            "count": len(positions),
+            "positions": positions,
+        })
+    return results
+
+
+def filler_summary() -> dict:
+    """Filler totals across every indexed transcript, read from the term index."""
+    placeholders = ", ".join("?" for _ in FILLER_WORDS)
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            f"""SELECT term, COUNT(*) AS count, COUNT(DISTINCT video_id) AS videos
+                FROM transcript_terms WHERE term IN ({placeholders})
+                GROUP BY term""",
+            FILLER_WORDS
+        ).fetchall()
+        totals = conn.execute(
+            "SELECT COUNT(*) AS videos, COALESCE(SUM(word_count), 0) AS words FROM transcript_stats"
+        ).fetchone()
+    finally:
+        conn.close()
+
+    fillers = {row["term"]: {"count": row["count"], "videos": row["videos"]} for row in rows}
+    for phrase in FILLER_PHRASES:
+        matches = find_phrase(phrase, limit=-1)
+        if matches:
+            fillers[phrase] = {"count": sum(match["count"] for match in matches), "videos": len(matches)}
+    return {
+        "videos": totals["videos"],
+        "words": totals["words"],
+        "fillers": dict(sorted(fillers.items(), key=lambda item: -item[1]["count"])),
+    }
+
+
+def reindex_all():
+    """Rebuilds the index for every saved transcript, e.g. after changing the filler lists."""
+    conn = get_db_connection()
+    try:
+        videos = conn.execute("SELECT id, transcript FROM videos WHERE transcript IS NOT NULL").fetchall()
+    finally:
+        conn.close()
+    for video in videos:
+        index_transcript(video["id"], video["transcript"])
+    print(f"Indexed {len(videos)} transcripts.")
+
+
+def _count_phrase(tokens: list, words: list) -> int:
+    size = len(words)
+    return sum(1 for i in range(len(tokens) - size + 1) if tokens[i:i + size] == words)
+
+
+def _repeated_phrases(tokens: list) -> list:
+    """
+    Word sequences said more than once. Overlapping repeated trigrams are
+    merged into the longest phrase they form, so a repeated sentence is
+    reported once rather than as each of its fragments.
+    """
+    size = MIN_REPEATED_PHRASE_WORDS
+    ngram_counts = Counter(tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1))
+    repeated = [ngram_counts[tuple(tokens[i:i + size])] > 1 for i in range(len(tokens) - size + 1)]
+
+    phrases = {}
+    i = 0
+    while i < len(repeated):
+        if not repeated[i]:
+            i += 1
+            continue
+        run_start = i
+        while i < len(repeated) and repeated[i]:
+            i += 1
+        words = tokens[run_start:i - 1 + size]
+        phrase = " ".join(words)
+        if phrase not in phrases:
+            count = _count_phrase(tokens, words)
+            if count > 1:
+                phrases[phrase] = count
+
+    ranked = sorted(phrases.items(), key=lambda item: (-item[1], -len(item[0])))
+    return [{"phrase": phrase, "count": count} for phrase, count in ranked[:MAX_REPEATED_PHRASES]]
+
+
+if __name__ == "__main__":
+    reindex_all()
@@ -1,38 +1,190 @@
+import hashlib
+import hmac
+import importlib.util
+import threading
 import assemblyai as aai
+from assemblyai import api as aai_api
 from decouple import config
 
+# Which speech-to-text engine this deployment uses: "assemblyai" or "whisper"
+TRANSCRIPTION_BACKEND = config("TRANSCRIPTION_BACKEND", default="assemblyai")
+
 ASSEMBLYAI_API_KEY = config("ASSEMBLYAI_API_KEY", default=None)
+# Point at app.fake_transcription_server to test or benchmark without the real service
+ASSEMBLYAI_BASE_URL = config("ASSEMBLYAI_BASE_URL", default="https://api.assemblyai.com")
+ASSEMBLYAI_POLL_INTERVAL = config("ASSEMBLYAI_POLL_INTERVAL", default=3.0, cast=float)
 
-def is_transcription_configured():
-    """Check if the AssemblyAI API key is set."""
-    return ASSEMBLYAI_API_KEY is not None
+# With a secret set, backends that support it report completion to a webhook
+# instead of a worker thread waiting on the result.
+TRANSCRIPTION_WEBHOOK_SECRET = config("TRANSCRIPTION_WEBHOOK_SECRET", default=None)
+WEBHOOK_AUTH_HEADER = "X-Webhook-Signature"
+
+WHISPER_MODEL = config("WHISPER_MODEL", default="base.en")
+WHISPER_COMPUTE_TYPE = config("WHISPER_COMPUTE_TYPE", default="int8")
+WHISPER_CPU_THREADS = config("WHISPER_CPU_THREADS", default=0, cast=int)
+# Whisper tends to drop fillers unless the prompt already contains some;
+# the coaching analytics depend on them being transcribed.
+WHISPER_INITIAL_PROMPT = "Umm, let me think, like, hmm... Okay, so, uh, here's what I'm, you know, thinking."
+
+
+class TranscriptionBackend:
+    """
+    A speech-to-text engine. Remote backends fetch the media from a URL;
+    local backends read it from a file path.
+    """
+    name = None
+    remote = True
+    supports_webhooks = False
+
+    def is_configured(self) -> bool:
+        raise NotImplementedError
+
+    def transcribe(self, media: str) -> dict:
+        """
+        Transcribes the media. Returns {"text": ..., "words": [{"text", "start", "end"}, ...]}
+        with word times in milliseconds.
+        """
+        raise NotImplementedError
+
+    def submit(self, media: str, webhook_url: str, signature: str) -> str:
+        """Starts a transcription that reports to webhook_url when done. Returns the backend's transcript id."""
+        raise NotImplementedError
+
+    def fetch_result(self, transcript_id: str) -> dict:
+        """
+        Checks a submitted transcription once, without waiting. Returns
+        {"status": "queued" | "processing" | "completed" | "error", "text": ..., "words": ..., "error": ...}.
+        """
+        raise NotImplementedError
+
+
+class AssemblyAIBackend(TranscriptionBackend):
+    name = "assemblyai"
+    supports_webhooks = True
+
+    def is_configured(self) -> bool:
+        return ASSEMBLYAI_API_KEY is not None
+
+    def transcribe(self, media: str) -> dict:
+        self._configure()
+        transcript = aai.Transcriber().transcribe(media, config=self._transcription_config())
+
+        if transcript.status == aai.TranscriptStatus.error:
+            raise RuntimeError(f"Transcription failed: {transcript.error}")
+        return {"text": transcript.text, "words": _assemblyai_words(transcript.words)}
+
+    def submit(self, media: str, webhook_url: str, signature: str) -> str:
+        self._configure()
+        transcription_config = self._transcription_config()
+        transcription_config.set_webhook(webhook_url, WEBHOOK_AUTH_HEADER, signature)
+        transcript = aai.Transcriber().submit(media, config=transcription_config)
+
+        if transcript.status == aai.TranscriptStatus.error:
+            raise RuntimeError(f"Transcription failed: {transcript.error}")
+        return transcript.id
 
-def get_transcriber():
-    """Initialize and return an AssemblyAI transcriber."""
-    if not is_transcription_configured():
-        return None
-    aai.settings.api_key = ASSEMBLYAI_API_KEY
-    return aai.Transcriber()
+    def fetch_result(self, transcript_id: str) -> dict:
+        self._configure()
+        # A single GET; Transcript.get_by_id would block until the transcript completes
+        response = aai_api.get_transcript(aai.Client.get_default().http_client, transcript_id)
+        return {
+            "status": response.status.value,
+            "text": response.text,
+            "words": _assemblyai_words(response.words),
+            "error": response.error,
+        }
 
-def transcribe_and_poll(file_url: str) -> str:
+    def _configure(self):
+        if not self.is_configured():
+            raise ConnectionError("AssemblyAI client is not available or configured.")
+        aai.settings.api_key = ASSEMBLYAI_API_KEY
+        aai.settings.base_url = ASSEMBLYAI_BASE_URL
+        aai.settings.polling_interval = ASSEMBLYAI_POLL_INTERVAL
+
+    def _transcription_config(self):
+        return aai.TranscriptionConfig(
+            punctuate=True,
+            format_text=True,
+            speech_model=aai.SpeechModel.best,
+            disfluencies=True
+        )
+
+
+class WhisperBackend(TranscriptionBackend):
     """
-    Transcribes a file from a URL using AssemblyAI and polls for the result.
-    Returns the transcript text.
+    Local CPU transcription with faster-whisper, for offline and on-premise
+    deployments. Install it with `pip install faster-whisper`. The model is
+    loaded once per worker process and shared by its threads.
     """
-    transcriber = get_transcriber()
-    if not transcriber:
-        raise ConnectionError("AssemblyAI client is not available or configured.")
+    name = "whisper"
+    remote = False
+
+    def __init__(self):
+        self._model = None
+        self._lock = threading.Lock()
+
+    def is_configured(self) -> bool:
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    def transcribe(self, media: str) -> dict:
+        segments, _ = self._get_model().transcribe(
+            media, vad_filter=True, initial_prompt=WHISPER_INITIAL_PROMPT, word_timestamps=True
+        )
+        texts, words = [], []
+        for segment in segments:
+            texts.append(segment.text.strip())
+            words.extend(
+                {"text": word.word.strip(), "start": round(word.start * 1000), "end": round(word.end * 1000)}
+                for word in segment.words or []
+            )
+        return {"text": " ".join(texts), "words": words}
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from faster_whisper import WhisperModel
+                    from .jobs import QUEUE_THREADS
+                    self._model = WhisperModel(
+                        WHISPER_MODEL, device="cpu", compute_type=WHISPER_COMPUTE_TYPE,
+                        cpu_threads=WHISPER_CPU_THREADS, num_workers=QUEUE_THREADS["transcription"]
+                    )
+        return self._model
+
+
+def _assemblyai_words(words) -> list:
+    return [{"text": word.text, "start": word.start, "end": word.end} for word in words or []]
+
+
+BACKENDS = {backend.name: backend for backend in (AssemblyAIBackend, WhisperBackend)}
+_backend = None
+
+
+def get_transcription_backend() -> TranscriptionBackend:
+    """The backend selected by TRANSCRIPTION_BACKEND, created once per process."""
+    global _backend
+    if _backend is None:
+        if TRANSCRIPTION_BACKEND not in BACKENDS:
+            raise ValueError(f"TRANSCRIPTION_BACKEND must be one of: {', '.join(BACKENDS)}")
+        _backend = BACKENDS[TRANSCRIPTION_BACKEND]()
+    return _backend
+
+
+def is_transcription_configured():
+    """Check if the selected transcription backend can run."""
+    return get_transcription_backend().is_configured()
+
+
+def uses_webhooks() -> bool:
+    return TRANSCRIPTION_WEBHOOK_SECRET is not None and get_transcription_backend().supports_webhooks
 
-    config = aai.TranscriptionConfig(
-        punctuate=True,
-        format_text=True,
-        speech_model=aai.SpeechModel.best,
-        disfluences=True
-    )
 
-    transcript = transcriber.transcribe(file_url, config=config)
+def webhook_signature(video_id: int) -> str:
+    """Per-video webhook credential, so a leaked one can't complete other videos' transcriptions."""
+    return hmac.new(TRANSCRIPTION_WEBHOOK_SECRET.encode(), f"video:{video_id}".encode(), hashlib.sha256).hexdigest()
 
-    if transcript.status == aai.TranscriptStatus.error:
-        raise RuntimeError(f"Transcription failed: {transcript.error}")
 
-    return transcript.text
\ No newline at end of file
+def verify_webhook_signature(video_id: int, signature: str) -> bool:
+    if not TRANSCRIPTION_WEBHOOK_SECRET or not signature:
+        return False
+    return hmac.compare_digest(webhook_signature(video_id), signature)
@@ -0,0 +1,274 @@
+import hashlib
+import math
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from .blobs import CONTENT_HASH_CHUNK_SIZE, claim_blob, combine_digests
+from .database import get_db_connection, fetch_all
+from .jobs import enqueue_job
+from .r2 import (
+    is_r2_configured, create_multipart_upload, upload_part_to_r2,
+    complete_multipart_upload, abort_multipart_upload,
+    R2_MULTIPART_CHUNK_SIZE, R2_UPLOAD_CONCURRENCY
+)
+
+UPLOADS_DIR = "uploads"
+# Kept outside UPLOADS_DIR so partial uploads are never served by the static mount
+UPLOAD_PARTS_DIR = "upload_parts"
+# Unfinished sessions with no new part for this long are discarded, along
+# with their parts on disk or their R2 multipart upload
+UPLOAD_SESSION_TTL_SECONDS = config("UPLOAD_SESSION_TTL_SECONDS", default=86400, cast=int)
+UPLOAD_EXPIRY_SWEEP_SECONDS = 3600
+
+# Part uploads are forwarded to R2 (or disk) from this pool so they run
+# concurrently without blocking the event loop.
+part_executor = ThreadPoolExecutor(max_workers=R2_UPLOAD_CONCURRENCY, thread_name_prefix="upload-part")
+
+
+class UploadError(Exception):
+    """Raised when a resumable upload request is invalid."""
+
+
+def init_upload(original_filename: str, mime_type: str, file_size: int, db_filename: str) -> dict:
+    """Create a resumable upload session mapped onto an R2 multipart upload."""
+    session_id = os.urandom(16).hex()
+    part_size = R2_MULTIPART_CHUNK_SIZE
+    r2_upload_id = None
+    if is_r2_configured():
+        r2_upload_id = create_multipart_upload(db_filename, mime_type)
+    else:
+        os.makedirs(os.path.join(UPLOAD_PARTS_DIR, session_id), exist_ok=True)
+
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            """INSERT INTO upload_sessions
+               (id, filename, original_filename, mime_type, file_size, part_size, r2_upload_id)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (session_id, db_filename, original_filename, mime_type, file_size, part_size, r2_upload_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return get_upload(session_id)
+
+
+def get_upload(session_id: str) -> dict:
+    """Return an upload session with the part numbers acknowledged so far."""
+    conn = get_db_connection()
+    try:
+        session = conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (session_id,)).fetchone()
+        if not session:
+            return None
+        parts = conn.execute(
+            "SELECT part_number FROM upload_parts WHERE session_id = ? ORDER BY part_number",
+            (session_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        "upload_id": session["id"],
+        "filename": session["filename"],
+        "original_filename": session["original_filename"],
+        "mime_type": session["mime_type"],
+        "file_size": session["file_size"],
+        "part_size": session["part_size"],
+        "total_parts": max(1, math.ceil(session["file_size"] / session["part_size"])),
+        "uploaded_parts": [part["part_number"] for part in parts],
+        "status": session["status"],
+    }
+
+
+def part_size(session_id: str, part_number: int) -> int:
+    """The exact size of a part of an active session, so its body can be checked while it streams in."""
+    conn = get_db_connection()
+    try:
+        session = conn.execute(
+            "SELECT file_size, part_size, status FROM upload_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not session or session["status"] != "active":
+        raise UploadError("Upload session not found or no longer active.")
+
+    total_parts = max(1, math.ceil(session["file_size"] / session["part_size"]))
+    if not 1 <= part_number <= total_parts:
+        raise UploadError(f"Part number must be between 1 and {total_parts}.")
+    if part_number == total_parts:
+        return session["file_size"] - session["part_size"] * (total_parts - 1)
+    return session["part_size"]
+
+
+def store_part(session_id: str, part_number: int, data: bytes):
+    """Persist one part. Re-sending an acknowledged part overwrites it."""
+    expected_size = part_size(session_id, part_number)
+    if len(data) != expected_size:
+        raise UploadError(f"Part {part_number} must be {expected_size} bytes, got {len(data)}.")
+    conn = get_db_connection()
+    try:
+        session = conn.execute("SELECT filename, r2_upload_id FROM upload_sessions WHERE id = ?", (session_id,)).fetchone()
+    finally:
+        conn.close()
+
+    if session["r2_upload_id"]:
+        etag = upload_part_to_r2(session["filename"], session["r2_upload_id"], part_number, data)
+    else:
+        part_path = os.path.join(UPLOAD_PARTS_DIR, session_id, f"{part_number:05d}")
+        with open(part_path, "wb") as part_file:
+            part_file.write(data)
+        etag = None
+
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO upload_parts (session_id, part_number, etag, size, sha256) VALUES (?, ?, ?, ?, ?)",
+            (session_id, part_number, etag, len(data), hashlib.sha256(data).digest())
+        )
+        conn.execute("UPDATE upload_sessions SET last_part_at = CURRENT_TIMESTAMP WHERE id = ?", (session_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def complete_upload(session_id: str) -> dict:
+    """
+    Assemble all parts into the final object and close the session.
+    If the same content is already stored, the parts are discarded and the
+    returned upload points at the existing blob (blob_claimed is True).
+    """
+    upload = get_upload(session_id)
+    if not upload or upload["status"] != "active":
+        raise UploadError("Upload session not found or no longer active.")
+    missing = sorted(set(range(1, upload["total_parts"] + 1)) - set(upload["uploaded_parts"]))
+    if missing:
+        raise UploadError(f"Missing parts: {missing}")
+
+    conn = get_db_connection()
+    try:
+        # Claim the session so a repeated "complete" call can't assemble it twice
+        claimed = conn.execute(
+            "UPDATE upload_sessions SET status = 'completing' WHERE id = ? AND status = 'active'",
+            (session_id,)
+        ).rowcount
+        conn.commit()
+        if not claimed:
+            raise UploadError("Upload session is already being completed.")
+        session = conn.execute("SELECT r2_upload_id FROM upload_sessions WHERE id = ?", (session_id,)).fetchone()
+        parts = conn.execute(
+            "SELECT part_number, etag, sha256 FROM upload_parts WHERE session_id = ? ORDER BY part_number",
+            (session_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    # The part digests combine into the content hash without re-reading any data
+    upload["content_hash"] = None
+    if upload["part_size"] == CONTENT_HASH_CHUNK_SIZE and all(part["sha256"] for part in parts):
+        upload["content_hash"] = combine_digests([part["sha256"] for part in parts])
+    existing_filename = claim_blob(upload["content_hash"]) if upload["content_hash"] else None
+    upload["blob_claimed"] = existing_filename is not None
+    if existing_filename:
+        _discard_parts(session_id, upload["filename"], session["r2_upload_id"])
+        _close_session(session_id, "completed")
+        upload["filename"] = existing_filename
+        return upload
+
+    try:
+        if session["r2_upload_id"]:
+            complete_multipart_upload(
+                upload["filename"], session["r2_upload_id"],
+                [(part["part_number"], part["etag"]) for part in parts]
+            )
+        else:
+            parts_dir = os.path.join(UPLOAD_PARTS_DIR, session_id)
+            with open(os.path.join(UPLOADS_DIR, upload["filename"]), "wb") as output:
+                for part in parts:
+                    with open(os.path.join(parts_dir, f"{part['part_number']:05d}"), "rb") as part_file:
+                        shutil.copyfileobj(part_file, output)
+            shutil.rmtree(parts_dir, ignore_errors=True)
+    except Exception:
+        # Leave the session resumable so the client can retry completion
+        _set_status(session_id, "active")
+        raise
+
+    _close_session(session_id, "completed")
+    return upload
+
+
+def abort_upload(session_id: str):
+    """Discard an unfinished upload and its stored parts."""
+    upload = get_upload(session_id)
+    if not upload or upload["status"] != "active":
+        raise UploadError("Upload session not found or no longer active.")
+
+    conn = get_db_connection()
+    try:
+        session = conn.execute("SELECT r2_upload_id FROM upload_sessions WHERE id = ?", (session_id,)).fetchone()
+    finally:
+        conn.close()
+    _discard_parts(session_id, upload["filename"], session["r2_upload_id"])
+    _close_session(session_id, "aborted")
+
+
+def expire_upload_sessions():
+    """
+    Job queue task: discards sessions left active or completing for
+    UPLOAD_SESSION_TTL_SECONDS since their last part, then schedules the
+    next run. Their rows are deleted, so reconcile_storage can also reclaim
+    anything a crashed completion left behind.
+    """
+    try:
+        stale = fetch_all(
+            """SELECT id, filename, r2_upload_id FROM upload_sessions
+               WHERE status IN ('active', 'completing')
+               AND COALESCE(last_part_at, created_at) <= datetime('now', ?)""",
+            (f"-{UPLOAD_SESSION_TTL_SECONDS} seconds",)
+        )
+        expired = 0
+        for session in stale:
+            try:
+                _discard_parts(session["id"], session["filename"], session["r2_upload_id"])
+            except Exception as e:
+                print(f"Could not discard parts of upload session {session['id']}: {e}")
+                continue
+            conn = get_db_connection()
+            try:
+                # Parts go with the session by CASCADE
+                conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session["id"],))
+                conn.commit()
+            finally:
+                conn.close()
+            expired += 1
+        if stale:
+            print(f"Expired {expired} of {len(stale)} abandoned upload session(s).")
+    finally:
+        # The next run is the retry, so a failure never starts a second chain
+        enqueue_job("maintenance", expire_upload_sessions, delay=UPLOAD_EXPIRY_SWEEP_SECONDS, max_attempts=1)
+
+
+def _discard_parts(session_id: str, filename: str, r2_upload_id: str):
+    if r2_upload_id:
+        abort_multipart_upload(filename, r2_upload_id)
+    else:
+        shutil.rmtree(os.path.join(UPLOAD_PARTS_DIR, session_id), ignore_errors=True)
+
+
+def _set_status(session_id: str, status: str):
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE upload_sessions SET status = ? WHERE id = ?", (status, session_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _close_session(session_id: str, status: str):
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE upload_sessions SET status = ? WHERE id = ?", (status, session_id))
+        conn.execute("DELETE FROM upload_parts WHERE session_id = ?", (session_id,))
+        conn.commit()
+    finally:
+        conn.close()
@@ -1,106 +1,367 @@
 import os
+import shutil
+import threading
+import time
+from collections import deque
 import ffmpeg
-import tempfile
+from decouple import config
 
 HLS_PLAYLIST_DIR = "hls_playlists"
-PROCESSED_VIDEOS_DIR = "processed_videos"
+HLS_SEGMENT_SECONDS = 6
+PLAYABLE_POLL_SECONDS = 0.5
+# Minimum time between progress reports during an HLS run
+PROGRESS_REPORT_SECONDS = 1.0
 
-def preprocess_video(input_path: str, video_id: int):
+# Adaptive bitrate ladder, lowest first. Renditions taller than the source are skipped.
+HLS_LADDER = [
+    {"name": "240p", "height": 240, "video_bitrate": "400k", "max_rate": "450k", "buffer_size": "800k", "audio_bitrate": "64k"},
+    {"name": "480p", "height": 480, "video_bitrate": "1000k", "max_rate": "1100k", "buffer_size": "2000k", "audio_bitrate": "96k"},
+    {"name": "720p", "height": 720, "video_bitrate": "2500k", "max_rate": "2750k", "buffer_size": "5000k", "audio_bitrate": "128k"},
+]
+
+# --- Encoding Profiles ---
+# Profiles are described in encoder-neutral terms ("speed" and a CRF-like
+# "quality" where lower is better). ENCODER_SETTINGS maps them onto each
+# supported H.264 encoder. Measure changes with `python -m app.encoding_benchmark`.
+ENCODING_PROFILES = {
+    "fast-preview": {"speed": "fast", "quality": 28, "audio_bitrate": "96k"},
+    "balanced": {"speed": "medium", "quality": 23, "audio_bitrate": "128k"},
+    "archive": {"speed": "slow", "quality": 20, "audio_bitrate": "160k"},
+}
+ENCODER_SETTINGS = {
+    "libx264": {"quality_flag": "crf", "presets": {"fast": "veryfast", "medium": "medium", "slow": "slow"}},
+    "h264_nvenc": {"quality_flag": "cq", "presets": {"fast": "p2", "medium": "p4", "slow": "p6"}},
+    "h264_qsv": {"quality_flag": "global_quality", "presets": {"fast": "veryfast", "medium": "medium", "slow": "slow"}},
+}
+VIDEO_ENCODER = config("VIDEO_ENCODER", default="libx264")
+DEFAULT_ENCODING_PROFILE = config("ENCODING_PROFILE", default="fast-preview")
+
+
+def encoder_args(profile_name: str = DEFAULT_ENCODING_PROFILE, encoder: str = VIDEO_ENCODER) -> dict:
+    """Translates a named profile into ffmpeg video output arguments for an encoder."""
+    if profile_name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile: {profile_name}")
+    if encoder not in ENCODER_SETTINGS:
+        raise ValueError(f"Unsupported video encoder: {encoder}")
+    profile = ENCODING_PROFILES[profile_name]
+    settings = ENCODER_SETTINGS[encoder]
+    args = {"vcodec": encoder, "preset": settings["presets"][profile["speed"]]}
+    args[settings["quality_flag"]] = profile["quality"]
+    if encoder == "h264_nvenc":
+        args["rc"] = "vbr"
+    return args
+
+
+# Speech-tuned audio-only rendition for the audio and transcript pages
+AUDIO_RENDITION_FILENAME = "audio.m4a"
+AUDIO_RENDITION_BITRATE = "64k"
+
+
+def extract_audio(input_path: str, video_id: int) -> str:
     """
-    Standardizes a video to H.264/MP4, 720p, 30fps with two-pass encoding.
+    Writes a compact mono AAC rendition next to the HLS output and returns its path.
+    Only the audio stream is decoded. AAC in MP4 plays in every browser, which Opus does not.
     """
-    os.makedirs(PROCESSED_VIDEOS_DIR, exist_ok=True)
-    output_filename = f"{video_id}.mp4"
-    output_path = os.path.join(PROCESSED_VIDEOS_DIR, output_filename)
-    
-    pass_log_prefix = os.path.join(tempfile.gettempdir(), f"{video_id}_pass_log")
-
+    output_dir = os.path.join(HLS_PLAYLIST_DIR, str(video_id))
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, AUDIO_RENDITION_FILENAME)
     try:
-        # Probe video to check if it needs resizing/fps change
-        probe = ffmpeg.probe(input_path)
-        video_stream = next((s for s in probe['streams'] if s['codec_type'] == 'video'), None)
-        width = video_stream['width']
-        height = video_stream['height']
-        fps = eval(video_stream['r_frame_rate'])
-
-        vf_filters = []
-        if height > 720:
-            vf_filters.append('scale=-2:720')
-        if fps > 30:
-            vf_filters.append('fps=30')
-        
-        vf_filter_str = ",".join(vf_filters) if vf_filters else "null"
-
-        # Two-pass encoding
-        # Pass 1
-        (
-            ffmpeg
-            .input(input_path)
-            .output(
-                'pipe:', # Discard output
-                format='null',
-                vcodec='libx264',
-                vf=vf_filter_str,
-                pass_log=pass_log_prefix,
-                pass_=1,
-                an=None # Ignore audio for the first pass
-            )
-            .run(capture_stdout=True, capture_stderr=True)
-        )
-
-        # Pass 2
         (
             ffmpeg
             .input(input_path)
             .output(
                 output_path,
-                vcodec='libx264',
-                vf=vf_filter_str,
-                pass_log=pass_log_prefix,
-                pass_=2,
+                vn=None,
                 acodec='aac',
-                audio_bitrate='128k',
-                map_metadata=-1, # Strip metadata
-                **{'preset': 'medium', 'crf': 23}
+                audio_bitrate=AUDIO_RENDITION_BITRATE,
+                ac=1,
+                map_metadata=-1,
+                movflags='+faststart'
             )
+            .overwrite_output()
             .run(capture_stdout=True, capture_stderr=True)
         )
     except ffmpeg.Error as e:
-        print('FFmpeg Error:', e.stderr.decode())
+        print('FFmpeg Error during audio extraction:', e.stderr.decode())
         raise e
-    finally:
-        # Clean up pass log files
-        for f in [f"{pass_log_prefix}-0.log", f"{pass_log_prefix}-0.log.mbtree"]:
-            if os.path.exists(f):
-                os.remove(f)
-
     return output_path
 
-def transcode_to_hls(input_path: str, video_id: int):
+
+# --- Fast-Path Detection ---
+# Uploads already within these limits are only repackaged into HLS.
+REMUX_VIDEO_CODECS = {"h264"}
+REMUX_PIXEL_FORMATS = {"yuv420p", "yuvj420p"}
+REMUX_AUDIO_CODECS = {"aac"}
+REMUX_MAX_HEIGHT = 720
+REMUX_MAX_FPS = 30.5  # allow 29.97/30 with rounding noise
+
+
+def plan_processing(probe: dict) -> tuple:
+    """
+    Decides how much work an upload needs from its ffprobe output.
+    Returns (path, reason) where path is one of:
+      'remux' - copy both streams into HLS, no re-encoding
+      'audio' - copy the video stream, re-encode only the audio to AAC
+      'transcode' - full decode and ABR ladder encode
+    """
+    video_stream = next((s for s in probe['streams'] if s['codec_type'] == 'video'), None)
+    audio_stream = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
+    if video_stream is None:
+        raise ValueError("No video stream found")
+
+    codec = video_stream.get('codec_name')
+    height = int(video_stream.get('height') or 0)
+    fps = _frame_rate(video_stream)
+    if codec not in REMUX_VIDEO_CODECS:
+        return "transcode", f"video codec {codec} is not H.264"
+    if video_stream.get('pix_fmt') not in REMUX_PIXEL_FORMATS:
+        return "transcode", f"pixel format {video_stream.get('pix_fmt')} is not 8-bit 4:2:0"
+    if height > REMUX_MAX_HEIGHT:
+        return "transcode", f"{height}p is above {REMUX_MAX_HEIGHT}p"
+    if fps > REMUX_MAX_FPS:
+        return "transcode", f"{fps:.2f}fps is above 30fps"
+    if _rotation(video_stream):
+        # MPEG-TS segments drop the display matrix, so rotated phone clips must be re-encoded upright
+        return "transcode", f"video is rotated {_rotation(video_stream)} degrees"
+
+    video_summary = f"H.264 {height}p{round(fps)}"
+    if audio_stream is None:
+        return "remux", f"{video_summary} with no audio"
+    if audio_stream.get('codec_name') not in REMUX_AUDIO_CODECS:
+        return "audio", f"{video_summary} is compliant but audio is {audio_stream.get('codec_name')}"
+    return "remux", f"{video_summary} with AAC audio is already compliant"
+
+
+def transcode_to_hls(input_path: str, video_id: int, profile_name: str = DEFAULT_ENCODING_PROFILE,
+                     on_playable=None, on_progress=None) -> dict:
     """
-    Transcodes a preprocessed video file to HLS format.
+    Packages a video as HLS with a master.m3u8, doing as little work as possible.
+    Compliant uploads are remuxed (optionally re-encoding just the audio);
+    everything else goes through the ABR ladder.
+    Playlists are written in EVENT mode, so they are playable while ffmpeg runs.
+    on_playable(hls_url) is called as soon as the first segment exists, and
+    on_progress(percent) about once a second while ffmpeg runs.
+    Returns the playlist URL together with the path taken and why.
     """
     output_dir = os.path.join(HLS_PLAYLIST_DIR, str(video_id))
-    os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, "playlist.m3u8")
+    hls_url = f"/{output_dir}/master.m3u8".replace("\\", "/")
+    # Start clean so a retried job never mixes segments from an earlier attempt
+    _clear_hls_output(output_dir)
+    notify = (lambda: on_playable(hls_url)) if on_playable else None
 
-    try:
-        (
-            ffmpeg
-            .input(input_path)
-            .output(
-                output_file,
-                format='hls',
-                hls_time=10,
-                hls_list_size=0,
-                hls_segment_filename=os.path.join(output_dir, 'segment%03d.ts'),
-                vcodec='copy', # Use the already encoded video stream
-                acodec='copy'  # Use the already encoded audio stream
-            )
-            .run(capture_stdout=True, capture_stderr=True)
+    probe = ffmpeg.probe(input_path)
+    path, reason = plan_processing(probe)
+    print(f"Processing video_id {video_id} via '{path}': {reason}")
+    duration = float(probe.get('format', {}).get('duration') or 0) or None
+    progress = None
+    if on_progress and duration:
+        progress = lambda seconds: on_progress(min(100.0, seconds * 100 / duration))
+
+    if path == "transcode":
+        _transcode_ladder(input_path, output_dir, probe, profile_name, notify, progress)
+    else:
+        _remux_to_hls(input_path, output_dir, probe, path == "audio", notify, progress)
+
+    return {
+        "hls_url": hls_url,
+        "processing_path": path,
+        "processing_reason": reason,
+        "duration_seconds": duration,
+    }
+
+
+def _transcode_ladder(input_path: str, output_dir: str, probe: dict, profile_name: str, on_playable=None,
+                      on_progress=None):
+    """
+    Encodes an adaptive HLS ladder with a single ffmpeg run.
+    The input is decoded once, then split and scaled into each rendition.
+    Each rendition uses the profile's quality target, capped at the ladder's maxrate.
+    """
+    profile_args = encoder_args(profile_name)
+    video_stream = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+    audio_stream = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
+
+    # Never upscale, but always produce at least the smallest rendition
+    ladder = [r for r in HLS_LADDER if r['height'] <= int(video_stream['height'])] or HLS_LADDER[:1]
+    for rendition in ladder:
+        os.makedirs(os.path.join(output_dir, rendition['name']), exist_ok=True)
+
+    source = ffmpeg.input(input_path)
+    video = source.video
+    if _frame_rate(video_stream) > 30:
+        video = video.filter('fps', fps=30)
+    split = video.filter_multi_output('split', len(ladder))
+
+    streams = []
+    stream_map = []
+    rendition_args = {}
+    for i, rendition in enumerate(ladder):
+        streams.append(split[i].filter('scale', -2, rendition['height']))
+        rendition_args[f'b:v:{i}'] = rendition['video_bitrate']
+        rendition_args[f'maxrate:v:{i}'] = rendition['max_rate']
+        rendition_args[f'bufsize:v:{i}'] = rendition['buffer_size']
+        entry = f"v:{i}"
+        if audio_stream:
+            streams.append(source.audio)
+            rendition_args[f'b:a:{i}'] = rendition['audio_bitrate']
+            entry += f",a:{i}"
+        stream_map.append(f"{entry},name:{rendition['name']}")
+
+    _run_hls(ffmpeg.output(
+        *streams,
+        os.path.join(output_dir, '%v', 'playlist.m3u8'),
+        acodec='aac',
+        # Keyframes on segment boundaries keep renditions switchable
+        force_key_frames=f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        sc_threshold=0,
+        hls_segment_filename=os.path.join(output_dir, '%v', 'segment%03d.ts'),
+        master_pl_name='master.m3u8',
+        var_stream_map=" ".join(stream_map),
+        **profile_args,
+        **rendition_args,
+        **_hls_args()
+    ), output_dir, on_playable, on_progress)
+
+
+def _remux_to_hls(input_path: str, output_dir: str, probe: dict, reencode_audio: bool, on_playable=None,
+                  on_progress=None):
+    """
+    Segments the original video stream into a single HLS rendition without re-encoding it.
+    Segments can only be cut on the source's keyframes, so their length may vary.
+    """
+    video_stream = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+    audio_stream = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
+    rendition_dir = os.path.join(output_dir, "source")
+    os.makedirs(rendition_dir, exist_ok=True)
+
+    # ffmpeg only writes a master playlist for var_stream_map output, so write
+    # the single-variant master ourselves to keep every video's layout the same.
+    bandwidth = int(probe.get('format', {}).get('bit_rate') or 0) or 2500000
+    with open(os.path.join(output_dir, 'master.m3u8'), 'w') as master:
+        master.write(
+            "#EXTM3U\n#EXT-X-VERSION:3\n"
+            f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},"
+            f"RESOLUTION={video_stream['width']}x{video_stream['height']}\n"
+            "source/playlist.m3u8\n"
         )
-    except ffmpeg.Error as e:
-        print('FFmpeg Error during HLS transcoding:', e.stderr.decode())
-        raise e
 
-    return f"/{output_dir}/playlist.m3u8".replace("\\", "/")
\ No newline at end of file
+    source = ffmpeg.input(input_path)
+    streams = [source.video] + ([source.audio] if audio_stream else [])
+    audio_args = {'acodec': 'aac', 'audio_bitrate': '128k'} if reencode_audio else {'acodec': 'copy'}
+    _run_hls(ffmpeg.output(
+        *streams,
+        os.path.join(rendition_dir, 'playlist.m3u8'),
+        vcodec='copy',
+        hls_segment_filename=os.path.join(rendition_dir, 'segment%03d.ts'),
+        **audio_args,
+        **_hls_args()
+    ), output_dir, on_playable, on_progress)
+
+
+def _clear_hls_output(output_dir: str):
+    """Removes playlists and segments but keeps other derived files such as the audio rendition."""
+    os.makedirs(output_dir, exist_ok=True)
+    for entry in os.listdir(output_dir):
+        path = os.path.join(output_dir, entry)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif entry.endswith('.m3u8'):
+            os.remove(path)
+
+
+def _hls_args() -> dict:
+    return {
+        'format': 'hls',
+        'hls_time': HLS_SEGMENT_SECONDS,
+        'hls_list_size': 0,
+        # EVENT playlists can be played while segments are still being appended
+        'hls_playlist_type': 'event',
+        'hls_flags': 'independent_segments',
+        'map_metadata': -1,
+    }
+
+
+def _run_hls(output, output_dir: str, on_playable=None, on_progress=None):
+    """
+    Runs ffmpeg for HLS output. While it runs, watches output_dir and calls
+    on_playable() once, as soon as the master playlist and a first segment exist.
+    on_progress(seconds) receives how much of the input has been written,
+    read from ffmpeg's -progress output.
+    """
+    global_args = ['-nostats'] + (['-progress', 'pipe:1'] if on_progress else [])
+    process = output.global_args(*global_args).run_async(pipe_stdout=bool(on_progress), pipe_stderr=True)
+    # Drain stderr on a thread so a chatty ffmpeg can't fill the pipe and stall
+    stderr_tail = deque(maxlen=100)
+    reader = threading.Thread(target=lambda: stderr_tail.extend(process.stderr), daemon=True)
+    reader.start()
+    progress_reader = None
+    if on_progress:
+        progress_reader = threading.Thread(target=_read_progress, args=(process.stdout, on_progress), daemon=True)
+        progress_reader.start()
+
+    while process.poll() is None:
+        if on_playable and _is_playable(output_dir):
+            on_playable()
+            on_playable = None
+        time.sleep(PLAYABLE_POLL_SECONDS)
+    reader.join()
+    if progress_reader:
+        progress_reader.join()
+
+    if process.returncode != 0:
+        stderr = b"".join(stderr_tail)
+        print('FFmpeg Error during HLS transcoding:', stderr.decode(errors='replace'))
+        raise ffmpeg.Error('ffmpeg', None, stderr)
+    if on_playable:
+        # Short clips can finish before the first check
+        on_playable()
+
+
+def _read_progress(stdout, on_progress):
+    """
+    Parses ffmpeg's -progress key=value blocks. out_time_us is the position
+    written so far; out_time_ms is the same value on older ffmpeg versions.
+    """
+    last_report = 0.0
+    for line in stdout:
+        key, _, value = line.decode(errors='replace').strip().partition('=')
+        if key not in ('out_time_us', 'out_time_ms') or not value.isdigit():
+            continue
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_REPORT_SECONDS:
+            last_report = now
+            try:
+                on_progress(int(value) / 1_000_000)
+            except Exception as e:
+                print(f"Progress callback failed: {e}")
+
+
+def _is_playable(output_dir: str) -> bool:
+    """True once the master playlist exists and its first variant lists a segment."""
+    master_path = os.path.join(output_dir, 'master.m3u8')
+    if not os.path.exists(master_path):
+        return False
+    with open(master_path) as master:
+        variants = [line.strip() for line in master if line.strip() and not line.startswith('#')]
+    if not variants:
+        return False
+    variant_path = os.path.join(output_dir, variants[0])
+    if not os.path.exists(variant_path):
+        return False
+    with open(variant_path) as playlist:
+        return '#EXTINF' in playlist.read()
+
+
+def _rotation(stream: dict) -> int:
+    """Returns the display rotation from ffprobe side data or the legacy rotate tag."""
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return int(side_data['rotation']) % 360
+    return int(stream.get('tags', {}).get('rotate', 0)) % 360
+
+
+def _frame_rate(stream: dict) -> float:
+    """Parses an ffprobe rate such as '30000/1001'."""
+    numerator, _, denominator = stream.get('r_frame_rate', '0/1').partition('/')
+    denominator = float(denominator or 1)
+    return float(numerator) / denominator if denominator else 0.0
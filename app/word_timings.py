@@ -0,0 +1,88 @@
+import json
+import numpy as np
+from .database import get_db_connection
+
+# Words are stored per video in columnar form: start and end times as int32
+# milliseconds, and each word as an index into the video's distinct tokens.
+# An hour-long talk (~9,000 words) takes about 110 KB.
+WORD_SLICE_MS = 120_000
+MAX_WORD_SLICE_MS = 600_000
+
+
+def save_words(conn, video_id: int, words: list):
+    """
+    Stores [{"text", "start", "end"}, ...] (milliseconds) in the caller's
+    transaction, replacing any earlier timings for the video.
+    """
+    words = sorted((word for word in words if word.get("text")), key=lambda word: word["start"])
+    tokens = list(dict.fromkeys(word["text"] for word in words))
+    token_index = {token: index for index, token in enumerate(tokens)}
+    starts = np.array([word["start"] for word in words], dtype='<i4')
+    ends = np.array([word["end"] for word in words], dtype='<i4')
+    # Ends must be sorted too for the binary search, so an end before its own
+    # start or before an earlier word's end is carried forward
+    ends = np.maximum.accumulate(np.maximum(ends, starts)) if len(ends) else ends
+    conn.execute(
+        """INSERT OR REPLACE INTO transcript_words (video_id, word_count, starts, ends, token_ids, tokens)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (
+            video_id, len(words),
+            starts.tobytes(),
+            ends.tobytes(),
+            np.array([token_index[word["text"]] for word in words], dtype='<u4').tobytes(),
+            json.dumps(tokens),
+        )
+    )
+
+
+def copy_words_from_duplicate(conn, video_id: int) -> bool:
+    """Copies word timings from another upload with the same content, in the caller's transaction."""
+    return conn.execute(
+        """INSERT OR REPLACE INTO transcript_words (video_id, word_count, starts, ends, token_ids, tokens)
+           SELECT v.id, w.word_count, w.starts, w.ends, w.token_ids, w.tokens
+           FROM videos v
+           JOIN videos s ON s.content_hash = v.content_hash AND s.id != v.id
+           JOIN transcript_words w ON w.video_id = s.id
+           WHERE v.id = ? LIMIT 1""",
+        (video_id,)
+    ).rowcount > 0
+
+
+def load_words(video_id: int) -> dict:
+    """Returns the stored arrays as NumPy arrays, or None if there are no word timings or the video is deleted."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute("""SELECT w.* FROM transcript_words w JOIN videos v ON v.id = w.video_id AND v.deleted_at IS NULL
+               WHERE w.video_id = ?""", (video_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    return {
+        "starts": np.frombuffer(row["starts"], dtype='<i4'),
+        "ends": np.frombuffer(row["ends"], dtype='<i4'),
+        "token_ids": np.frombuffer(row["token_ids"], dtype='<u4'),
+        "tokens": json.loads(row["tokens"]),
+    }
+
+
+def word_slice(words: dict, start_ms: int, end_ms: int) -> dict:
+    """
+    The words overlapping [start_ms, end_ms), located by binary search.
+    Starts and ends are both stored sorted, so the range runs from the first
+    word ending after start_ms to the last one starting before end_ms.
+    """
+    first = int(np.searchsorted(words["ends"], start_ms, side="right"))
+    last = int(np.searchsorted(words["starts"], end_ms, side="left"))
+    last = max(first, last)
+    tokens = words["tokens"]
+    return {
+        "start_ms": start_ms,
+        "end_ms": end_ms,
+        "first_index": first,
+        "total": len(words["starts"]),
+        "words": [tokens[token_id] for token_id in words["token_ids"][first:last].tolist()],
+        "starts": words["starts"][first:last].tolist(),
+        "ends": words["ends"][first:last].tolist(),
+    }
+